@@ -0,0 +1,93 @@
+"""AI任务工作进程
+
+从 ai_jobs 队列中按优先级领取章节的摘要、翻译和图表生成任务并执行，与Web服务分开部署，
+生成再多也不占用Web工作线程:
+
+    cd backend
+    python ai_worker.py                                  # AI_WORKER_PROCESSES 个进程 × AI_WORKER_THREADS 个线程
+    python ai_worker.py --processes 4 --threads 16 --config production
+
+- 每个进程运行一个 AIWorker（见 app/services/ai_job_service.py），同时执行的任务数为 进程数 × 线程数。
+- 阅读器请求的任务（interactive）先于批量任务（bulk）执行，同一优先级按排队顺序执行。
+- 工作进程异常退出时主进程重新启动它；它未完成的任务在租约（AI_JOB_LEASE）过期后重新排队。
+- SIGTERM / Ctrl+C：不再领取新任务，等待执行中的任务完成（最多 --grace 秒）后退出。
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from config import config
+
+def _run_worker(config_name, threads, stop, log_level):
+    # 由主进程统一处理 Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from app import create_app
+    from app.services.ai_job_service import AIWorker
+
+    app = create_app(config_name)
+    app.logger.setLevel(log_level)
+    worker = AIWorker(app, threads).start()
+    app.logger.warning(f"AI worker {worker.name} started with {threads} threads")
+    stop.wait()
+    worker.stop()
+    app.extensions['progress_buffer'].stop()
+    app.extensions['db_pool'].close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Run AI job worker processes')
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG') or 'default')
+    parser.add_argument('--processes', type=int, help='number of worker processes (default: AI_WORKER_PROCESSES)')
+    parser.add_argument('--threads', type=int, help='concurrent jobs per process (default: AI_WORKER_THREADS)')
+    parser.add_argument('--grace', type=float, default=60, help='seconds to wait for running jobs on shutdown')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    settings = config[args.config]
+    processes = max(1, args.processes or getattr(settings, 'AI_WORKER_PROCESSES', 2))
+    threads = max(1, args.threads or getattr(settings, 'AI_WORKER_THREADS', 8))
+    log_level = getattr(logging, args.log_level.upper(), logging.INFO)
+
+    # spawn 启动的进程不继承主进程的连接和线程
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+
+    def start():
+        process = context.Process(target=_run_worker, args=(args.config, threads, stop, log_level), daemon=False)
+        process.start()
+        return process
+
+    # 信号处理函数中不能直接设置 stop：主线程正在 stop 上等待时 multiprocessing.Event.set 会死锁
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    workers = [start() for _ in range(processes)]
+    print(f"Started {processes} AI worker processes x {threads} threads ({args.config} config)")
+    while not stopping.wait(1):
+        for i, process in enumerate(workers):
+            if not process.is_alive():
+                print(f"AI worker process {process.pid} exited with code {process.exitcode}, restarting")
+                workers[i] = start()
+
+    stop.set()
+    print("Stopping AI workers, waiting for running jobs...")
+    deadline = time.monotonic() + args.grace
+    for process in workers:
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            # 未完成的任务在租约过期后由其他工作进程重新执行
+            process.kill()
+            process.join()
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,21 @@ def create_app(config_name='default'):
     from app.models import init_db
     init_db(app)
     
+    # 调用AI接口的HTTP连接池
+    from app.services.ai_service import create_http_session
+    app.extensions['http_session'] = create_http_session(app.config)
+    
+    # 请求计时和 /metrics（先于压缩注册，计时包含压缩耗时），按需的采样分析
+    from app.utils.metrics import init_metrics
+    from app.utils.profiler import init_profiling
+    if app.config.get('METRICS_ENABLED', True):
+        init_metrics(app)
+    init_profiling(app)
+    
+    # 动态响应压缩
+    from app.utils.http_compression import init_compression
+    init_compression(app)
+    
     # 注册路由
     from app.routes.book_routes import book_bp
     from app.routes.ai_routes import ai_bp
@@ -75,4 +90,17 @@ def create_app(config_name='default'):
             "message": str(e)
         }), 500
     
-    return app 
\ No newline at end of file
+    return app 
+
+def prepare_fork(app):
+    """预加载应用的多进程服务器在 fork 工作进程之前调用，关闭父进程持有的连接"""
+    from app.models import close_db_before_fork
+    close_db_before_fork(app)
+    app.extensions['http_session'].close()
+
+def init_worker(app):
+    """在 fork 出的工作进程中重新创建数据库连接池、写后缓冲和HTTP连接池"""
+    from app.models import reinit_db_after_fork
+    from app.services.ai_service import create_http_session
+    reinit_db_after_fork(app)
+    app.extensions['http_session'] = create_http_session(app.config)
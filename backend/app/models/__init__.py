@@ -1,80 +1,85 @@
-import pymysql
 from flask import g, current_app
+from app.models.pool import ConnectionPool
+from app.models.backends import create_backend
+from app.models.migrations import migrate
+from app.models.cache import configure_caches
+from app.models.write_behind import WriteBehindBuffer
+from app.models.instrumentation import instrument
+
+def create_pool(app, backend):
+    """按配置为应用创建数据库连接池"""
+    config = app.config
+    # 开启指标时每条语句都记录耗时
+    connect = instrument(backend.connect) if config.get('METRICS_ENABLED', True) else backend.connect
+    return ConnectionPool(
+        connect,
+        min_size=config.get('DB_POOL_MIN_SIZE', 1),
+        max_size=config.get('DB_POOL_MAX_SIZE', 10),
+        timeout=config.get('DB_POOL_TIMEOUT', 10),
+        max_lifetime=config.get('DB_POOL_MAX_LIFETIME', 3600),
+        idle_timeout=config.get('DB_POOL_IDLE_TIMEOUT', 300),
+        ping_interval=config.get('DB_POOL_PING_INTERVAL', 5)
+    )
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+def get_backend():
+    return current_app.extensions['db_backend']
 
 def get_db():
     if 'db' not in g:
-        g.db = pymysql.connect(
-            host=current_app.config['DB_HOST'],
-            user=current_app.config['DB_USER'],
-            password=current_app.config['DB_PASSWORD'],
-            database=current_app.config['DB_NAME'],
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS,
-            max_allowed_packet=67108864  # 64MB
-        )
+        g.db = get_pool().acquire()
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+def create_progress_buffer(app):
+    """创建阅读进度的写后缓冲，后台线程在应用上下文中批量写入"""
+    from app.models.book import Book
+    
+    def flush(updates):
+        with app.app_context():
+            Book.update_reading_progress(updates)
+    
+    def merge(old, new):
+        # 新的更新没有带章节时保留之前记录的章节
+        return (new[0], new[1] if new[1] is not None else old[1])
+    
+    return WriteBehindBuffer(
+        flush,
+        interval=app.config.get('PROGRESS_FLUSH_INTERVAL', 5),
+        max_pending=app.config.get('PROGRESS_FLUSH_MAX_PENDING', 500),
+        merge=merge,
+        name='reading-progress',
+        max_retries=app.config.get('PROGRESS_FLUSH_MAX_RETRIES', 3)
+    )
+
+def reinit_db_after_fork(app):
+    """在 fork 出的工作进程中重建连接池和写后缓冲
+    
+    父进程中的连接（socket）和后台线程不能在子进程中继续使用，
+    父进程应在 fork 之前调用 close_db_before_fork 关闭它们。
+    """
+    app.extensions['db_pool'] = create_pool(app, app.extensions['db_backend'])
+    app.extensions['progress_buffer'] = create_progress_buffer(app)
+
+def close_db_before_fork(app):
+    """fork 之前写入缓冲中的更新并关闭父进程的所有连接"""
+    app.extensions['progress_buffer'].stop()
+    app.extensions['db_pool'].close()
 
 def init_db(app):
+    backend = create_backend(app.config)
+    app.extensions['db_backend'] = backend
+    app.extensions['db_pool'] = create_pool(app, backend)
     app.teardown_appcontext(close_db)
+    configure_caches(app.config)
+    app.extensions['progress_buffer'] = create_progress_buffer(app)
     
-    # 创建必要的表
+    # 检查数据库结构版本，只执行尚未执行的迁移
     with app.app_context():
-        db = get_db()
-        cursor = db.cursor()
-        
-        # 删除并重新创建books表
-        cursor.execute('DROP TABLE IF EXISTS bookmarks')
-        cursor.execute('DROP TABLE IF EXISTS chapters')
-        cursor.execute('DROP TABLE IF EXISTS books')
-        
-        # 创建books表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            author VARCHAR(255),
-            cover_path VARCHAR(255),
-            file_path VARCHAR(255) NOT NULL,
-            last_read DATETIME DEFAULT CURRENT_TIMESTAMP,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # 创建chapters表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chapters (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            book_id INT NOT NULL,
-            title VARCHAR(255) NOT NULL,
-            href VARCHAR(255) NOT NULL,
-            order_num INT NOT NULL,
-            summary TEXT,
-            translation TEXT,
-            mermaid_diagram TEXT,
-            html_content LONGTEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
-        )
-        ''')
-        
-        # 创建bookmarks表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bookmarks (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            book_id INT NOT NULL,
-            chapter_id INT NOT NULL,
-            cfi VARCHAR(255) NOT NULL,
-            text VARCHAR(255),
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
-            FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE
-        )
-        ''')
-        
-        db.commit()
\ No newline at end of file
+        migrate(backend, get_db())
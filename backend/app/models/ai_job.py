@@ -0,0 +1,211 @@
+"""AI生成任务队列
+
+章节的摘要、翻译和图表生成以任务的形式保存在 ai_jobs 表中，由独立的工作进程（ai_worker.py）
+领取执行，生成结果仍写入 chapters 表。同一章节的同一种操作只有一个任务（唯一键
+(chapter_id, operation)），重复请求只会提高已有任务的优先级。
+
+任务状态：pending（排队中）→ running（执行中）→ done / failed。
+priority 越小越先执行，同一优先级按排队顺序执行。工作进程领取任务时设置租约 lease_until，
+进程异常退出后租约过期的任务重新排队，超过最大尝试次数的任务标记为 failed。
+"""
+import time
+
+from app.models import get_db, get_backend
+
+AI_JOB_FIELDS = ('id', 'chapter_id', 'operation', 'priority', 'status', 'attempts', 'error',
+                 'enqueued_at', 'started_at', 'finished_at')
+
+class AIJob:
+    @staticmethod
+    def enqueue_many(chapter_ids, operation, priority, chunk_size=500):
+        """为多个章节排队同一种操作，返回 {章节ID: 任务ID}
+
+        - 没有任务的章节新建任务
+        - 已完成或失败的任务重新排队（结果被清除后再次请求，或重试失败的任务）
+        - 排队中或执行中的任务保留，只在新请求的优先级更高时提高优先级
+        """
+        chapter_ids = list(dict.fromkeys(chapter_ids))
+        db = get_db()
+        cursor = db.cursor()
+        now = time.time()
+
+        jobs = {}
+        try:
+            for i in range(0, len(chapter_ids), chunk_size):
+                chunk = chapter_ids[i:i + chunk_size]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'''
+                SELECT id, chapter_id, status, priority FROM ai_jobs
+                WHERE operation = %s AND chapter_id IN ({placeholders})
+                ''', [operation] + chunk)
+                existing = {row['chapter_id']: row for row in cursor.fetchall()}
+
+                new = [chapter_id for chapter_id in chunk if chapter_id not in existing]
+                if new:
+                    cursor.executemany('''
+                    INSERT INTO ai_jobs (chapter_id, operation, priority, status, enqueued_at)
+                    VALUES (%s, %s, %s, 'pending', %s)
+                    ''', [(chapter_id, operation, priority, now) for chapter_id in new])
+
+                requeue = [row['id'] for row in existing.values() if row['status'] in ('done', 'failed')]
+                if requeue:
+                    placeholders = ', '.join(['%s'] * len(requeue))
+                    cursor.execute(f'''
+                    UPDATE ai_jobs
+                    SET status = 'pending', priority = %s, attempts = 0, worker = NULL, lease_until = NULL,
+                        error = NULL, enqueued_at = %s, started_at = NULL, finished_at = NULL
+                    WHERE id IN ({placeholders}) AND status IN ('done', 'failed')
+                    ''', [priority, now] + requeue)
+
+                promote = [row['id'] for row in existing.values()
+                           if row['status'] in ('pending', 'running') and row['priority'] > priority]
+                if promote:
+                    placeholders = ', '.join(['%s'] * len(promote))
+                    cursor.execute(f'''
+                    UPDATE ai_jobs SET priority = %s WHERE id IN ({placeholders}) AND priority > %s
+                    ''', [priority] + promote + [priority])
+
+                if new:
+                    placeholders = ', '.join(['%s'] * len(new))
+                    cursor.execute(f'''
+                    SELECT id, chapter_id FROM ai_jobs
+                    WHERE operation = %s AND chapter_id IN ({placeholders})
+                    ''', [operation] + new)
+                    existing.update({row['chapter_id']: row for row in cursor.fetchall()})
+                jobs.update({chapter_id: row['id'] for chapter_id, row in existing.items()})
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # 并发请求先插入了同一个任务：重新读取后按已有任务处理
+            if get_backend().is_duplicate_key_error(e):
+                return AIJob.enqueue_many(chapter_ids, operation, priority, chunk_size)
+            raise
+
+        return jobs
+
+    @staticmethod
+    def enqueue(chapter_id, operation, priority):
+        """为一个章节排队操作，返回任务"""
+        job_id = AIJob.enqueue_many([chapter_id], operation, priority)[chapter_id]
+        return AIJob.get_by_id(job_id)
+
+    @staticmethod
+    def get_by_id(job_id):
+        db = get_db()
+        cursor = db.cursor()
+
+        sql = f'''
+        SELECT {', '.join(AI_JOB_FIELDS)} FROM ai_jobs WHERE id = %s
+        '''
+        cursor.execute(sql, (job_id,))
+
+        return cursor.fetchone()
+
+    @staticmethod
+    def count_ahead(job):
+        """排在该任务之前的待执行任务数"""
+        db = get_db()
+        cursor = db.cursor()
+
+        sql = '''
+        SELECT COUNT(*) AS ahead FROM ai_jobs
+        WHERE status = 'pending' AND (priority < %s OR (priority = %s AND id < %s))
+        '''
+        cursor.execute(sql, (job['priority'], job['priority'], job['id']))
+
+        return cursor.fetchone()['ahead']
+
+    @staticmethod
+    def claim(worker, lease_seconds, candidates=8):
+        """领取优先级最高的待执行任务并设置租约，没有任务时返回 None
+
+        多个工作进程同时领取时，只有把状态从 pending 改为 running 的那一个成功，
+        其余的依次尝试后面的候选任务。
+        """
+        db = get_db()
+        cursor = db.cursor()
+
+        cursor.execute('''
+        SELECT id FROM ai_jobs WHERE status = 'pending' ORDER BY priority, id LIMIT %s
+        ''', (candidates,))
+        job_ids = [row['id'] for row in cursor.fetchall()]
+        db.rollback()
+
+        for job_id in job_ids:
+            now = time.time()
+            updated = cursor.execute('''
+            UPDATE ai_jobs
+            SET status = 'running', worker = %s, attempts = attempts + 1, lease_until = %s, started_at = %s
+            WHERE id = %s AND status = 'pending'
+            ''', (worker, now + lease_seconds, now, job_id))
+            db.commit()
+            if updated:
+                return AIJob.get_by_id(job_id)
+        return None
+
+    @staticmethod
+    def finish(job_id, worker):
+        """标记任务完成"""
+        db = get_db()
+        cursor = db.cursor()
+
+        sql = '''
+        UPDATE ai_jobs
+        SET status = 'done', lease_until = NULL, error = NULL, finished_at = %s
+        WHERE id = %s AND worker = %s AND status = 'running'
+        '''
+        cursor.execute(sql, (time.time(), job_id, worker))
+        db.commit()
+
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def fail(job_id, worker, error, max_attempts):
+        """记录任务出错：尝试次数未用完时重新排队，否则标记为失败"""
+        db = get_db()
+        cursor = db.cursor()
+
+        sql = '''
+        UPDATE ai_jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+            lease_until = NULL, error = %s, finished_at = %s
+        WHERE id = %s AND worker = %s AND status = 'running'
+        '''
+        cursor.execute(sql, (max_attempts, error[:2000], time.time(), job_id, worker))
+        db.commit()
+
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def requeue_expired(max_attempts):
+        """租约过期（工作进程异常退出）的任务重新排队，尝试次数用完的标记为失败，返回处理的任务数"""
+        db = get_db()
+        cursor = db.cursor()
+        now = time.time()
+
+        failed = cursor.execute('''
+        UPDATE ai_jobs
+        SET status = 'failed', lease_until = NULL, error = 'Worker stopped before the job finished', finished_at = %s
+        WHERE status = 'running' AND lease_until < %s AND attempts >= %s
+        ''', (now, now, max_attempts))
+        requeued = cursor.execute('''
+        UPDATE ai_jobs SET status = 'pending', lease_until = NULL
+        WHERE status = 'running' AND lease_until < %s
+        ''', (now,))
+        db.commit()
+
+        return failed + requeued
+
+    @staticmethod
+    def get_stats():
+        """按状态和优先级统计任务数"""
+        db = get_db()
+        cursor = db.cursor()
+
+        sql = '''
+        SELECT status, priority, COUNT(*) AS jobs FROM ai_jobs GROUP BY status, priority ORDER BY status, priority
+        '''
+        cursor.execute(sql)
+
+        return cursor.fetchall()
@@ -0,0 +1,239 @@
+"""数据库存储后端
+
+模型层统一使用 DB-API 风格的连接（cursor/commit/rollback）和 %s 占位符编写SQL，
+查询结果为字典。后端负责建立连接并屏蔽各数据库之间的差异：
+
+- MySQLBackend: 通过 pymysql 连接外部 MySQL 服务器
+- SQLiteBackend: 使用内嵌的 SQLite 数据库文件（WAL 模式），适合单机部署和测试
+
+通过配置项 DB_BACKEND（mysql / sqlite）选择。
+"""
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pymysql
+
+class MySQLBackend:
+    name = 'mysql'
+
+    MIGRATION_LOCK_NAME = 'epub_summarizer_schema_migration'
+    MIGRATION_LOCK_TIMEOUT = 60
+
+    # 每批 INSERT 语句相对 max_allowed_packet 预留的余量
+    PACKET_MARGIN = 64 * 1024
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        """根据配置新建一个MySQL连接"""
+        return pymysql.connect(
+            host=self.config['DB_HOST'],
+            user=self.config['DB_USER'],
+            password=self.config['DB_PASSWORD'],
+            database=self.config['DB_NAME'],
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor,
+            client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS,
+            max_allowed_packet=67108864  # 64MB
+        )
+
+    def seconds_ago_sql(self):
+        """数据库时钟上“%s 秒之前”的时间表达式，用于批量写入在应用中延后提交的时间戳"""
+        return 'NOW() - INTERVAL %s SECOND'
+
+    def is_missing_table_error(self, error):
+        # 1146: Table doesn't exist
+        return isinstance(error, pymysql.err.ProgrammingError) and bool(error.args) and error.args[0] == 1146
+
+    def is_duplicate_key_error(self, error):
+        # 1062: Duplicate entry for key
+        return isinstance(error, pymysql.err.IntegrityError) and bool(error.args) and error.args[0] == 1062
+
+    def prepare_bulk_insert(self, db, cursor):
+        """按服务器的 max_allowed_packet 设置多行 INSERT 的语句大小上限"""
+        cursor.execute('SELECT @@max_allowed_packet AS max_packet')
+        server_packet = cursor.fetchone()['max_packet']
+        # pymysql 的 executemany 会把多行合并成不超过 max_stmt_length 的 INSERT 语句
+        cursor.max_stmt_length = max(min(server_packet, db.max_allowed_packet) - self.PACKET_MARGIN, 1024 * 1024)
+
+    @contextmanager
+    def migration_lock(self, db):
+        """多个进程同时启动时只允许一个执行迁移"""
+        cursor = db.cursor()
+        cursor.execute('SELECT GET_LOCK(%s, %s) AS locked', (self.MIGRATION_LOCK_NAME, self.MIGRATION_LOCK_TIMEOUT))
+        if not cursor.fetchone()['locked']:
+            raise Exception("Timed out waiting for the schema migration lock")
+        try:
+            yield
+        finally:
+            cursor.execute('SELECT RELEASE_LOCK(%s)', (self.MIGRATION_LOCK_NAME,))
+            cursor.fetchall()
+
+def _dict_factory(cursor, row):
+    return {column[0]: row[i] for i, column in enumerate(cursor.description)}
+
+def _parse_datetime(value):
+    text = value.decode('utf-8')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+def _now():
+    # 与 DEFAULT CURRENT_TIMESTAMP 一致，使用 UTC 时间
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+sqlite3.register_converter('DATETIME', _parse_datetime)
+
+_PLACEHOLDER_RE = re.compile(r'%s')
+
+class SQLiteCursor:
+    """把 %s 占位符转换为 SQLite 的 ? 的游标包装"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(_PLACEHOLDER_RE.sub('?', sql), params)
+        return self._cursor.rowcount
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(_PLACEHOLDER_RE.sub('?', sql), rows)
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class SQLiteConnection:
+    """提供与 pymysql 连接相同接口的 SQLite 连接包装"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        self._conn.close()
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    # WAL 模式允许读写并发；synchronous=NORMAL 在 WAL 下只在检查点时 fsync
+    PRAGMAS = (
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA foreign_keys = ON',
+        'PRAGMA busy_timeout = 5000',
+        'PRAGMA cache_size = -65536',  # 64MB 页缓存
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA mmap_size = 268435456'  # 256MB 内存映射
+    )
+
+    def __init__(self, config):
+        self.config = config
+        self.path = config.get('SQLITE_PATH') or os.path.join(config['UPLOAD_FOLDER'], 'epub_summarizer.db')
+        self._lock = threading.Lock()
+
+    def connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 连接由连接池在线程之间借出，同一时间只被一个线程使用
+        conn = sqlite3.connect(self.path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = _dict_factory
+        conn.create_function('NOW', 0, _now)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return SQLiteConnection(conn)
+
+    def seconds_ago_sql(self):
+        return "datetime(NOW(), '-' || %s || ' seconds')"
+
+    def is_missing_table_error(self, error):
+        return isinstance(error, sqlite3.OperationalError) and 'no such table' in str(error)
+
+    def is_duplicate_key_error(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE constraint failed' in str(error)
+
+    def prepare_bulk_insert(self, db, cursor):
+        # SQLite 没有包大小限制，executemany 复用同一条预编译语句
+        pass
+
+    @contextmanager
+    def migration_lock(self, db):
+        """用数据库旁的锁文件保证只有一个进程执行迁移"""
+        with self._lock, open(self.path + '.migrate.lock', 'a+') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield
+            finally:
+                _unlock_file(lock_file)
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend
+}
+
+def create_backend(config):
+    """按配置项 DB_BACKEND 创建存储后端，默认使用 MySQL"""
+    name = (config.get('DB_BACKEND') or 'mysql').lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DB_BACKEND: {name}")
+    return BACKENDS[name](config)
@@ -1,35 +1,141 @@
-from app.models import get_db
+import time
+
+from flask import current_app
+from app.models import get_db, get_backend
+from app.models.cache import book_cache, chapter_cache
+from app.utils.compression import compress_text, decompress_text
+
+# 章节列表和元数据查询使用的列，不包含 LONGTEXT/TEXT 大字段
+CHAPTER_META_COLUMNS = '''id, book_id, title, href, order_num, char_count, token_count, content_hash, html_hash,
+        summary IS NOT NULL AS has_summary,
+        translation IS NOT NULL AS has_translation,
+        mermaid_diagram IS NOT NULL AS has_diagram'''
+
+# 只在需要时才读取的大字段
+CHAPTER_HEAVY_FIELDS = ('html_content', 'plain_text', 'summary', 'translation', 'mermaid_diagram')
+
+# 压缩存储的字段，读取时自动解压
+CHAPTER_COMPRESSED_FIELDS = ('html_content', 'plain_text', 'translation')
+
+# 书架和书签列表可选择的字段与排序列，排序均为 (排序列, id) 倒序
+BOOK_LIST_FIELDS = ('id', 'title', 'author', 'cover_path', 'cover_renditions', 'file_path', 'last_read', 'created_at',
+                    'last_chapter_id')
+BOOK_SORT_KEYS = ('last_read', 'created_at')
+BOOKMARK_LIST_FIELDS = ('id', 'book_id', 'chapter_id', 'cfi', 'text', 'created_at')
+
+def _keyset_page(table, fields, sort_key, after, limit, where='1 = 1', params=()):
+    """按 (sort_key, id) 倒序读取一页
+    
+    after 为上一页最后一行的 (排序值, id)；多读一行判断是否还有下一页，不做 COUNT。
+    返回 (行列表, 下一页的 after 或 None)。
+    """
+    columns = list(dict.fromkeys(list(fields) + ['id', sort_key]))
+    params = list(params)
+    if after is not None:
+        # 用 OR 展开而不是行值比较，保证 MySQL 和 SQLite 都能走 (sort_key, id) 索引的范围扫描
+        where += f' AND ({sort_key} < %s OR ({sort_key} = %s AND id < %s))'
+        params.extend((after[0], after[0], after[1]))
+    
+    db = get_db()
+    cursor = db.cursor()
+    
+    sql = f'''
+    SELECT {', '.join(columns)} FROM {table}
+    WHERE {where}
+    ORDER BY {sort_key} DESC, id DESC
+    LIMIT %s
+    '''
+    params.append(limit + 1)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1][sort_key], rows[-1]['id'])
+    return rows, next_after
+
+def _normalize_flags(row):
+    """把数据库返回的 0/1 标记转换为布尔值"""
+    if row:
+        for flag in ('has_summary', 'has_translation', 'has_diagram'):
+            if flag in row:
+                row[flag] = bool(row[flag])
+    return row
+
+def _decompress_fields(row, raw=False):
+    """解压行中的压缩字段；raw 为 True 时保留数据库中的原始字节"""
+    if row and not raw:
+        for field in CHAPTER_COMPRESSED_FIELDS:
+            if field in row:
+                row[field] = decompress_text(row[field])
+    return row
 
 class Book:
     @staticmethod
-    def create(title, author, cover_path, file_path):
+    def create(title, author, cover_path, file_path, file_hash=None, cover_renditions=None):
+        """cover_renditions: 已生成的封面尺寸版本名称，以逗号分隔"""
         db = get_db()
         cursor = db.cursor()
         
         sql = '''
-        INSERT INTO books (title, author, cover_path, file_path)
-        VALUES (%s, %s, %s, %s)
+        INSERT INTO books (title, author, cover_path, file_path, file_hash, cover_renditions)
+        VALUES (%s, %s, %s, %s, %s, %s)
         '''
-        cursor.execute(sql, (title, author, cover_path, file_path))
+        cursor.execute(sql, (title, author, cover_path, file_path, file_hash, cover_renditions))
         book_id = cursor.lastrowid
         db.commit()
         
         return book_id
     
     @staticmethod
-    def get_all():
+    def get_ids_by_file_hash(file_hashes, chunk_size=500):
+        """按EPUB文件的内容哈希批量查找已导入的书籍，返回 {哈希: 书籍ID}"""
+        file_hashes = list(dict.fromkeys(file_hashes))
         db = get_db()
         cursor = db.cursor()
         
-        sql = '''
-        SELECT * FROM books ORDER BY last_read DESC
-        '''
-        cursor.execute(sql)
-        
-        return cursor.fetchall()
+        found = {}
+        for i in range(0, len(file_hashes), chunk_size):
+            chunk = file_hashes[i:i + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'''
+            SELECT id, file_hash FROM books WHERE file_hash IN ({placeholders})
+            ''', chunk)
+            for row in cursor.fetchall():
+                found.setdefault(row['file_hash'], row['id'])
+        return found
     
+    @staticmethod
+    def get_page(sort_key='last_read', after=None, limit=50, fields=BOOK_LIST_FIELDS):
+        """按最后阅读时间或创建时间倒序分页读取书架，返回 (书籍列表, 下一页的 after)"""
+        if sort_key not in BOOK_SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_key}")
+        for field in fields:
+            if field not in BOOK_LIST_FIELDS:
+                raise ValueError(f"Unknown book field: {field}")
+        
+        return _keyset_page('books', fields, sort_key, after, limit)
+
+    @staticmethod
+    def get_ids():
+        """按 id 顺序返回所有书籍的 id（维护脚本遍历书库时使用）"""
+        db = get_db()
+        cursor = db.cursor()
+
+        cursor.execute('''
+        SELECT id FROM books ORDER BY id
+        ''')
+
+        return [row['id'] for row in cursor.fetchall()]
+
     @staticmethod
     def get_by_id(book_id):
+        """获取书籍信息，优先从进程内缓存读取"""
+        book = book_cache.get(book_id)
+        if book is not None:
+            return book
+        
         db = get_db()
         cursor = db.cursor()
         
@@ -37,19 +143,89 @@ class Book:
         SELECT * FROM books WHERE id = %s
         '''
         cursor.execute(sql, (book_id,))
+        book = cursor.fetchone()
+        book_cache.set(book_id, book)
         
-        return cursor.fetchone()
+        return book
     
     @staticmethod
-    def update_last_read(book_id):
+    def get_unrecorded_covers():
+        """有封面但没有记录封面尺寸版本的书（cover_renditions 列添加之前入库），返回 [{id, cover_path}]"""
+        db = get_db()
+        cursor = db.cursor()
+
+        cursor.execute('''
+        SELECT id, cover_path FROM books
+        WHERE cover_path IS NOT NULL AND cover_path != '' AND cover_renditions IS NULL
+        ORDER BY id
+        ''')
+
+        return cursor.fetchall()
+
+    @staticmethod
+    def update_cover_renditions(book_id, cover_renditions):
+        """记录书籍已有的封面尺寸版本（以逗号分隔的名称）"""
         db = get_db()
         cursor = db.cursor()
         
         sql = '''
-        UPDATE books SET last_read = NOW() WHERE id = %s
+        UPDATE books SET cover_renditions = %s WHERE id = %s
         '''
-        cursor.execute(sql, (book_id,))
+        cursor.execute(sql, (cover_renditions, book_id))
         db.commit()
+        
+        book_cache.invalidate(book_id)
+        
+        return cursor.rowcount > 0
+    
+    @staticmethod
+    def record_reading_progress(book_id, chapter_id=None):
+        """记录阅读进度（最后阅读时间和章节）
+        
+        更新先合并在写后缓冲中，再由后台线程通过 update_reading_progress 批量写入，
+        打开书籍的请求不需要等待数据库提交。
+        """
+        current_app.extensions['progress_buffer'].put(book_id, (time.monotonic(), chapter_id))
+    
+    @staticmethod
+    def update_reading_progress(updates):
+        """用一条语句批量更新多本书的最后阅读时间和章节
+        
+        updates: {book_id: (记录时的 time.monotonic(), chapter_id)}，chapter_id 为 None 时保留原值。
+        最后阅读时间按数据库时钟计算（写入时的 NOW() 减去更新在缓冲中等待的秒数），与直接写入 NOW() 一致。
+        """
+        if not updates:
+            return 0
+        
+        db = get_db()
+        cursor = db.cursor()
+        now = time.monotonic()
+        
+        book_ids = list(updates)
+        cases = ' '.join(f'WHEN %s THEN {get_backend().seconds_ago_sql()}' for _ in book_ids)
+        chapter_cases = ' '.join('WHEN %s THEN COALESCE(%s, last_chapter_id)' for _ in book_ids)
+        placeholders = ', '.join('%s' for _ in book_ids)
+        
+        sql = f'''
+        UPDATE books
+        SET last_read = CASE id {cases} END,
+            last_chapter_id = CASE id {chapter_cases} END
+        WHERE id IN ({placeholders})
+        '''
+        params = []
+        for book_id in book_ids:
+            params.extend((book_id, max(0, int(now - updates[book_id][0]))))
+        for book_id in book_ids:
+            params.extend((book_id, updates[book_id][1]))
+        params.extend(book_ids)
+        
+        cursor.execute(sql, params)
+        db.commit()
+        
+        for book_id in book_ids:
+            book_cache.invalidate(book_id)
+        
+        return cursor.rowcount
     
     @staticmethod
     def delete(book_id):
@@ -62,52 +238,208 @@ class Book:
         cursor.execute(sql, (book_id,))
         db.commit()
         
+        # 章节随书籍级联删除
+        book_cache.invalidate(book_id)
+        chapter_cache.invalidate_where(lambda chapter: chapter['book_id'] == book_id)
+        
         return cursor.rowcount > 0
 
 class Chapter:
     @staticmethod
-    def create_many(book_id, chapters):
-        """批量创建章节"""
+    def create_many(book_id, chapters, start=0):
+        """批量创建章节
+        
+        章节可以带上渲染后HTML在内容存储中的 html_hash，
+        以及 plain_text、char_count、token_count、content_hash，
+        所有行通过多行 INSERT 在一个事务中写入，
+        MySQL 下每条语句的大小按服务器的 max_allowed_packet 切分。
+        start 为第一章的 order_num，分批写入一本书的章节时依次递增。
+        返回按章节顺序排列的章节ID列表。
+        """
+        if not chapters:
+            return []
+        
         db = get_db()
         cursor = db.cursor()
         
-        chapter_ids = []
+        rows = [
+            (
+                book_id,
+                chapter['title'],
+                chapter['href'],
+                start + i,
+                chapter.get('html_hash'),
+                compress_text(chapter.get('plain_text')),
+                chapter.get('char_count'),
+                chapter.get('token_count'),
+                chapter.get('content_hash')
+            )
+            for i, chapter in enumerate(chapters)
+        ]
         
-        for i, chapter in enumerate(chapters):
-            sql = '''
-            INSERT INTO chapters (book_id, title, href, order_num)
-            VALUES (%s, %s, %s, %s)
-            '''
-            cursor.execute(sql, (book_id, chapter['title'], chapter['href'], i))
-            chapter_ids.append(cursor.lastrowid)
+        sql = '''
+        INSERT INTO chapters (book_id, title, href, order_num, html_hash,
+                              plain_text, char_count, token_count, content_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        '''
         
-        db.commit()
+        try:
+            get_backend().prepare_bulk_insert(db, cursor)
+            
+            cursor.executemany(sql, rows)
+            
+            # 多行 INSERT 只返回首个自增ID，按 order_num 读回全部ID以保证顺序
+            cursor.execute('''
+            SELECT id FROM chapters WHERE book_id = %s AND order_num >= %s ORDER BY order_num
+            ''', (book_id, start))
+            chapter_ids = [row['id'] for row in cursor.fetchall()]
+            
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
         
         return chapter_ids
     
     @staticmethod
-    def get_by_book_id(book_id):
+    def get_toc(book_id):
+        """获取书籍目录：只包含章节元数据和是否已生成内容的标记，不读取大字段"""
         db = get_db()
         cursor = db.cursor()
         
-        sql = '''
-        SELECT * FROM chapters WHERE book_id = %s ORDER BY order_num
+        sql = f'''
+        SELECT {CHAPTER_META_COLUMNS} FROM chapters WHERE book_id = %s ORDER BY order_num
         '''
         cursor.execute(sql, (book_id,))
         
-        return cursor.fetchall()
+        return [_normalize_flags(row) for row in cursor.fetchall()]
     
     @staticmethod
-    def get_by_id(chapter_id):
+    def get_by_id(chapter_id, *fields, raw=False):
+        """获取章节元数据，fields 中列出的大字段（如 html_content）会在同一查询中一并读取
+        
+        只读取元数据时优先使用进程内缓存。
+        压缩存储的字段默认解压后返回；raw 为 True 时返回数据库中的原始字节。
+        """
+        for field in fields:
+            if field not in CHAPTER_HEAVY_FIELDS:
+                raise ValueError(f"Unknown chapter field: {field}")
+        
+        if not fields:
+            chapter = chapter_cache.get(chapter_id)
+            if chapter is not None:
+                return chapter
+        
         db = get_db()
         cursor = db.cursor()
         
-        sql = '''
-        SELECT * FROM chapters WHERE id = %s
+        columns = ', '.join((CHAPTER_META_COLUMNS,) + fields)
+        sql = f'''
+        SELECT {columns} FROM chapters WHERE id = %s
+        '''
+        cursor.execute(sql, (chapter_id,))
+        chapter = _decompress_fields(_normalize_flags(cursor.fetchone()), raw)
+        
+        if not fields:
+            chapter_cache.set(chapter_id, chapter)
+        
+        return chapter
+    
+    @staticmethod
+    def get_bundle(book_id, field, chapter_ids=None, start=None, count=None):
+        """在一次查询中验证书籍并读取多个章节的内容
+        
+        按 chapter_ids 或从第 start 章（order_num）开始的 count 章选择章节，
+        field 为要读取的大字段（html_content 或 plain_text），章节按顺序返回。
+        书籍不存在时返回 None。
+        """
+        if field not in CHAPTER_HEAVY_FIELDS:
+            raise ValueError(f"Unknown chapter field: {field}")
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        if chapter_ids is not None:
+            if not chapter_ids:
+                chapter_ids = [None]
+            condition = f"c.id IN ({', '.join(['%s'] * len(chapter_ids))})"
+            params = [*chapter_ids, book_id]
+        else:
+            condition = 'c.order_num >= %s AND c.order_num < %s'
+            params = [start, start + count, book_id]
+        
+        # 以 books 为主表做 LEFT JOIN：书籍存在但没有匹配章节时仍返回一行
+        sql = f'''
+        SELECT b.file_path, c.id, c.title, c.href, c.order_num, c.html_hash, c.{field}
+        FROM books b LEFT JOIN chapters c ON c.book_id = b.id AND {condition}
+        WHERE b.id = %s
+        ORDER BY c.order_num
+        '''
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        
+        if not rows:
+            return None
+        return [_decompress_fields(row, raw=field == 'html_content') for row in rows if row['id'] is not None]
+    
+    @staticmethod
+    def get_search_hits(chapter_ids):
+        """一次读取检索命中章节的标题、所属书名和纯文本，返回 {chapter_id: row}"""
+        if not chapter_ids:
+            return {}
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        placeholders = ', '.join(['%s'] * len(chapter_ids))
+        sql = f'''
+        SELECT c.id, c.book_id, c.title, c.plain_text, b.title AS book_title
+        FROM chapters c JOIN books b ON b.id = c.book_id
+        WHERE c.id IN ({placeholders})
+        '''
+        cursor.execute(sql, tuple(chapter_ids))
+        
+        return {row['id']: _decompress_fields(row) for row in cursor.fetchall()}
+    
+    @staticmethod
+    def get_field(chapter_id, field, raw=False):
+        """按需读取章节的单个大字段，raw 为 True 时不解压"""
+        if field not in CHAPTER_HEAVY_FIELDS:
+            raise ValueError(f"Unknown chapter field: {field}")
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        sql = f'''
+        SELECT {field} FROM chapters WHERE id = %s
         '''
         cursor.execute(sql, (chapter_id,))
+        row = cursor.fetchone()
         
-        return cursor.fetchone()
+        return _decompress_fields(row, raw)[field] if row else None
+    
+    @staticmethod
+    def get_artifact(chapter_id, field, with_text=True):
+        """读取章节元数据和AI生成结果（summary/translation/mermaid_diagram）
+        
+        结果尚未生成时同一行中顺带返回 plain_text，供调用方直接生成；
+        已生成时或 with_text 为 False（只查看结果、由任务队列生成）时 plain_text 为 None，不会传输章节全文。
+        """
+        if field not in ('summary', 'translation', 'mermaid_diagram'):
+            raise ValueError(f"Unknown chapter artifact: {field}")
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        text_column = f"CASE WHEN {field} IS NULL OR {field} = '' THEN plain_text END" if with_text else 'NULL'
+        sql = f'''
+        SELECT {CHAPTER_META_COLUMNS}, {field},
+               {text_column} AS plain_text
+        FROM chapters WHERE id = %s
+        '''
+        cursor.execute(sql, (chapter_id,))
+        
+        return _decompress_fields(_normalize_flags(cursor.fetchone()))
     
     @staticmethod
     def update_summary(chapter_id, summary):
@@ -123,6 +455,8 @@ class Chapter:
         cursor.execute(sql, (summary, chapter_id))
         db.commit()
         
+        chapter_cache.invalidate(chapter_id)
+        
         return cursor.rowcount > 0
 
     @staticmethod
@@ -136,9 +470,11 @@ class Chapter:
         SET translation = %s
         WHERE id = %s
         '''
-        cursor.execute(sql, (translation, chapter_id))
+        cursor.execute(sql, (compress_text(translation), chapter_id))
         db.commit()
         
+        chapter_cache.invalidate(chapter_id)
+        
         return cursor.rowcount > 0
 
     @staticmethod
@@ -155,35 +491,49 @@ class Chapter:
         cursor.execute(sql, (mermaid_diagram, chapter_id))
         db.commit()
         
+        chapter_cache.invalidate(chapter_id)
+        
         return cursor.rowcount > 0
 
     @staticmethod
-    def update_html_content(chapter_id, html_content):
-        """更新章节的HTML内容"""
+    def update_plain_text(chapter_id, text_record):
+        """更新章节的纯文本及其字符数、估算token数和内容哈希"""
         db = get_db()
         cursor = db.cursor()
         
-        try:
-            sql = '''
-            UPDATE chapters SET html_content = %s WHERE id = %s
-            '''
-            cursor.execute(sql, (html_content, chapter_id))
-            db.commit()
-            
-            return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Error updating HTML content: {str(e)}")
-            # 如果内容太大，尝试截断
-            if len(html_content) > 65535:  # MySQL TEXT类型的最大长度
-                truncated_content = html_content[:65000] + "... (内容已截断)"
-                try:
-                    cursor.execute(sql, (truncated_content, chapter_id))
-                    db.commit()
-                    return True
-                except Exception as e2:
-                    print(f"Error updating truncated HTML content: {str(e2)}")
-                    return False
-            return False
+        sql = '''
+        UPDATE chapters
+        SET plain_text = %s, char_count = %s, token_count = %s, content_hash = %s
+        WHERE id = %s
+        '''
+        cursor.execute(sql, (
+            compress_text(text_record['plain_text']),
+            text_record['char_count'],
+            text_record['token_count'],
+            text_record['content_hash'],
+            chapter_id
+        ))
+        db.commit()
+        
+        chapter_cache.invalidate(chapter_id)
+        
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def update_html_hash(chapter_id, html_hash):
+        """更新章节渲染后HTML在内容存储中的哈希"""
+        db = get_db()
+        cursor = db.cursor()
+        
+        sql = '''
+        UPDATE chapters SET html_hash = %s WHERE id = %s
+        '''
+        cursor.execute(sql, (html_hash, chapter_id))
+        db.commit()
+        
+        chapter_cache.invalidate(chapter_id)
+        
+        return cursor.rowcount > 0
 
 class Bookmark:
     @staticmethod
@@ -201,26 +551,58 @@ class Bookmark:
         return cursor.lastrowid
     
     @staticmethod
-    def get_by_book_id(book_id):
+    def get_page_by_book_id(book_id, after=None, limit=50, fields=BOOKMARK_LIST_FIELDS):
+        """按创建时间倒序分页读取一本书的书签，返回 (书签列表, 下一页的 after)"""
+        for field in fields:
+            if field not in BOOKMARK_LIST_FIELDS:
+                raise ValueError(f"Unknown bookmark field: {field}")
+        
+        return _keyset_page('bookmarks', fields, 'created_at', after, limit,
+                            where='book_id = %s', params=(book_id,))
+    
+    @staticmethod
+    def delete(bookmark_id):
         db = get_db()
         cursor = db.cursor()
         
         sql = '''
-        SELECT * FROM bookmarks WHERE book_id = %s ORDER BY created_at DESC
+        DELETE FROM bookmarks WHERE id = %s
         '''
-        cursor.execute(sql, (book_id,))
+        cursor.execute(sql, (bookmark_id,))
+        db.commit()
         
-        return cursor.fetchall()
+        return cursor.rowcount > 0 
+
+class BookResource:
+    """EPUB内资源路径与资源存储中文件的对应关系
     
+    入库时记录每个已保存的资源；资源存储上线之前入库的书在第一次被请求时记录。
+    """
     @staticmethod
-    def delete(bookmark_id):
+    def create_many(book_id, resources):
+        """resources: {资源路径: 资源存储中的相对路径}"""
+        if not resources:
+            return
         db = get_db()
         cursor = db.cursor()
         
         sql = '''
-        DELETE FROM bookmarks WHERE id = %s
+        INSERT INTO book_resources (book_id, path, asset)
+        VALUES (%s, %s, %s)
         '''
-        cursor.execute(sql, (bookmark_id,))
+        cursor.executemany(sql, [(book_id, path, asset) for path, asset in resources.items()])
         db.commit()
+    
+    @staticmethod
+    def get_asset(path):
+        """返回资源路径对应的资源存储文件，未记录时返回 None；多本书包含同一路径时取最早入库的"""
+        db = get_db()
+        cursor = db.cursor()
+        
+        sql = '''
+        SELECT asset FROM book_resources WHERE path = %s ORDER BY id LIMIT 1
+        '''
+        cursor.execute(sql, (path,))
+        row = cursor.fetchone()
         
-        return cursor.rowcount > 0 
\ No newline at end of file
+        return row['asset'] if row else None
@@ -0,0 +1,94 @@
+"""模型层的进程内读穿透缓存
+
+书籍行和章节元数据在上传后基本不再变化，读取时先查缓存，未命中再查询数据库并写入缓存。
+缓存按 LRU 淘汰并带有过期时间；模型的 update_*/delete 方法会主动失效对应条目。
+缓存只在当前进程内有效，其他进程（worker）中的修改最多在 TTL 之后可见。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """线程安全、带过期时间的 LRU 缓存"""
+
+    def __init__(self, max_size=4096, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def configure(self, max_size, ttl):
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key):
+        """返回缓存的副本，未命中或已过期时返回 None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return dict(value)
+                del self._data[key]
+            self._misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.max_size <= 0 or value is None:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, dict(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """失效所有满足 predicate(value) 的条目"""
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': self._hits / lookups if lookups else 0.0
+            }
+
+book_cache = LRUCache()
+chapter_cache = LRUCache()
+
+def configure_caches(config):
+    """按配置设置缓存大小和过期时间，MODEL_CACHE_SIZE 为 0 时关闭缓存"""
+    max_size = config.get('MODEL_CACHE_SIZE', 4096)
+    ttl = config.get('MODEL_CACHE_TTL', 300)
+    book_cache.configure(max_size, ttl)
+    chapter_cache.configure(max_size, ttl)
+
+def cache_stats():
+    """当前进程的缓存命中统计"""
+    return {
+        'books': book_cache.stats(),
+        'chapters': chapter_cache.stats()
+    }
@@ -0,0 +1,59 @@
+import time
+from app.utils.metrics import record_db_query
+
+class InstrumentedCursor:
+    """记录每条语句耗时的游标代理，其余属性和方法转给原游标"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            record_db_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, rows):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, rows)
+        finally:
+            record_db_query(sql, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # 例如 MySQL 批量插入时设置的 max_stmt_length 要落到原游标上
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._cursor.close()
+
+class InstrumentedConnection:
+    """连接代理：cursor() 返回带计时的游标"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def instrument(connect):
+    """包装后端的 connect，让连接池创建的连接都记录查询耗时"""
+    def instrumented_connect():
+        return InstrumentedConnection(connect())
+    return instrumented_connect
@@ -0,0 +1,262 @@
+"""数据库结构迁移
+
+每个迁移是 (版本号, 说明, SQL语句列表)，按版本号顺序执行。各后端DDL语法不同时，
+SQL语句列表写成以后端名称（mysql / sqlite）为键的字典。已执行的版本记录在
+schema_version 表中，应用启动时只做一次版本检查，仅在存在未执行的迁移时才
+加锁执行DDL。新增表结构变更时在 MIGRATIONS 末尾追加新版本，不要修改已发布的迁移。
+"""
+
+MIGRATIONS = [
+    (1, '创建 books、chapters、bookmarks 表', {'mysql': [
+        '''
+        CREATE TABLE IF NOT EXISTS books (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            author VARCHAR(255),
+            cover_path VARCHAR(255),
+            file_path VARCHAR(255) NOT NULL,
+            last_read DATETIME DEFAULT CURRENT_TIMESTAMP,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chapters (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            book_id INT NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            href VARCHAR(255) NOT NULL,
+            order_num INT NOT NULL,
+            summary TEXT,
+            translation TEXT,
+            mermaid_diagram TEXT,
+            html_content LONGTEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bookmarks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            book_id INT NOT NULL,
+            chapter_id INT NOT NULL,
+            cfi VARCHAR(255) NOT NULL,
+            text VARCHAR(255),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
+            FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE
+        )
+        '''
+    ], 'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title VARCHAR(255) NOT NULL,
+            author VARCHAR(255),
+            cover_path VARCHAR(255),
+            file_path VARCHAR(255) NOT NULL,
+            last_read DATETIME DEFAULT CURRENT_TIMESTAMP,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chapters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            title VARCHAR(255) NOT NULL,
+            href VARCHAR(255) NOT NULL,
+            order_num INTEGER NOT NULL,
+            summary TEXT,
+            translation BLOB,
+            mermaid_diagram TEXT,
+            html_content BLOB,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bookmarks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+            cfi VARCHAR(255) NOT NULL,
+            text VARCHAR(255),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+    ]}),
+    (2, '章节添加预先提取的纯文本、字数、token 数和内容哈希列', {'mysql': [
+        '''
+        ALTER TABLE chapters
+            ADD COLUMN plain_text LONGTEXT AFTER html_content,
+            ADD COLUMN char_count INT AFTER plain_text,
+            ADD COLUMN token_count INT AFTER char_count,
+            ADD COLUMN content_hash CHAR(64) AFTER token_count
+        '''
+    ], 'sqlite': [
+        'ALTER TABLE chapters ADD COLUMN plain_text BLOB',
+        'ALTER TABLE chapters ADD COLUMN char_count INTEGER',
+        'ALTER TABLE chapters ADD COLUMN token_count INTEGER',
+        'ALTER TABLE chapters ADD COLUMN content_hash CHAR(64)'
+    ]}),
+    (3, '为章节目录、书签列表和书架排序添加索引', [
+        # chapters WHERE book_id = ? ORDER BY order_num
+        'CREATE INDEX idx_chapters_book_order ON chapters (book_id, order_num)',
+        # bookmarks WHERE book_id = ? ORDER BY created_at DESC
+        'CREATE INDEX idx_bookmarks_book_created ON bookmarks (book_id, created_at)',
+        # books ORDER BY last_read DESC
+        'CREATE INDEX idx_books_last_read ON books (last_read)'
+    ]),
+    (4, '章节HTML、纯文本和翻译改为压缩后的二进制存储', {'mysql': [
+        # 已有的 UTF-8 文本按原字节保留，读取时作为未压缩数据处理
+        '''
+        ALTER TABLE chapters
+            MODIFY html_content LONGBLOB,
+            MODIFY plain_text LONGBLOB,
+            MODIFY translation MEDIUMBLOB
+        '''
+    ], 'sqlite': [
+        # SQLite 建表和添加 plain_text 时已使用 BLOB 列
+    ]}),
+    (5, '章节渲染结果改存到按内容哈希寻址的磁盘存储，表中只保存哈希', {'mysql': [
+        'ALTER TABLE chapters ADD COLUMN html_hash CHAR(64) AFTER html_content'
+    ], 'sqlite': [
+        'ALTER TABLE chapters ADD COLUMN html_hash CHAR(64)'
+    ]}),
+    (6, '记录每本书最后阅读的章节', [
+        'ALTER TABLE books ADD COLUMN last_chapter_id INT'
+    ]),
+    (7, '书架和书签列表的 keyset 分页索引', {'mysql': [
+        'CREATE INDEX idx_books_last_read_id ON books (last_read, id)',
+        'CREATE INDEX idx_books_created_id ON books (created_at, id)',
+        'CREATE INDEX idx_bookmarks_book_created_id ON bookmarks (book_id, created_at, id)',
+        'DROP INDEX idx_books_last_read ON books',
+        'DROP INDEX idx_bookmarks_book_created ON bookmarks'
+    ], 'sqlite': [
+        'CREATE INDEX idx_books_last_read_id ON books (last_read, id)',
+        'CREATE INDEX idx_books_created_id ON books (created_at, id)',
+        'CREATE INDEX idx_bookmarks_book_created_id ON bookmarks (book_id, created_at, id)',
+        'DROP INDEX idx_books_last_read',
+        'DROP INDEX idx_bookmarks_book_created'
+    ]}),
+    (8, '记录EPUB文件的内容哈希，批量导入时跳过已导入的文件', [
+        'ALTER TABLE books ADD COLUMN file_hash CHAR(64)',
+        'CREATE INDEX idx_books_file_hash ON books (file_hash)'
+    ]),
+    (9, '创建AI生成任务队列表 ai_jobs', {'mysql': [
+        '''
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            chapter_id INT NOT NULL,
+            operation VARCHAR(32) NOT NULL,
+            priority INT NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            worker VARCHAR(64),
+            lease_until DOUBLE,
+            error TEXT,
+            enqueued_at DOUBLE NOT NULL,
+            started_at DOUBLE,
+            finished_at DOUBLE,
+            UNIQUE KEY uniq_ai_jobs_chapter_operation (chapter_id, operation),
+            FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE
+        )
+        ''',
+        # 领取任务：status = 'pending' ORDER BY priority, id
+        'CREATE INDEX idx_ai_jobs_claim ON ai_jobs (status, priority, id)'
+    ], 'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+            operation VARCHAR(32) NOT NULL,
+            priority INTEGER NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker VARCHAR(64),
+            lease_until REAL,
+            error TEXT,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            UNIQUE (chapter_id, operation)
+        )
+        ''',
+        'CREATE INDEX idx_ai_jobs_claim ON ai_jobs (status, priority, id)'
+    ]}),
+    (10, '记录EPUB内资源路径对应的资源存储文件，旧章节的 /resource/ 请求不再扫描EPUB', {'mysql': [
+        '''
+        CREATE TABLE IF NOT EXISTS book_resources (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            book_id INT NOT NULL,
+            path VARCHAR(512) NOT NULL,
+            asset VARCHAR(255) NOT NULL,
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+        )
+        ''',
+        'CREATE INDEX idx_book_resources_path ON book_resources (path)'
+    ], 'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS book_resources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            path VARCHAR(512) NOT NULL,
+            asset VARCHAR(255) NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_book_resources_path ON book_resources (path)'
+    ]}),
+    (11, '记录入库时生成了哪些封面尺寸版本，书架列表不再逐本检查文件', [
+        'ALTER TABLE books ADD COLUMN cover_renditions VARCHAR(64)'
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(backend, cursor):
+    """读取当前数据库的结构版本，schema_version 表不存在时返回 0"""
+    try:
+        cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+    except Exception as e:
+        if backend.is_missing_table_error(e):
+            return 0
+        raise
+    row = cursor.fetchone()
+    return row['version'] or 0
+
+def migrate(backend, db):
+    """执行所有未执行的迁移，返回迁移后的结构版本"""
+    cursor = db.cursor()
+    
+    # 绝大多数启动只需要这一次版本检查
+    if get_schema_version(backend, cursor) >= LATEST_VERSION:
+        db.rollback()
+        return LATEST_VERSION
+    
+    with backend.migration_lock(db):
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        db.commit()
+        
+        # 拿到锁后重新检查，其他进程可能已经完成了迁移
+        current = get_schema_version(backend, cursor)
+        
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            if isinstance(statements, dict):
+                statements = statements[backend.name]
+            # MySQL 的 DDL 会隐式提交，每个迁移完成后立即记录版本
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                (version, description)
+            )
+            db.commit()
+            current = version
+        
+        return current
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import deque
+
+class PoolTimeout(Exception):
+    """在超时时间内没有可用的数据库连接"""
+    pass
+
+class _PooledConnection:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+class ConnectionPool:
+    """线程安全的数据库连接池
+
+    - min_size / max_size: 保持的最少连接数和允许的最多连接数
+    - timeout: 连接全部被借出时，借用方最多等待的秒数
+    - max_lifetime: 连接的最长存活时间，超过后归还时直接关闭
+    - idle_timeout: 空闲超过该时间且多于 min_size 的连接会被后台线程回收
+    - ping_interval: 借出前若连接已空闲超过该秒数，先 ping 一次做健康检查
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10,
+                 max_lifetime=3600, idle_timeout=300, ping_interval=5):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._closed = False
+        self._reaper = None
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'closed': 0,
+            'health_check_failures': 0
+        }
+
+        for _ in range(self.min_size):
+            self._idle.append(self._new_connection())
+
+    def _new_connection(self):
+        # 仅在初始化预热时调用，此时还没有其他线程使用连接池
+        pooled = _PooledConnection(self._connect())
+        self._size += 1
+        self._stats['created'] += 1
+        return pooled
+
+    def _close_connection(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, pooled, now):
+        return bool(self.max_lifetime) and now - pooled.created_at > self.max_lifetime
+
+    def _is_healthy(self, pooled, now):
+        if now - pooled.last_used < self.ping_interval:
+            return True
+        try:
+            pooled.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _start_reaper(self):
+        if self._reaper is not None or not self.idle_timeout:
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name='db-pool-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(self.idle_timeout / 2, 1)
+        while not self._closed:
+            time.sleep(interval)
+            self.reap()
+
+    def reap(self):
+        """关闭空闲过久或超过最长存活时间的连接，保留至少 min_size 个"""
+        now = time.monotonic()
+        to_close = []
+        with self._lock:
+            keep = deque()
+            for pooled in self._idle:
+                idle_too_long = now - pooled.last_used > self.idle_timeout
+                if self._is_expired(pooled, now) or (idle_too_long and self._size > self.min_size):
+                    to_close.append(pooled)
+                    self._size -= 1
+                    self._stats['closed'] += 1
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            if to_close:
+                self._available.notify(len(to_close))
+        for pooled in to_close:
+            self._close_connection(pooled)
+
+    def acquire(self):
+        """借出一个连接，必要时新建或等待其他请求归还"""
+        self._start_reaper()
+        deadline = None
+        waited = False
+        wait_start = time.monotonic()
+
+        while True:
+            pooled = None
+            create = False
+            with self._lock:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                        deadline = wait_start + self.timeout
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available within {self.timeout}s")
+                    self._available.wait(remaining)
+                if self._idle:
+                    # 后进先出，优先复用最近使用过的连接，让多余的连接自然空闲被回收
+                    pooled = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    pooled = _PooledConnection(self._connect())
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._available.notify()
+                    raise
+                with self._lock:
+                    self._stats['created'] += 1
+            else:
+                now = time.monotonic()
+                expired = self._is_expired(pooled, now)
+                if expired or not self._is_healthy(pooled, now):
+                    self._close_connection(pooled)
+                    with self._lock:
+                        self._size -= 1
+                        self._stats['closed'] += 1
+                        if not expired:
+                            self._stats['health_check_failures'] += 1
+                        self._available.notify()
+                    continue
+
+            with self._lock:
+                self._in_use[id(pooled.conn)] = pooled
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['wait_time'] += time.monotonic() - wait_start
+            return pooled.conn
+
+    def release(self, conn, discard=False):
+        """归还连接；未提交的事务会被回滚，出错或过期的连接直接关闭"""
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            # 不属于本连接池（例如 fork 之前借出的），直接关闭
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+
+        if not discard:
+            try:
+                # 结束请求中可能遗留的事务，保证下一个请求读到最新数据
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        if discard or self._closed or self._is_expired(pooled, now):
+            self._close_connection(pooled)
+            with self._lock:
+                self._size -= 1
+                self._stats['closed'] += 1
+                self._available.notify()
+            return
+
+        pooled.last_used = now
+        with self._lock:
+            self._idle.append(pooled)
+            self._available.notify()
+
+    def stats(self):
+        """返回连接池计数器的快照"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = len(self._in_use)
+        return snapshot
+
+    def close(self):
+        """关闭连接池及其所有空闲连接"""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+            self._available.notify_all()
+        for pooled in idle:
+            self._close_connection(pooled)
@@ -0,0 +1,118 @@
+"""写后缓冲（write-behind）
+
+把高频的小更新先合并在内存中，按固定间隔或积累到一定数量时一次性批量写入数据库，
+使数据库的写入频率与请求量无关。同一个键在两次写入之间的多次更新会被合并为一次。
+"""
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindBuffer:
+    """按键合并更新、由后台线程定期批量写入的缓冲区
+
+    - flush: 写入函数，参数为 {key: value} 字典
+    - interval: 两次写入之间的最长间隔（秒），为 0 时每次更新立即写入
+    - max_pending: 待写入的键达到该数量时立即触发写入
+    - merge: 可选，merge(old, new) 合并同一个键上尚未写入的两次更新
+    - max_retries: 一个键连续写入失败的次数达到该值时丢弃它的更新
+
+    整批写入失败时逐个键重试，一个键上的坏数据不会阻塞其他键的写入。
+    """
+
+    def __init__(self, flush, interval=5, max_pending=500, merge=None, name='write-behind', max_retries=3):
+        self._flush = flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self._merge = merge
+        self.name = name
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._failures = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def _start(self):
+        # 在首次使用时才启动后台线程，保证在 fork 出的 worker 进程中也能正常工作
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.stop)
+            self._atexit_registered = True
+
+    def put(self, key, value):
+        if not self.interval:
+            self._flush({key: value})
+            return
+
+        with self._lock:
+            if self._merge and key in self._pending:
+                value = self._merge(self._pending[key], value)
+            self._pending[key] = value
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None or not self._thread.is_alive():
+                self._start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """立即写入所有待写入的更新"""
+        with self._flush_lock:
+            with self._lock:
+                items, self._pending = self._pending, {}
+            if not items:
+                return
+            try:
+                self._flush(items)
+            except Exception as e:
+                logger.error(f"Error flushing {self.name} buffer: {str(e)}")
+                self._flush_each(items)
+            else:
+                self._failures.clear()
+
+    def _flush_each(self, items):
+        # 整批写入失败后逐个键写入，只把仍然失败的键放回缓冲区
+        for key, value in items.items():
+            try:
+                self._flush({key: value})
+            except Exception as e:
+                failures = self._failures.get(key, 0) + 1
+                if failures >= self.max_retries:
+                    logger.error(f"Dropping {self.name} update for {key!r} after {failures} failed writes: {str(e)}")
+                    self._failures.pop(key, None)
+                    continue
+                self._failures[key] = failures
+                # 放回缓冲区，已有更新的键以新值为准
+                with self._lock:
+                    if key in self._pending and self._merge:
+                        self._pending[key] = self._merge(value, self._pending[key])
+                    else:
+                        self._pending.setdefault(key, value)
+            else:
+                self._failures.pop(key, None)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        """停止后台线程并写入剩余的更新，应在进程退出前调用"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.flush()
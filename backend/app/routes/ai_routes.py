@@ -1,97 +1,72 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for
 from app.services.ai_service import AIService
+from app.services.ai_job_service import (PRIORITIES, PRIORITY_NAMES, AI_OPERATIONS, job_to_dict, get_job_result,
+                                         wait_for_job)
+from app.models.ai_job import AIJob
 from app.models.book import Chapter, Book
-from app.services.epub_service import EpubService
-import os
-from bs4 import BeautifulSoup
-import traceback
 
 ai_bp = Blueprint('ai', __name__)
 
-@ai_bp.route('/summarize/chapter/<int:chapter_id>', methods=['GET'])
-def summarize_chapter(chapter_id):
-    # 获取章节信息
-    chapter = Chapter.get_by_id(chapter_id)
-    
-    if not chapter:
-        return jsonify({'error': 'Chapter not found'}), 404
+def parse_wait():
+    """请求等待任务完成的秒数（?wait=），不超过 AI_JOB_MAX_WAIT"""
+    try:
+        wait = float(request.args.get('wait', current_app.config.get('AI_JOB_WAIT', 0)))
+    except ValueError:
+        return 0
+    return max(0, min(wait, current_app.config.get('AI_JOB_MAX_WAIT', 30)))
+
+def job_response(job):
+    """任务完成时返回生成结果（200），失败时返回错误（500），否则返回任务状态（202）"""
+    key = AI_OPERATIONS[job['operation']][3]
+    if job['status'] == 'done':
+        return jsonify({key: get_job_result(job), 'job': job_to_dict(job)})
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error'] or 'AI job failed', 'job': job_to_dict(job)}), 500
+    
+    response = jsonify({'job': job_to_dict(job), 'status_url': url_for('ai.get_job', job_id=job['id'])})
+    response.status_code = 202
+    response.headers['Retry-After'] = str(current_app.config.get('AI_JOB_RETRY_AFTER', 2))
+    return response
+
+def chapter_artifact(chapter_id, operation):
+    """返回章节已生成的结果；尚未生成时排队生成任务
     
-    # 检查是否已有总结
-    if chapter.get('summary'):
-        return jsonify({'summary': chapter['summary']})
+    生成在独立的工作进程中执行，不占用Web线程：默认立即返回 202 和任务状态，
+    客户端按 status_url 轮询；带 ?wait=秒数 时在返回前最多等待这么久。
+    ?priority= 可以是 interactive（默认）、background 或 bulk。
+    """
+    field, _, _, key = AI_OPERATIONS[operation]
     
-    # 获取书籍信息
-    book = Book.get_by_id(chapter['book_id'])
+    # 只读取结果，不读取章节全文
+    chapter = Chapter.get_artifact(chapter_id, field, with_text=False)
     
-    if not book:
-        return jsonify({'error': 'Book not found'}), 404
+    if not chapter:
+        return jsonify({'error': 'Chapter not found'}), 404
     
-    try:
-        # 尝试从HTML内容中提取文本
-        if chapter.get('html_content'):
-            soup = BeautifulSoup(chapter['html_content'], 'html.parser')
-            
-            # 提取正文内容
-            body = soup.find('body')
-            if body:
-                # 移除脚本和样式
-                for script in body.find_all(['script', 'style']):
-                    script.decompose()
-                
-                # 获取所有文本，保留段落结构
-                paragraphs = []
-                for p in body.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                    text = p.get_text().strip()
-                    if text:
-                        paragraphs.append(text)
-                
-                # 如果没有找到段落，尝试获取所有文本
-                if not paragraphs:
-                    text = body.get_text(separator='\n').strip()
-                    paragraphs = [line.strip() for line in text.split('\n') if line.strip()]
-                
-                content = '\n\n'.join(paragraphs)
-            else:
-                # 尝试直接从HTML中提取文本
-                text = soup.get_text(separator='\n').strip()
-                paragraphs = [line.strip() for line in text.split('\n') if line.strip()]
-                
-                if paragraphs:
-                    content = '\n\n'.join(paragraphs)
-                else:
-                    # 如果无法从HTML中提取文本，则从EPUB文件中获取
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], book['file_path'])
-                    
-                    if not os.path.exists(file_path):
-                        return jsonify({'error': 'Book file not found'}), 404
-                    
-                    with EpubService(file_path) as epub:
-                        content = epub.get_chapter_content(chapter['href'])
-        else:
-            # 如果没有HTML内容，则从EPUB文件中获取
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], book['file_path'])
-            
-            if not os.path.exists(file_path):
-                return jsonify({'error': 'Book file not found'}), 404
-            
-            with EpubService(file_path) as epub:
-                content = epub.get_chapter_content(chapter['href'])
-        
-        # 记录提取的内容长度
-        current_app.logger.info(f"Extracted content length: {len(content)}")
-        
-        # 使用AI服务生成总结
-        ai_service = AIService()
-        summary = ai_service.summarize_text(content)
-        
-        # 保存总结到数据库
-        Chapter.update_summary(chapter_id, summary)
-        
-        return jsonify({'summary': summary})
-    except Exception as e:
-        current_app.logger.error(f"Error summarizing chapter: {str(e)}")
-        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({'error': str(e)}), 500
+    # 检查是否已生成
+    if chapter.get(field):
+        return jsonify({key: chapter[field]})
+    
+    # 入库时已确认章节没有文本（char_count 为 NULL 表示尚未提取）
+    if chapter['char_count'] == 0:
+        return jsonify({'error': 'Chapter text is not available'}), 422
+    
+    priority = request.args.get('priority', 'interactive')
+    if priority not in PRIORITIES:
+        return jsonify({'error': f"Unknown priority: {priority}"}), 400
+    
+    job = AIJob.enqueue(chapter_id, operation, PRIORITIES[priority])
+    wait = parse_wait()
+    if wait:
+        job = wait_for_job(job['id'], wait)
+        # 等待期间章节被删除
+        if not job:
+            return jsonify({'error': 'Chapter not found'}), 404
+    return job_response(job)
+
+@ai_bp.route('/summarize/chapter/<int:chapter_id>', methods=['GET'])
+def summarize_chapter(chapter_id):
+    return chapter_artifact(chapter_id, 'summary')
 
 @ai_bp.route('/summarize/text', methods=['POST'])
 def summarize_text():
@@ -116,84 +91,61 @@ def summarize_text():
 
 @ai_bp.route('/translate/chapter/<int:chapter_id>', methods=['GET'])
 def translate_chapter(chapter_id):
-    # 获取章节信息
-    chapter = Chapter.get_by_id(chapter_id)
-    
-    if not chapter:
-        return jsonify({'error': 'Chapter not found'}), 404
-    
-    # 检查是否已有翻译
-    if chapter.get('translation'):
-        return jsonify({'translation': chapter['translation']})
-    
-    # 获取书籍信息
-    book = Book.get_by_id(chapter['book_id'])
-    
-    if not book:
-        return jsonify({'error': 'Book not found'}), 404
-    
-    # 获取EPUB文件路径
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], book['file_path'])
-    
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Book file not found'}), 404
-    
-    try:
-        # 使用EpubService获取章节内容
-        with EpubService(file_path) as epub:
-            content = epub.get_chapter_content(chapter['href'])
-            
-            # 使用AI服务生成翻译
-            ai_service = AIService()
-            translation = ai_service.translate_text(content)
-            
-            # 保存翻译到数据库
-            Chapter.update_translation(chapter_id, translation)
-            
-            return jsonify({'translation': translation})
-    except Exception as e:
-        current_app.logger.error(f"Error translating chapter: {str(e)}")
-        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({'error': str(e)}), 500
+    return chapter_artifact(chapter_id, 'translation')
 
 @ai_bp.route('/diagram/chapter/<int:chapter_id>', methods=['GET'])
 def generate_chapter_diagram(chapter_id):
-    # 获取章节信息
-    chapter = Chapter.get_by_id(chapter_id)
-    
-    if not chapter:
-        return jsonify({'error': 'Chapter not found'}), 404
-    
-    # 检查是否已有图表
-    if chapter.get('mermaid_diagram'):
-        return jsonify({'diagram': chapter['mermaid_diagram']})
-    
-    # 获取书籍信息
-    book = Book.get_by_id(chapter['book_id'])
-    
-    if not book:
+    return chapter_artifact(chapter_id, 'diagram')
+
+@ai_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态，?wait=秒数 时等待任务完成后再返回"""
+    job = AIJob.get_by_id(job_id)
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    wait = parse_wait()
+    if wait and job['status'] not in ('done', 'failed'):
+        job = wait_for_job(job_id, wait)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+    return job_response(job)
+
+@ai_bp.route('/books/<int:book_id>/jobs', methods=['POST'])
+def enqueue_book_jobs(book_id):
+    """为一本书中尚未生成结果的章节批量排队
+    
+    请求体：{"operations": ["summary", "translation", "diagram"], "priority": "bulk"}，
+    operations 默认只有 summary，priority 默认为 bulk，排在阅读器的请求之后执行。
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations') or ['summary']
+    priority = data.get('priority', 'bulk')
+    
+    if not isinstance(operations, list) or any(operation not in AI_OPERATIONS for operation in operations):
+        return jsonify({'error': f"operations must be a list of: {', '.join(AI_OPERATIONS)}"}), 400
+    if priority not in PRIORITIES:
+        return jsonify({'error': f"Unknown priority: {priority}"}), 400
+    
+    if not Book.get_by_id(book_id):
         return jsonify({'error': 'Book not found'}), 404
     
-    # 获取EPUB文件路径
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], book['file_path'])
-    
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Book file not found'}), 404
+    chapters = Chapter.get_toc(book_id)
+    # 目录中的 has_* 标记对应各操作的结果是否已生成
+    flags = {'summary': 'has_summary', 'translation': 'has_translation', 'diagram': 'has_diagram'}
+    queued = {}
+    for operation in operations:
+        chapter_ids = [chapter['id'] for chapter in chapters
+                       if not chapter.get(flags[operation]) and chapter['char_count'] != 0]
+        queued[operation] = len(AIJob.enqueue_many(chapter_ids, operation, PRIORITIES[priority])) if chapter_ids else 0
     
-    try:
-        # 使用EpubService获取章节内容
-        with EpubService(file_path) as epub:
-            content = epub.get_chapter_content(chapter['href'])
-            
-            # 使用AI服务生成图表
-            ai_service = AIService()
-            diagram = ai_service.generate_mermaid_diagram(content)
-            
-            # 保存图表到数据库
-            Chapter.update_mermaid_diagram(chapter_id, diagram)
-            
-            return jsonify({'diagram': diagram})
-    except Exception as e:
-        current_app.logger.error(f"Error generating chapter diagram: {str(e)}")
-        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+    return jsonify({'book_id': book_id, 'priority': priority, 'queued': queued}), 202
+
+@ai_bp.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    """按状态和优先级统计队列中的任务数"""
+    stats = {}
+    for row in AIJob.get_stats():
+        stats.setdefault(row['status'], {})[PRIORITY_NAMES.get(row['priority'], str(row['priority']))] = row['jobs']
+    return jsonify(stats)
@@ -1,113 +1,229 @@
 import os
 import traceback
-from flask import Blueprint, request, jsonify, current_app, send_from_directory, send_file
+from flask import Blueprint, Response, request, jsonify, current_app, send_from_directory, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import uuid
-from app.models.book import Book, Chapter, Bookmark
-from app.services.epub_service import EpubService
+import gzip
+import hashlib
+from app.models.book import Book, BookResource, Chapter, Bookmark, BOOK_LIST_FIELDS, BOOK_SORT_KEYS, BOOKMARK_LIST_FIELDS
+from app.services.epub_service import EpubService, READER_STYLE, READER_STYLE_VERSION
+from app.services.ingest_service import ingest_epub
+from app.services.upload_service import InvalidUpload, receive_epub_upload
+from app.services.blob_store import get_blob_store, get_asset_store, asset_mimetype, ENCODING_SUFFIXES
+from app.services.search_service import get_search_index, make_snippet
+from app.services.image_service import COVER_RENDITIONS, cover_rendition_filename
+from app.utils.compression import is_gzip, decompress_text
+from app.utils.http_compression import available_encodings, is_compressible, negotiate, precompress
+from app.utils.pagination import (MAX_PAGE_SIZE, decode_cursor, encode_cursor, fetch_all_pages, is_paginated,
+                                  parse_fields, parse_page_size)
 import zipfile
+from contextlib import ExitStack
 
 book_bp = Blueprint('book', __name__)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'epub'
+# 按内容版本寻址的URL（带 ?v= 或文件名本身唯一）内容不会变化，可以让浏览器和代理长期缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 没有版本号的URL允许缓存，但每次使用前都要用 ETag 重新验证，未变化时只返回 304
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+def apply_cache_policy(response, immutable):
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return response
+
+def is_not_modified(etag):
+    """请求的 If-None-Match 已经包含该 ETag（或其压缩变体）时，可以在做任何实际工作之前直接返回 304"""
+    return any(candidate in request.if_none_match
+               for candidate in [etag] + [f"{etag}-{encoding}" for encoding in available_encodings()])
+
+def not_modified_response(etag, immutable=False):
+    response = Response(status=304)
+    encoding = negotiate(request.accept_encodings)
+    if encoding and f"{etag}-{encoding}" in request.if_none_match:
+        etag = f"{etag}-{encoding}"
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return apply_cache_policy(response, immutable)
+
+def precompressed_response(data, variants, mimetype, etag, immutable=False):
+    """返回内存中已经预压缩好的静态内容，variants 为 precompress() 的结果"""
+    encoding = negotiate(request.accept_encodings, tuple(variants))
+    if encoding:
+        response = Response(variants[encoding], mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        etag = f"{etag}-{encoding}"
+    else:
+        response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return apply_cache_policy(response, immutable)
+
+def blob_response(content_hash, ext, mimetype, immutable=False):
+    """从内容存储中返回预压缩的静态内容
+    
+    按 Accept-Encoding 选择磁盘上已有的 brotli 或 gzip 变体原样返回
+    （由WSGI服务器通过sendfile零拷贝发送），不接受压缩的客户端在读取时流式解压。
+    ETag 由内容哈希和编码得出，重复访问时返回 304；文件名为未压缩内容的名称（<hash>.html）。
+    """
+    blob_store = get_blob_store()
+    
+    for encoding in available_encodings():
+        path = blob_store.compressed_path(content_hash, ext, encoding)
+        if path and request.accept_encodings[encoding] > 0:
+            response = send_file(path, mimetype=mimetype, etag=f"{content_hash}-{encoding}",
+                                 download_name=content_hash + ext)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_file(blob_store.open_decompressed(content_hash, ext), mimetype=mimetype, etag=content_hash,
+                             download_name=content_hash + ext)
+    
+    response.vary.add('Accept-Encoding')
+    return apply_cache_policy(response, immutable)
+
+def blob_html_response(html_hash, immutable=False):
+    """从内容存储中返回渲染后的章节HTML"""
+    return blob_response(html_hash, '.html', 'text/html', immutable)
+
+def html_response(html_content):
+    """返回数据库中保存的旧式章节HTML；存储的是gzip数据且客户端支持时直接返回压缩字节"""
+    etag = hashlib.sha256(html_content).hexdigest()
+    
+    if is_gzip(html_content) and request.accept_encodings['gzip'] > 0:
+        response = Response(bytes(html_content), mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gzip'
+    else:
+        response = Response(decompress_text(html_content), mimetype='text/html')
+    
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    apply_cache_policy(response, False)
+    return response.make_conditional(request)
 
 @book_bp.route('/upload', methods=['POST'])
 def upload_book():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+    # 创建唯一文件名
+    filename = f"{uuid.uuid4()}.epub"
+    upload_folder = current_app.config['UPLOAD_FOLDER']
     
-    file = request.files['file']
+    # 确保上传文件夹存在
+    os.makedirs(upload_folder, exist_ok=True)
+    os.makedirs(current_app.config['COVER_FOLDER'], exist_ok=True)
     
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+    file_path = os.path.join(upload_folder, filename)
     
-    if file and allowed_file(file.filename):
-        # 创建唯一文件名
-        filename = f"{uuid.uuid4()}.epub"
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        
-        # 确保上传文件夹存在
-        os.makedirs(upload_folder, exist_ok=True)
-        os.makedirs(current_app.config['COVER_FOLDER'], exist_ok=True)
-        
-        file_path = os.path.join(upload_folder, filename)
-        file.save(file_path)
-        
-        try:
-            # 解析EPUB文件
-            with EpubService(file_path) as epub:
-                metadata = epub.get_metadata()  # 先获取元数据，这会设置 cover_path
-                chapters = epub.get_chapters()
-                
-                # 打印完整的EPUB解析结果
-                current_app.logger.info("=== EPUB文件解析结果 ===")
-                current_app.logger.info(f"标题: {metadata.get('title', 'Unknown Title')}")
-                current_app.logger.info(f"作者: {metadata.get('author', 'Unknown Author')}")
-                current_app.logger.info(f"封面图片: {'已找到' if metadata.get('cover_path') else '未找到'}")
-                current_app.logger.info(f"\n总章节数: {len(chapters)}")
-                current_app.logger.info("章节列表:")
-                for i, chapter in enumerate(chapters):
-                    current_app.logger.info(f"第{i+1}章: {chapter['title']}")
-                    current_app.logger.info(f"  链接: {chapter['href']}")
-                current_app.logger.info("=== 解析结果结束 ===")
-                
-                # 保存封面图片
-                cover_filename = epub.save_cover_image(current_app.config['COVER_FOLDER'])
-                cover_path = cover_filename if cover_filename else None
-                
-                # 保存书籍信息到数据库
-                book_id = Book.create(
-                    title=metadata.get('title', 'Unknown Title'),
-                    author=metadata.get('author', 'Unknown Author'),
-                    cover_path=cover_path,
-                    file_path=filename
-                )
-                
-                # 保存章节信息
-                chapter_ids = Chapter.create_many(book_id, chapters)
-                
-                # 保存章节HTML内容
-                try:
-                    for i, chapter_id in enumerate(chapter_ids):
-                        try:
-                            html_content = epub.get_chapter_html(chapters[i]['href'])
-                            Chapter.update_html_content(chapter_id, html_content)
-                        except Exception as e:
-                            current_app.logger.error(f"Error saving HTML content for chapter {i+1}: {str(e)}")
-                except Exception as e:
-                    current_app.logger.error(f"Error in HTML content saving loop: {str(e)}")
-                
-                return jsonify({
-                    'id': book_id,
-                    'title': metadata.get('title'),
-                    'author': metadata.get('author'),
-                    'cover': cover_path,
-                    'chapters': len(chapters)
-                }), 201
-                
-        except Exception as e:
-            # 如果处理失败，删除上传的文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            current_app.logger.error(f"Error processing EPUB file: {str(e)}")
-            current_app.logger.error(f"Traceback: {traceback.format_exc()}")
-            return jsonify({'error': str(e)}), 500
+    # 边接收边写入并计算哈希，不是合格的EPUB时尽早拒绝（不读取剩余的请求正文）
+    try:
+        upload = receive_epub_upload(file_path)
+    except InvalidUpload as e:
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': f"File too large. Maximum size is {current_app.config['MAX_CONTENT_LENGTH']} bytes."}), 413
     
-    return jsonify({'error': 'Invalid file format. Only EPUB files are allowed.'}), 400
+    try:
+        # 解析EPUB文件并入库
+        book = ingest_epub(file_path, upload.sha256)
+        return jsonify(book), 201
+    except Exception as e:
+        # 如果处理失败，删除上传的文件
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        current_app.logger.error(f"Error processing EPUB file: {str(e)}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+# 封面相关的派生字段
+COVER_URL_FIELDS = ('cover_url',) + tuple(f'cover_{name}_url' for name in COVER_RENDITIONS)
+
+def add_cover_urls(book):
+    """添加封面原图和各尺寸版本的URL；没有生成对应版本（如早期上传的书）时为 None
+    
+    已生成的版本在入库时记录在 cover_renditions 中；记录之前入库的书由 backfill_cover_renditions.py 补记。
+    """
+    cover_path = book.get('cover_path')
+    book['cover_url'] = f"/api/books/covers/{cover_path}" if cover_path else None
+    renditions = book.get('cover_renditions')
+    available = renditions.split(',') if cover_path and renditions else []
+    for name in COVER_RENDITIONS:
+        url = f"/api/books/covers/{cover_rendition_filename(cover_path, name)}" if name in available else None
+        book[f'cover_{name}_url'] = url
+    return book
+
+def page_response(rows, next_after, fields):
+    """列表分页响应：只保留请求的字段，并附上下一页游标（没有下一页时为 None）
+
+    不分页的请求（没有 limit 和 cursor）照旧返回数组。
+    """
+    if fields is not None:
+        rows = [{field: row.get(field) for field in fields} for row in rows]
+    if not is_paginated(request.args):
+        return jsonify(rows)
+    return jsonify({
+        'items': rows,
+        'next_cursor': encode_cursor(*next_after) if next_after else None
+    })
 
 @book_bp.route('/', methods=['GET'])
 def get_books():
-    books = Book.get_all()
+    """分页读取书架：?limit=&cursor=&sort=last_read|created_at&fields=id,title,cover_url"""
+    sort_key = request.args.get('sort', 'last_read')
+    if sort_key not in BOOK_SORT_KEYS:
+        return jsonify({'error': f'Invalid sort: {sort_key}'}), 400
+    
+    try:
+        fields = parse_fields(request.args.get('fields'), BOOK_LIST_FIELDS + COVER_URL_FIELDS)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    columns = BOOK_LIST_FIELDS
+    if fields is not None:
+        columns = [field for field in fields if field not in COVER_URL_FIELDS]
+        if any(field in COVER_URL_FIELDS for field in fields):
+            columns += [column for column in ('cover_path', 'cover_renditions') if column not in columns]
+    
+    if is_paginated(request.args):
+        books, next_after = Book.get_page(sort_key, after, parse_page_size(request.args.get('limit', type=int)), columns)
+    else:
+        books, next_after = fetch_all_pages(lambda after: Book.get_page(sort_key, after, MAX_PAGE_SIZE, columns)), None
     
     # 添加封面URL
-    for book in books:
-        if book['cover_path']:
-            book['cover_url'] = f"/api/books/covers/{book['cover_path']}"
-        else:
-            book['cover_url'] = None
+    if fields is None or any(field in COVER_URL_FIELDS for field in fields):
+        for book in books:
+            add_cover_urls(book)
     
-    return jsonify(books)
+    return page_response(books, next_after, fields)
+
+@book_bp.route('/search', methods=['GET'])
+def search_books():
+    """在整个书库（或 book_id 指定的书）中全文检索章节"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    book_id = request.args.get('book_id', type=int)
+    
+    hits = get_search_index().search(query, limit=limit, book_id=book_id)
+    rows = Chapter.get_search_hits([chapter_id for _, _, chapter_id in hits])
+    
+    results = []
+    for score, hit_book_id, chapter_id in hits:
+        row = rows.get(chapter_id)
+        if not row:
+            continue
+        results.append({
+            'book_id': hit_book_id,
+            'book_title': row['book_title'],
+            'chapter_id': chapter_id,
+            'chapter_title': row['title'],
+            'score': round(score, 4),
+            'snippet': make_snippet(row['plain_text'], query)
+        })
+    
+    return jsonify({'query': query, 'results': results})
 
 @book_bp.route('/<int:book_id>', methods=['GET'])
 def get_book(book_id):
@@ -116,17 +232,17 @@ def get_book(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
     
-    # 更新最后阅读时间
-    Book.update_last_read(book_id)
+    # 记录最后阅读时间（写后缓冲，不在请求中提交）
+    Book.record_reading_progress(book_id)
     
-    # 获取章节信息
-    chapters = Chapter.get_by_book_id(book_id)
+    # 获取章节目录（不包含章节正文等大字段）
+    chapters = Chapter.get_toc(book_id)
     
     # 添加封面URL
-    if book['cover_path']:
-        book['cover_url'] = f"/api/books/covers/{book['cover_path']}"
-    else:
-        book['cover_url'] = None
+    add_cover_urls(book)
+    
+    # EPUB文件的版本化地址，可以被浏览器永久缓存
+    book['content_url'] = f"/api/books/{book_id}/content?v={os.path.splitext(book['file_path'])[0]}"
     
     book['chapters'] = chapters
     
@@ -140,8 +256,20 @@ def update_last_read(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
     
-    # 更新最后阅读时间
-    Book.update_last_read(book_id)
+    # 更新最后阅读时间和可选的当前章节
+    data = request.get_json(silent=True) or {}
+    chapter_id = data.get('chapter_id')
+    
+    if chapter_id is not None:
+        # 进度先进入写后缓冲，非法的章节ID会让整批写入失败，必须在这里拒绝
+        if not isinstance(chapter_id, int) or isinstance(chapter_id, bool):
+            return jsonify({'error': 'chapter_id must be an integer'}), 400
+        
+        chapter = Chapter.get_by_id(chapter_id)
+        if not chapter or chapter['book_id'] != book_id:
+            return jsonify({'error': 'Chapter not found in this book'}), 400
+    
+    Book.record_reading_progress(book_id, chapter_id)
     
     return jsonify({'message': 'Last read time updated successfully'})
 
@@ -154,7 +282,7 @@ def get_chapter(book_id, chapter_id):
         return jsonify({'error': 'Book not found'}), 404
     
     # 验证章节存在
-    chapter = Chapter.get_by_id(chapter_id)
+    chapter = Chapter.get_by_id(chapter_id, 'summary')
     
     if not chapter or chapter['book_id'] != book_id:
         return jsonify({'error': 'Chapter not found'}), 404
@@ -174,7 +302,13 @@ def get_temp_file(filename):
 
 @book_bp.route('/covers/<path:filename>')
 def get_cover(filename):
-    return send_from_directory(current_app.config['COVER_FOLDER'], filename)
+    # 封面文件名在上传时随机生成，文件名本身就是版本号
+    etag = os.path.splitext(os.path.basename(filename))[0]
+    if is_not_modified(etag):
+        return not_modified_response(etag, immutable=True)
+    response = send_from_directory(current_app.config['COVER_FOLDER'], filename, etag=etag,
+                                   mimetype=asset_mimetype(os.path.splitext(filename)[1]))
+    return apply_cache_policy(response, True)
 
 @book_bp.route('/<int:book_id>', methods=['DELETE'])
 def delete_book(book_id):
@@ -190,14 +324,21 @@ def delete_book(book_id):
     
     # 删除封面
     if book['cover_path']:
-        cover_path = os.path.join(current_app.config['COVER_FOLDER'], book['cover_path'])
-        if os.path.exists(cover_path):
-            os.remove(cover_path)
+        cover_filenames = [book['cover_path']]
+        cover_filenames += [cover_rendition_filename(book['cover_path'], name) for name in COVER_RENDITIONS]
+        for cover_filename in cover_filenames:
+            cover_path = os.path.join(current_app.config['COVER_FOLDER'], cover_filename)
+            if os.path.exists(cover_path):
+                os.remove(cover_path)
     
     # 从数据库中删除
     success = Book.delete(book_id)
     
     if success:
+        try:
+            get_search_index().remove_book(book_id)
+        except Exception as e:
+            current_app.logger.error(f"Error removing book {book_id} from search index: {str(e)}")
         return jsonify({'message': 'Book deleted successfully'})
     else:
         return jsonify({'error': 'Failed to delete book'}), 500
@@ -243,10 +384,25 @@ def get_bookmarks(book_id):
     if not book:
         return jsonify({'error': 'Book not found'}), 404
     
+    try:
+        fields = parse_fields(request.args.get('fields'), BOOKMARK_LIST_FIELDS)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     # 获取书签
-    bookmarks = Bookmark.get_by_book_id(book_id)
+    columns = fields or BOOKMARK_LIST_FIELDS
+    if is_paginated(request.args):
+        bookmarks, next_after = Bookmark.get_page_by_book_id(
+            book_id, after, parse_page_size(request.args.get('limit', type=int)), columns
+        )
+    else:
+        bookmarks, next_after = fetch_all_pages(
+            lambda after: Bookmark.get_page_by_book_id(book_id, after, MAX_PAGE_SIZE, columns)
+        ), None
     
-    return jsonify(bookmarks)
+    return page_response(bookmarks, next_after, fields)
 
 @book_bp.route('/<int:book_id>/bookmarks/<int:bookmark_id>', methods=['DELETE'])
 def delete_bookmark(book_id, bookmark_id):
@@ -280,13 +436,114 @@ def get_book_content(book_id):
     # 添加调试日志
     current_app.logger.info(f"Serving EPUB file: {file_path}, filename: {filename}, size: {os.path.getsize(file_path)} bytes")
     
+    # EPUB文件名在上传时随机生成且不会修改，带 ?v=<文件名> 请求时可以永久缓存
+    etag = os.path.splitext(filename)[0]
+    immutable = request.args.get('v') == etag
+    if is_not_modified(etag):
+        return not_modified_response(etag, immutable)
+    
     # 确保设置正确的MIME类型
-    return send_from_directory(
+    response = send_from_directory(
         os.path.dirname(file_path),
         filename,
         as_attachment=False,
-        mimetype='application/epub+zip'
+        mimetype='application/epub+zip',
+        etag=etag
     )
+    return apply_cache_policy(response, immutable)
+
+# 章节批量读取的数量和字节预算限制
+BUNDLE_MAX_CHAPTERS = 50
+BUNDLE_DEFAULT_BYTES = 2 * 1024 * 1024
+BUNDLE_MAX_BYTES = 16 * 1024 * 1024
+
+def parse_id_list(value):
+    """解析逗号分隔的ID列表，格式不正确时抛出 ValueError"""
+    return [int(item) for item in value.split(',') if item.strip()]
+
+@book_bp.route('/<int:book_id>/chapters/bundle', methods=['GET'])
+def get_chapter_bundle(book_id):
+    """一次返回多个章节的HTML或纯文本，供阅读器预取后续章节
+    
+    ?ids=1,2,3 或 ?start=<order_num>&count=N 选择章节，format=html|text，
+    max_bytes 为响应内容的字节预算：按章节顺序放入，超出预算的章节ID在 remaining 中返回
+    （至少返回一章）。书籍验证和章节读取在同一个查询中完成。
+    """
+    content_format = request.args.get('format', 'html')
+    if content_format not in ('html', 'text'):
+        return jsonify({'error': f'Invalid format: {content_format}'}), 400
+    
+    try:
+        chapter_ids = parse_id_list(request.args['ids']) if 'ids' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Invalid ids'}), 400
+    start = request.args.get('start', type=int)
+    count = min(max(request.args.get('count', 5, type=int), 1), BUNDLE_MAX_CHAPTERS)
+    if chapter_ids is None and start is None:
+        return jsonify({'error': 'Either ids or start is required'}), 400
+    if chapter_ids is not None and len(chapter_ids) > BUNDLE_MAX_CHAPTERS:
+        return jsonify({'error': f'At most {BUNDLE_MAX_CHAPTERS} chapters per request'}), 400
+    max_bytes = min(max(request.args.get('max_bytes', BUNDLE_DEFAULT_BYTES, type=int), 1), BUNDLE_MAX_BYTES)
+    
+    field = 'html_content' if content_format == 'html' else 'plain_text'
+    rows = Chapter.get_bundle(book_id, field, chapter_ids=chapter_ids, start=start, count=count)
+    
+    if rows is None:
+        return jsonify({'error': 'Book not found'}), 404
+    
+    chapters = {}
+    order = []
+    remaining = []
+    used = 0
+    blob_store = get_blob_store()
+    
+    # 尚未渲染或提取纯文本的章节需要打开EPUB，整个请求最多打开一次
+    with ExitStack() as stack:
+        epub = None
+        for row in rows:
+            if remaining:
+                remaining.append(row['id'])
+                continue
+            
+            if content_format == 'html' and row['html_hash'] and blob_store.exists(row['html_hash'], '.html.gz'):
+                with blob_store.open_decompressed(row['html_hash'], '.html') as f:
+                    content = f.read().decode('utf-8')
+            elif content_format == 'html' and row['html_content']:
+                content = decompress_text(row['html_content'])
+            elif content_format == 'text' and row['plain_text'] is not None:
+                content = row['plain_text']
+            else:
+                if epub is None:
+                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], row['file_path'])
+                    epub = stack.enter_context(EpubService(file_path))
+                if content_format == 'html':
+                    content = epub.get_chapter_html(row['href'])
+                    row['html_hash'] = blob_store.put_html(content)
+                    Chapter.update_html_hash(row['id'], row['html_hash'])
+                else:
+                    text_record = epub.get_chapter_text(row['href'])
+                    Chapter.update_plain_text(row['id'], text_record)
+                    content = text_record['plain_text']
+            
+            size = len(content.encode('utf-8'))
+            if order and used + size > max_bytes:
+                remaining.append(row['id'])
+                continue
+            used += size
+            
+            chapter = {'title': row['title'], 'order_num': row['order_num'], 'content': content}
+            if content_format == 'html':
+                chapter['html_hash'] = row['html_hash']
+            chapters[str(row['id'])] = chapter
+            order.append(row['id'])
+    
+    return jsonify({
+        'book_id': book_id,
+        'format': content_format,
+        'order': order,
+        'chapters': chapters,
+        'remaining': remaining
+    })
 
 @book_bp.route('/<int:book_id>/chapters/<int:chapter_id>/content', methods=['GET'])
 def get_chapter_content(book_id, chapter_id):
@@ -304,9 +561,16 @@ def get_chapter_content(book_id, chapter_id):
         current_app.logger.error(f"Chapter with ID {chapter_id} not found for book {book_id}")
         return jsonify({'error': 'Chapter not found'}), 404
     
-    # 如果数据库中已有HTML内容，直接返回
-    if chapter.get('html_content'):
-        return chapter['html_content'], 200, {'Content-Type': 'text/html; charset=utf-8'}
+    # 已渲染的章节直接从内容存储返回，不经过数据库；
+    # 带 ?v=<html_hash> 的请求地址随内容变化，可以永久缓存
+    html_hash = chapter.get('html_hash')
+    if html_hash and get_blob_store().exists(html_hash, '.html.gz'):
+        return blob_html_response(html_hash, immutable=request.args.get('v') == html_hash)
+    
+    # 旧数据的HTML内容保存在数据库中
+    html_content = Chapter.get_field(chapter_id, 'html_content', raw=True)
+    if html_content:
+        return html_response(html_content)
     
     # 否则从EPUB文件中获取
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], book['file_path'])
@@ -319,58 +583,97 @@ def get_chapter_content(book_id, chapter_id):
         # 使用EpubService获取章节内容
         with EpubService(file_path) as epub:
             content_html = epub.get_chapter_html(chapter['href'])
-            
-            # 保存到数据库以便下次快速访问
-            Chapter.update_html_content(chapter_id, content_html)
-            
-            # 返回HTML内容
-            return content_html, 200, {'Content-Type': 'text/html; charset=utf-8'}
+        
+        # 写入内容存储以便下次快速访问
+        html_hash = get_blob_store().put_html(content_html)
+        Chapter.update_html_hash(chapter_id, html_hash)
+        
+        return blob_html_response(html_hash)
     except Exception as e:
         current_app.logger.error(f"Error getting chapter content: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+READER_STYLE_BYTES = READER_STYLE.encode('utf-8')
+READER_STYLE_VARIANTS = precompress(READER_STYLE_BYTES)
+
+@book_bp.route('/reader.css', methods=['GET'])
+def get_reader_style():
+    """章节HTML共用的阅读器基本样式，章节中引用的地址带有样式内容的版本号"""
+    immutable = request.args.get('v') == READER_STYLE_VERSION
+    if is_not_modified(READER_STYLE_VERSION):
+        return not_modified_response(READER_STYLE_VERSION, immutable)
+    return precompressed_response(READER_STYLE_BYTES, READER_STYLE_VARIANTS, 'text/css', READER_STYLE_VERSION, immutable)
+
+def asset_response(asset_path, immutable):
+    """返回资源存储中的文件，ETag 为内容哈希；CSS等文本资源按 Accept-Encoding 直接返回入库时保存的预压缩变体"""
+    root = get_asset_store().root
+    name, ext = os.path.splitext(os.path.basename(asset_path))
+    mimetype = asset_mimetype(ext)
+    
+    if is_not_modified(name):
+        return not_modified_response(name, immutable)
+    
+    if is_compressible(mimetype):
+        for encoding in available_encodings():
+            variant = asset_path + ENCODING_SUFFIXES[encoding]
+            if request.accept_encodings[encoding] > 0 and os.path.exists(os.path.join(root, variant)):
+                response = send_from_directory(root, variant, mimetype=mimetype, etag=f"{name}-{encoding}",
+                                               download_name=os.path.basename(asset_path))
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return apply_cache_policy(response, immutable)
+    
+    response = send_from_directory(root, asset_path, mimetype=mimetype, etag=name)
+    return apply_cache_policy(response, immutable)
+
+@book_bp.route('/assets/<path:asset_path>', methods=['GET'])
+def get_asset(asset_path):
+    """提供入库时保存的书籍资源文件
+    
+    文件名就是内容哈希，可以永久缓存；CSS等文本资源直接返回预压缩变体。
+    生产环境也可以由前端代理直接映射 ASSET_FOLDER 目录，不经过应用。
+    """
+    return asset_response(asset_path, immutable=True)
+
+def find_legacy_resource(resource_path):
+    """在上传目录的EPUB中查找资源，保存到资源存储并记录对应关系，返回资源存储中的相对路径
+    
+    只在某个资源路径第一次被请求时执行，之后由 BookResource 直接查到。
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    
+    for book in fetch_all_pages(lambda after: Book.get_page('created_at', after, MAX_PAGE_SIZE, ('id', 'file_path'))):
+        epub_path = os.path.join(upload_folder, book['file_path'])
+        try:
+            with zipfile.ZipFile(epub_path, 'r') as zip_ref:
+                # 查找匹配的文件
+                for info in zip_ref.infolist():
+                    if info.filename.endswith(resource_path):
+                        ext = os.path.splitext(info.filename)[1]
+                        asset = get_asset_store().put_asset(zip_ref.read(info), ext)
+                        BookResource.create_many(book['id'], {resource_path: asset})
+                        return asset
+        except Exception as e:
+            current_app.logger.error(f"Error extracting resource: {str(e)}")
+            continue
+    
+    return None
+
 @book_bp.route('/resource/<path:resource_path>', methods=['GET'])
 def get_resource(resource_path):
-    """获取EPUB资源文件（图片、CSS等）"""
+    """获取EPUB资源文件（图片、CSS等）
+    
+    仅用于资源存储上线之前渲染的旧章节；新章节中的资源引用已改写为 /assets/ 下的地址。
+    资源路径通过 book_resources 表对应到资源存储中的文件，ETag 就是文件的内容哈希，
+    重复请求只需一次查询，不读取任何EPUB；CSS等文本资源返回保存资源时生成的预压缩变体。
+    """
     # 安全检查，防止路径遍历攻击
     if '..' in resource_path:
         return jsonify({'error': 'Invalid resource path'}), 400
     
-    # 尝试在所有上传的EPUB中查找资源
-    upload_folder = current_app.config['UPLOAD_FOLDER']
+    asset = BookResource.get_asset(resource_path) or find_legacy_resource(resource_path)
+    if not asset:
+        return jsonify({'error': 'Resource not found'}), 404
     
-    # 遍历所有EPUB文件
-    for root, dirs, files in os.walk(upload_folder):
-        for file in files:
-            if file.endswith('.epub'):
-                epub_path = os.path.join(root, file)
-                
-                # 尝试从EPUB中提取资源
-                try:
-                    with zipfile.ZipFile(epub_path, 'r') as zip_ref:
-                        # 查找匹配的文件
-                        for info in zip_ref.infolist():
-                            if info.filename.endswith(resource_path):
-                                # 提取文件到临时目录
-                                temp_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'temp')
-                                os.makedirs(temp_dir, exist_ok=True)
-                                
-                                extracted_path = zip_ref.extract(info, temp_dir)
-                                
-                                # 确定MIME类型
-                                mime_type = 'application/octet-stream'
-                                if resource_path.endswith('.css'):
-                                    mime_type = 'text/css'
-                                elif resource_path.endswith(('.jpg', '.jpeg')):
-                                    mime_type = 'image/jpeg'
-                                elif resource_path.endswith('.png'):
-                                    mime_type = 'image/png'
-                                elif resource_path.endswith('.gif'):
-                                    mime_type = 'image/gif'
-                                
-                                return send_file(extracted_path, mimetype=mime_type)
-                except Exception as e:
-                    current_app.logger.error(f"Error extracting resource: {str(e)}")
-                    continue
-    
-    return jsonify({'error': 'Resource not found'}), 404
\ No newline at end of file
+    # 地址不含内容哈希，浏览器需要重新验证
+    return asset_response(asset, immutable=False)
\ No newline at end of file
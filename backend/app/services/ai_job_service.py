@@ -0,0 +1,216 @@
+"""AI生成任务的排队与执行
+
+章节的摘要、翻译和图表生成需要数秒到数分钟，不再在Web请求线程中执行：
+接口只把任务写入 ai_jobs 队列（见 app.models.ai_job）后立即返回，由独立的工作进程
+（ai_worker.py，或开发服务器中的后台线程）按优先级领取执行，结果照旧写入 chapters 表。
+Web请求可以短暂等待结果，或通过任务接口轮询。
+
+优先级：阅读器中点击触发的请求（interactive）先于后台预生成（background）和批量任务（bulk）。
+"""
+import os
+import socket
+import threading
+import time
+
+from flask import current_app
+
+from app.models.ai_job import AIJob
+from app.models.book import Book, Chapter
+from app.services.ai_service import AIService
+from app.services.epub_service import EpubService
+from app.utils.metrics import AI_JOB_QUEUE_SECONDS, REGISTRY
+
+# 数值越小越先执行
+PRIORITIES = {'interactive': 0, 'background': 50, 'bulk': 100}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+
+# 操作 → (chapters 中的结果字段, AIService 的生成方法, 保存结果的方法, 接口返回结果的键)
+AI_OPERATIONS = {
+    'summary': ('summary', 'summarize_text', Chapter.update_summary, 'summary'),
+    'translation': ('translation', 'translate_text', Chapter.update_translation, 'translation'),
+    'diagram': ('mermaid_diagram', 'generate_mermaid_diagram', Chapter.update_mermaid_diagram, 'diagram')
+}
+
+# 以前的版本在章节无法读取时把这些提示当作纯文本保存，这样的章节同样视为没有文本
+_LEGACY_PLACEHOLDER_TEXTS = ('章节内容不可用', '无法提取章节内容')
+_LEGACY_ERROR_PREFIXES = ('无法读取章节内容: ', '获取章节内容时出错: ')
+
+class ChapterTextUnavailable(Exception):
+    """章节没有可用于生成的纯文本（书籍或EPUB文件已不存在，或章节文件缺失、无法提取文本）"""
+    pass
+
+def has_chapter_text(text):
+    return bool(text and text.strip()) and text not in _LEGACY_PLACEHOLDER_TEXTS \
+        and not text.startswith(_LEGACY_ERROR_PREFIXES)
+
+def load_chapter_text(chapter):
+    """获取章节的纯文本，没有可用文本时抛出 ChapterTextUnavailable
+
+    纯文本在上传时已预先计算并存入 chapters.plain_text，由 Chapter.get_artifact
+    在读取章节时一并返回，这里直接使用；
+    只有旧数据缺少该列时才打开EPUB提取一次，并回填到数据库。
+    """
+    if chapter.get('plain_text') is not None:
+        if not has_chapter_text(chapter['plain_text']):
+            raise ChapterTextUnavailable('Chapter text is not available')
+        return chapter['plain_text']
+
+    # 获取书籍信息
+    book = Book.get_by_id(chapter['book_id'])
+
+    if not book:
+        raise ChapterTextUnavailable('Book not found')
+
+    # 获取EPUB文件路径
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], book['file_path'])
+
+    if not os.path.exists(file_path):
+        raise ChapterTextUnavailable('Book file not found')
+
+    with EpubService(file_path) as epub:
+        text_record = epub.get_chapter_text(chapter['href'])
+
+    # 回填纯文本，后续请求不再重新解析
+    Chapter.update_plain_text(chapter['id'], text_record)
+
+    if not has_chapter_text(text_record['plain_text']):
+        raise ChapterTextUnavailable('Chapter text is not available')
+    return text_record['plain_text']
+
+def priority_name(priority):
+    return PRIORITY_NAMES.get(priority, str(priority))
+
+def job_to_dict(job):
+    """接口返回的任务信息"""
+    result = {
+        'id': job['id'],
+        'chapter_id': job['chapter_id'],
+        'operation': job['operation'],
+        'priority': priority_name(job['priority']),
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'error': job['error']
+    }
+    if job['status'] == 'pending':
+        result['queue_position'] = AIJob.count_ahead(job) + 1
+    return result
+
+def get_job_result(job):
+    """已完成任务的生成结果"""
+    field = AI_OPERATIONS[job['operation']][0]
+    chapter = Chapter.get_artifact(job['chapter_id'], field, with_text=False)
+    return chapter[field] if chapter else None
+
+def wait_for_job(job_id, timeout):
+    """等待任务完成或失败，最多 timeout 秒，返回任务的最新状态"""
+    poll_interval = current_app.config.get('AI_JOB_POLL_INTERVAL', 0.5)
+    deadline = time.monotonic() + timeout
+    while True:
+        job = AIJob.get_by_id(job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job['status'] in ('done', 'failed') or remaining <= 0:
+            return job
+        time.sleep(min(poll_interval, remaining))
+
+def run_job(job):
+    """生成任务对应的结果并保存到章节"""
+    field, generate, save, _ = AI_OPERATIONS[job['operation']]
+    chapter = Chapter.get_artifact(job['chapter_id'], field)
+    # 章节已删除，或结果已由其他途径生成
+    if not chapter or chapter.get(field):
+        return
+
+    content = load_chapter_text(chapter)
+    current_app.logger.info(f"AI job {job['id']}: {job['operation']} for chapter {job['chapter_id']}, "
+                            f"{len(content)} characters")
+    result = getattr(AIService(), generate)(content)
+    save(job['chapter_id'], result)
+
+class AIWorker:
+    """在当前进程中用多个线程领取并执行AI任务
+
+    AI调用的时间几乎都在等待网络，每个线程同一时间执行一个任务，线程数可以远大于CPU核数。
+    ai_worker.py 在每个工作进程中运行一个 AIWorker；开发服务器（run.py）在进程内运行一个。
+    """
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        self.threads = threads or app.config.get('AI_WORKER_THREADS', 4)
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopped = threading.Event()
+        self._threads = []
+        self._metrics_lock = threading.Lock()
+        self._metrics_flushed = 0.0
+
+    def start(self):
+        for i in range(self.threads):
+            # 第一个线程同时负责把租约过期的任务重新排队
+            thread = threading.Thread(target=self._run, args=(f"{self.name}:{i}", i == 0),
+                                      name=f'ai-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """不再领取新任务，等待执行中的任务完成（最多 timeout 秒）"""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, worker, sweeper):
+        config = self.app.config
+        idle_interval = config.get('AI_WORKER_IDLE_INTERVAL', 2)
+        lease = config.get('AI_JOB_LEASE', 600)
+        max_attempts = config.get('AI_JOB_MAX_ATTEMPTS', 3)
+        sweep_interval = config.get('AI_JOB_SWEEP_INTERVAL', 30)
+        next_sweep = 0.0
+
+        while not self._stopped.is_set():
+            job = None
+            try:
+                with self.app.app_context():
+                    if sweeper and time.monotonic() >= next_sweep:
+                        AIJob.requeue_expired(max_attempts)
+                        next_sweep = time.monotonic() + sweep_interval
+                    job = AIJob.claim(worker, lease)
+                    if job:
+                        self._execute(job, worker, max_attempts)
+            except Exception as e:
+                self.app.logger.error(f"AI worker {worker} error: {str(e)}")
+                self._stopped.wait(idle_interval)
+                continue
+            if not job:
+                self._stopped.wait(idle_interval)
+
+    def _execute(self, job, worker, max_attempts):
+        AI_JOB_QUEUE_SECONDS.observe(job['started_at'] - job['enqueued_at'], operation=job['operation'],
+                                     priority=priority_name(job['priority']))
+        try:
+            run_job(job)
+        except ChapterTextUnavailable as e:
+            # 重试也不会成功，直接标记为失败
+            AIJob.fail(job['id'], worker, str(e), 0)
+        except Exception as e:
+            self.app.logger.error(f"AI job {job['id']} ({job['operation']} for chapter {job['chapter_id']}) "
+                                  f"failed on attempt {job['attempts']}: {str(e)}")
+            AIJob.fail(job['id'], worker, f"{type(e).__name__}: {e}", max_attempts)
+        else:
+            AIJob.finish(job['id'], worker)
+        self._flush_metrics()
+
+    def _flush_metrics(self):
+        # 与Web进程写入同一个 METRICS_DIR，/metrics 合并输出任务的排队时间和AI调用耗时
+        metrics_dir = self.app.config.get('METRICS_DIR')
+        if not metrics_dir:
+            return
+        now = time.monotonic()
+        with self._metrics_lock:
+            if now - self._metrics_flushed < self.app.config.get('METRICS_FLUSH_INTERVAL', 5):
+                return
+            self._metrics_flushed = now
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            REGISTRY.write_snapshot(metrics_dir)
+        except OSError as e:
+            self.app.logger.error(f"Error writing metrics snapshot: {str(e)}")
@@ -1,14 +1,51 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from flask import current_app
 import time
+from app.utils.metrics import AI_REQUEST_SECONDS
+
+def create_http_session(config):
+    """创建调用AI接口的HTTP会话，复用到API服务器的keep-alive连接
+    
+    会话内部的连接池不能跨进程共享，多进程部署时每个工作进程在 fork 之后各自创建。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.get('AI_HTTP_POOL_SIZE', 10))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+class AIServiceError(Exception):
+    """AI接口返回的结果无法使用"""
+    pass
 
 class AIService:
+    """调用AI接口生成总结、翻译和图表
+
+    请求失败（网络错误、HTTP错误状态、响应格式异常）时抛出异常，不返回错误提示文本：
+    由调用方重试或报告失败，错误信息不会被当作生成结果保存。
+    """
+
     def __init__(self):
         # 使用配置文件中的API配置
         self.api_key = current_app.config.get('DEEPSEEK_API_KEY')
         self.base_url = current_app.config.get('DEEPSEEK_BASE_URL')
         self.model = current_app.config.get('DEEPSEEK_MODEL')
+        # (连接超时, 读取超时)，避免一个卡住的调用无限期占用工作线程
+        self.timeout = (current_app.config.get('AI_CONNECT_TIMEOUT', 10), current_app.config.get('AI_READ_TIMEOUT', 180))
+        self.session = current_app.extensions['http_session']
+    
+    def _post(self, operation, headers, data):
+        """调用AI接口，按操作类型和响应状态记录耗时"""
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.post(self.base_url, headers=headers, data=json.dumps(data), timeout=self.timeout)
+            status = response.status_code
+            return response
+        finally:
+            AI_REQUEST_SECONDS.observe(time.perf_counter() - start, operation=operation, status=status)
     
     def summarize_text(self, text):
         """使用AI生成文本总结"""
@@ -16,47 +53,43 @@ class AIService:
         if len(text) > 10000:
             text = text[:10000] + "..."
         
-        try:
-            # 构建请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            # 构建提示
-            prompt = f"""
-            请对以下文本内容进行全面而简洁的总结。总结应该：
-            1. 提取文本中的关键信息和主要观点
-            2. 保留重要的事实、数据和引用
-            3. 使用清晰的结构组织信息
-            4. 突出作者的核心论点和结论
-            
-            文本内容：
-            {text}
-            """
-            
-            # 构建请求数据
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的文本分析和总结助手，擅长提取文本的核心内容并生成结构化总结。"},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            
-            # 发送请求
-            response = requests.post(self.base_url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()
-            result = response.json()
-            
-            # 提取总结内容
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            else:
-                return "无法生成总结，API返回格式异常。"
-        except Exception as e:
-            print(f"AI总结生成错误: {str(e)}")
-            return f"生成总结时出错: {str(e)}"
+        # 构建请求头
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        # 构建提示
+        prompt = f"""
+        请对以下文本内容进行全面而简洁的总结。总结应该：
+        1. 提取文本中的关键信息和主要观点
+        2. 保留重要的事实、数据和引用
+        3. 使用清晰的结构组织信息
+        4. 突出作者的核心论点和结论
+        
+        文本内容：
+        {text}
+        """
+        
+        # 构建请求数据
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "你是一个专业的文本分析和总结助手，擅长提取文本的核心内容并生成结构化总结。"},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        
+        # 发送请求
+        response = self._post('summarize', headers, data)
+        response.raise_for_status()
+        result = response.json()
+        
+        # 提取总结内容
+        if 'choices' in result and len(result['choices']) > 0:
+            return result['choices'][0]['message']['content']
+        else:
+            raise AIServiceError("无法生成总结，API返回格式异常。")
     
     def generate_summary(self, content):
         """
@@ -90,21 +123,17 @@ class AIService:
                 ]
             }
             
-            try:
-                response = requests.post(self.base_url, headers=headers, data=json.dumps(data))
-                response.raise_for_status()
-                result = response.json()
-                
-                if 'choices' in result and len(result['choices']) > 0:
-                    summaries.append(result['choices'][0]['message']['content'])
-                else:
-                    summaries.append(f"无法生成第{i+1}部分的总结。")
-                
-                # 避免API限流
-                time.sleep(1)
-            except Exception as e:
-                print(f"处理第{i+1}部分时出错: {str(e)}")
-                summaries.append(f"处理第{i+1}部分时出错: {str(e)}")
+            response = self._post('summarize_part', headers, data)
+            response.raise_for_status()
+            result = response.json()
+            
+            if 'choices' in result and len(result['choices']) > 0:
+                summaries.append(result['choices'][0]['message']['content'])
+            else:
+                raise AIServiceError(f"无法生成第{i+1}部分的总结。")
+            
+            # 避免API限流
+            time.sleep(1)
         
         # 合并所有摘要
         combined_summary = "\n\n".join(summaries)
@@ -124,18 +153,14 @@ class AIService:
             ]
         }
         
-        try:
-            response = requests.post(self.base_url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()
-            result = response.json()
-            
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            else:
-                return "无法生成最终总结。"
-        except Exception as e:
-            print(f"生成最终总结时出错: {str(e)}")
-            return f"生成最终总结时出错: {str(e)}"
+        response = self._post('summarize_final', headers, data)
+        response.raise_for_status()
+        result = response.json()
+        
+        if 'choices' in result and len(result['choices']) > 0:
+            return result['choices'][0]['message']['content']
+        else:
+            raise AIServiceError("无法生成最终总结。")
     
     def _split_content(self, content, max_chunk_size=4000):
         """将内容分割成多个块"""
@@ -164,43 +189,39 @@ class AIService:
         if len(text) > 10000:
             text = text[:10000] + "..."
         
-        try:
-            # 构建请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            # 构建提示
-            prompt = f"""
-            请将以下文本内容翻译成通俗易懂的大白话，使用简单直接的语言，避免专业术语和复杂表达：
-            
-            文本内容：
-            {text}
-            """
-            
-            # 构建请求数据
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的文本翻译助手，擅长将复杂文本转化为通俗易懂的大白话。"},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            
-            # 发送请求
-            response = requests.post(self.base_url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()
-            result = response.json()
-            
-            # 提取翻译内容
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            else:
-                return "无法生成翻译，API返回格式异常。"
-        except Exception as e:
-            print(f"AI翻译生成错误: {str(e)}")
-            return f"生成翻译时出错: {str(e)}"
+        # 构建请求头
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        # 构建提示
+        prompt = f"""
+        请将以下文本内容翻译成通俗易懂的大白话，使用简单直接的语言，避免专业术语和复杂表达：
+        
+        文本内容：
+        {text}
+        """
+        
+        # 构建请求数据
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "你是一个专业的文本翻译助手，擅长将复杂文本转化为通俗易懂的大白话。"},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        
+        # 发送请求
+        response = self._post('translate', headers, data)
+        response.raise_for_status()
+        result = response.json()
+        
+        # 提取翻译内容
+        if 'choices' in result and len(result['choices']) > 0:
+            return result['choices'][0]['message']['content']
+        else:
+            raise AIServiceError("无法生成翻译，API返回格式异常。")
 
     def generate_mermaid_diagram(self, text):
         """使用 AI 生成 Mermaid 图表"""
@@ -208,52 +229,48 @@ class AIService:
         if len(text) > 10000:
             text = text[:10000] + "..."
         
-        try:
-            # 构建请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            # 构建提示
-            prompt = f"""
-            请根据以下文本内容，生成一个 Mermaid 图表代码，用于可视化文本中的关键概念、关系或流程。
-            图表应该简洁明了，突出文本的主要结构或逻辑关系。
-            
-            可以使用流程图、思维导图、类图或其他适合的图表类型。
-            请只返回有效的 Mermaid 代码，不要包含其他解释。
-            
-            文本内容：
-            {text}
-            """
-            
-            # 构建请求数据
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的图表生成助手，擅长将文本内容转化为 Mermaid 图表代码。"},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            
-            # 发送请求
-            response = requests.post(self.base_url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()
-            result = response.json()
+        # 构建请求头
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        # 构建提示
+        prompt = f"""
+        请根据以下文本内容，生成一个 Mermaid 图表代码，用于可视化文本中的关键概念、关系或流程。
+        图表应该简洁明了，突出文本的主要结构或逻辑关系。
+        
+        可以使用流程图、思维导图、类图或其他适合的图表类型。
+        请只返回有效的 Mermaid 代码，不要包含其他解释。
+        
+        文本内容：
+        {text}
+        """
+        
+        # 构建请求数据
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "你是一个专业的图表生成助手，擅长将文本内容转化为 Mermaid 图表代码。"},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        
+        # 发送请求
+        response = self._post('diagram', headers, data)
+        response.raise_for_status()
+        result = response.json()
+        
+        # 提取图表内容
+        if 'choices' in result and len(result['choices']) > 0:
+            content = result['choices'][0]['message']['content']
             
-            # 提取图表内容
-            if 'choices' in result and len(result['choices']) > 0:
-                content = result['choices'][0]['message']['content']
-                
-                # 提取 Mermaid 代码块
-                import re
-                mermaid_match = re.search(r'```mermaid\n([\s\S]*?)\n```', content)
-                if mermaid_match:
-                    return mermaid_match.group(1).strip()
-                else:
-                    return content.strip()
+            # 提取 Mermaid 代码块
+            import re
+            mermaid_match = re.search(r'```mermaid\n([\s\S]*?)\n```', content)
+            if mermaid_match:
+                return mermaid_match.group(1).strip()
             else:
-                return "无法生成图表，API返回格式异常。"
-        except Exception as e:
-            print(f"AI图表生成错误: {str(e)}")
-            return f"生成图表时出错: {str(e)}" 
\ No newline at end of file
+                return content.strip()
+        else:
+            raise AIServiceError("无法生成图表，API返回格式异常。") 
\ No newline at end of file
@@ -0,0 +1,121 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import tempfile
+from flask import current_app
+from app.utils.http_compression import precompress, available_encodings, is_compressible
+
+# 各压缩编码对应的文件后缀
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+# 资源目录对外的URL前缀，文件按 <前缀><两级分片>/<hash><扩展名> 访问
+ASSET_URL_PREFIX = '/api/books/assets/'
+
+# 系统 mimetypes 数据库中可能缺失的EPUB常见资源类型
+ASSET_MIMETYPES = {
+    '.css': 'text/css',
+    '.svg': 'image/svg+xml',
+    '.webp': 'image/webp',
+    '.otf': 'font/otf',
+    '.ttf': 'font/ttf',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2'
+}
+
+def asset_mimetype(ext):
+    ext = ext.lower()
+    return ASSET_MIMETYPES.get(ext) or mimetypes.guess_type('asset' + ext)[0] or 'application/octet-stream'
+
+class BlobStore:
+    """按内容哈希寻址的磁盘存储
+
+    每个对象以其未压缩内容的 sha256 命名，存放在两级分片目录下
+    （<root>/ab/cd/<hash><suffix>），相同内容只保存一份。
+    对象写入后不再修改，可以放心地使用 sendfile 和长期缓存直接提供。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, content_hash, suffix=''):
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash + suffix)
+
+    def exists(self, content_hash, suffix=''):
+        return os.path.exists(self.path(content_hash, suffix))
+
+    def write(self, content_hash, data, suffix=''):
+        """原子地写入对象；已存在时直接跳过"""
+        path = self.path(content_hash, suffix)
+        if os.path.exists(path):
+            return path
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+
+    def put_compressed(self, data, ext):
+        """保存静态文本内容的预压缩变体（<hash><ext>.gz / .br），返回内容哈希
+
+        gzip 变体总是存在，不接受压缩的客户端由它流式解压得到原文。
+        """
+        content_hash = self.hash_bytes(data)
+        self._write_variants(content_hash, data, ext)
+        return content_hash
+
+    def _write_variants(self, content_hash, data, ext):
+        """写入尚不存在的各编码预压缩变体"""
+        missing = [e for e in available_encodings() if not self.exists(content_hash, ext + ENCODING_SUFFIXES[e])]
+        if missing:
+            for encoding, compressed in precompress(data).items():
+                if encoding in missing:
+                    self.write(content_hash, compressed, ext + ENCODING_SUFFIXES[encoding])
+
+    def compressed_path(self, content_hash, ext, encoding='gzip'):
+        """返回指定编码的变体路径，该变体不存在时返回 None"""
+        path = self.path(content_hash, ext + ENCODING_SUFFIXES[encoding])
+        return path if os.path.exists(path) else None
+
+    def open_decompressed(self, content_hash, ext):
+        """以流的方式读取未压缩的原文"""
+        return gzip.open(self.path(content_hash, ext + '.gz'), 'rb')
+
+    def put_html(self, html):
+        """保存渲染后的章节HTML（gzip 和 brotli 预压缩），返回内容哈希"""
+        return self.put_compressed(html.encode('utf-8'), '.html')
+
+    def put_asset(self, data, ext):
+        """保存书籍的图片、CSS、字体等静态资源，返回相对于存储根目录的路径
+
+        文件以原始内容存放，CSS、SVG 等文本资源同时保存 .gz / .br 预压缩变体，
+        可以直接由前端代理（如 nginx 的 gzip_static）或静态文件接口提供。
+        """
+        ext = ext.lower()
+        content_hash = self.hash_bytes(data)
+        path = self.write(content_hash, data, ext)
+        if is_compressible(asset_mimetype(ext)):
+            self._write_variants(content_hash, data, ext)
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+def get_blob_store():
+    """获取当前应用的章节内容存储"""
+    root = current_app.config.get('BLOB_FOLDER') or os.path.join(current_app.config['UPLOAD_FOLDER'], 'blobs')
+    return BlobStore(root)
+
+def get_asset_store():
+    """获取当前应用的书籍资源存储（不同书籍中的相同文件只保存一份）"""
+    root = current_app.config.get('ASSET_FOLDER') or os.path.join(current_app.config['UPLOAD_FOLDER'], 'assets')
+    return BlobStore(root)
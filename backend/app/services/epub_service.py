@@ -1,51 +1,268 @@
 import os
+import re
+import posixpath
+import hashlib
 import zipfile
 import xml.etree.ElementTree as ET
-import tempfile
-import shutil
 from bs4 import BeautifulSoup
 import uuid
+from urllib.parse import unquote
 from flask import current_app
+from app.services.blob_store import ASSET_URL_PREFIX, BlobStore, get_asset_store, get_blob_store
+from app.services.search_service import count_terms
+from app.utils.metrics import EPUB_STAGE_SECONDS, timed
+from app.utils.process_pool import default_workers, get_process_pool
+from app.services.image_service import (
+    IMAGE_EXTENSIONS, cover_rendition_filename, detect_image_ext, get_image_pool, optimize_reader_image
+)
+
+# 入库时预先保存到资源存储的文件类型
+ASSET_EXTENSIONS = IMAGE_EXTENSIONS + ('.css', '.ttf', '.otf', '.woff', '.woff2')
+
+# 入库时每批交给渲染进程的最大章节数
+RENDER_BATCH_SIZE = 8
+
+# 书内图片的最大宽高，超出时在入库时等比缩小
+DEFAULT_READER_IMAGE_MAX_SIZE = (1600, 2400)
+
+# 阅读器基本样式，由 /api/books/reader.css 提供
+READER_STYLE = """
+body {
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif;
+    line-height: 1.6;
+    color: #333;
+    max-width: 100%;
+    margin: 0 auto;
+    padding: 20px;
+}
+img {
+    max-width: 100%;
+    height: auto;
+}
+h1, h2, h3, h4, h5, h6 {
+    margin-top: 1em;
+    margin-bottom: 0.5em;
+}
+p {
+    margin-bottom: 1em;
+}
+"""
+
+# 样式内容的版本号，章节HTML通过带版本号的地址引用，样式修改后浏览器会重新获取
+READER_STYLE_VERSION = hashlib.sha256(READER_STYLE.encode('utf-8')).hexdigest()[:16]
+READER_STYLE_URL = f'/api/books/reader.css?v={READER_STYLE_VERSION}'
+
+# 不需要改写的外部引用
+EXTERNAL_REF_PREFIXES = ('http://', 'https://', 'data:', '#', '/')
+
+# CSS 中的 url(...) 和 @import "..." 引用
+_CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_CSS_IMPORT_RE = re.compile(r"""@import\s+(['"])([^'"]+)\1""")
+
+# CJK统一表意文字、假名和韩文音节，估算token时按一字一token计算
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+def decode_chapter_bytes(data):
+    """解码章节文件，依次尝试 utf-8、gbk、latin-1 编码，换行统一为 LF"""
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = data.decode('latin-1')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def extract_text_from_html(content):
+    """从章节HTML中提取规范化的纯文本，段落之间以空行分隔"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # 提取正文内容
+    body = soup.find('body')
+    if body:
+        # 移除脚本和样式
+        for script in body.find_all(['script', 'style']):
+            script.decompose()
+        
+        # 获取所有文本，保留段落结构
+        paragraphs = []
+        for p in body.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+            text = p.get_text().strip()
+            if text:
+                paragraphs.append(text)
+        
+        # 如果没有找到段落，尝试获取所有文本
+        if not paragraphs:
+            text = body.get_text(separator='\n').strip()
+            paragraphs = [line.strip() for line in text.split('\n') if line.strip()]
+    else:
+        # 尝试直接从HTML中提取文本
+        text = soup.get_text(separator='\n').strip()
+        paragraphs = [line.strip() for line in text.split('\n') if line.strip()]
+    
+    return '\n\n'.join(paragraphs)
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：CJK字符按1个token，其余字符按4个字符1个token"""
+    cjk_count = len(_CJK_RE.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+def build_text_record(text):
+    """构造章节纯文本记录：文本、字符数、估算token数和内容哈希
+    
+    章节文件缺失或无法提取文本时 text 为空，保存为空字符串（与尚未提取的 NULL 区分），没有内容哈希。
+    """
+    text = text or ''
+    return {
+        'plain_text': text,
+        'char_count': len(text),
+        'token_count': estimate_tokens(text),
+        'content_hash': hashlib.sha256(text.encode('utf-8')).hexdigest() if text else None
+    }
+
+def render_chapter_html(content, rewrite_ref):
+    """渲染章节HTML：用 rewrite_ref(引用) 改写图片和样式表地址，并引用阅读器基本样式"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # 图片、SVG图片和样式表改为引用资源存储中按内容哈希命名的文件
+    for img in soup.find_all('img'):
+        if img.get('src'):
+            img['src'] = rewrite_ref(img['src'])
+    
+    for image in soup.find_all('image'):
+        if image.get('xlink:href'):
+            image['xlink:href'] = rewrite_ref(image['xlink:href'])
+    
+    for link in soup.find_all('link', rel='stylesheet'):
+        if link.get('href'):
+            link['href'] = rewrite_ref(link['href'])
+    
+    # 引用阅读器基本样式（所有章节共用同一个样式表，不再逐章内联）
+    style_link = soup.new_tag('link', attrs={'rel': 'stylesheet', 'href': READER_STYLE_URL})
+    if soup.head:
+        soup.head.append(style_link)
+    else:
+        # 如果没有head标签，创建一个
+        head = soup.new_tag('head')
+        head.append(style_link)
+        if soup.html:
+            soup.html.insert(0, head)
+        else:
+            # 如果没有html标签，创建完整的文档结构
+            html = soup.new_tag('html')
+            html.append(head)
+            body = soup.new_tag('body')
+            for tag in list(soup.contents):
+                body.append(tag.extract())
+            html.append(body)
+            soup = BeautifulSoup(str(html), 'html.parser')
+    
+    return str(soup)
+
+def _rewrite_ref_from_map(asset_urls, member, href, ref):
+    """按预先保存的资源表改写引用（member 为章节在压缩包中的路径），与 EpubService._rewrite_resource_ref 一致"""
+    if ref.startswith(EXTERNAL_REF_PREFIXES):
+        return ref
+    target = unquote(ref.split('#')[0].split('?')[0])
+    if target:
+        url = asset_urls.get(posixpath.normpath(posixpath.join(posixpath.dirname(member), target)))
+        if url:
+            return url
+    resource_path = os.path.normpath(os.path.join(os.path.dirname(href), ref)).replace(os.sep, '/')
+    return f"/api/books/resource/{resource_path}"
+
+def _render_chapter_batch(task):
+    """进程池任务：直接从EPUB压缩包读取一批章节，渲染HTML写入内容存储，提取纯文本并统计检索词频
+    
+    返回与 hrefs 顺序相同的 [(HTML内容哈希, 纯文本记录, 词频, 错误信息)]。
+    """
+    epub_path, content_dir, hrefs, asset_urls, blob_root = task
+    blob_store = BlobStore(blob_root)
+    results = []
+    with zipfile.ZipFile(epub_path) as archive:
+        names = set(archive.namelist())
+        for href in hrefs:
+            try:
+                member = posixpath.normpath(posixpath.join(content_dir, href))
+                # 占位的提示只出现在HTML中，纯文本留空，不会被当作章节内容检索或交给AI生成
+                if member not in names:
+                    html, text = "<h1>章节内容不可用</h1><p>找不到章节文件</p>", ''
+                else:
+                    content = decode_chapter_bytes(archive.read(member))
+                    html = render_chapter_html(content, lambda ref: _rewrite_ref_from_map(asset_urls, member, href, ref))
+                    text = extract_text_from_html(content)
+                results.append((blob_store.put_html(html), build_text_record(text), count_terms(text), None))
+            except Exception as e:
+                results.append((None, None, None, str(e)))
+    return results
+
+def _join_member(base_dir, ref):
+    """把相对引用解析为压缩包内的路径，越出压缩包根目录时返回 None"""
+    path = posixpath.normpath(posixpath.join(base_dir, ref))
+    if path == '..' or path.startswith('../') or path.startswith('/'):
+        return None
+    return '' if path == '.' else path
 
 class EpubService:
+    """EPUB 文件解析
+    
+    不解压到临时目录，需要哪个文件时才从压缩包中读取；以下路径都是压缩包内的路径（以 / 分隔）。
+    """
+    
     def __init__(self, file_path):
         self.file_path = file_path
-        self.temp_dir = tempfile.mkdtemp()
         self.content_path = None
         self.opf_path = None
         self.cover_path = None
+        self.cover_renditions = []
+        self._archive = None
+        self._names = set()
+        # 已保存到资源存储的文件：压缩包内路径 -> 资源URL
+        self._asset_urls = {}
     
+    @timed(EPUB_STAGE_SECONDS, stage='open')
     def __enter__(self):
-        with zipfile.ZipFile(self.file_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_dir)
-        
-        # 查找container.xml
-        container_path = os.path.join(self.temp_dir, 'META-INF', 'container.xml')
-        if not os.path.exists(container_path):
-            raise Exception("Invalid EPUB: container.xml not found")
-        
-        # 解析container.xml找到OPF文件
-        tree = ET.parse(container_path)
-        root = tree.getroot()
-        ns = {'ns': 'urn:oasis:names:tc:opendocument:xmlns:container'}
-        opf_path_rel = root.find('.//ns:rootfile', ns).get('full-path')
-        
-        self.opf_path = os.path.join(self.temp_dir, opf_path_rel)
-        self.content_path = os.path.dirname(self.opf_path)
+        self._archive = zipfile.ZipFile(self.file_path, 'r')
+        try:
+            self._names = {name for name in self._archive.namelist() if not name.endswith('/')}
+            
+            # 查找container.xml
+            if not self._exists('META-INF/container.xml'):
+                raise Exception("Invalid EPUB: container.xml not found")
+            
+            # 解析container.xml找到OPF文件
+            root = ET.fromstring(self._read('META-INF/container.xml'))
+            ns = {'ns': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+            opf_path_rel = root.find('.//ns:rootfile', ns).get('full-path')
+            
+            self.opf_path = _join_member('', opf_path_rel)
+            self.content_path = posixpath.dirname(self.opf_path)
+        except Exception:
+            self._archive.close()
+            raise
         
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        if self._archive:
+            self._archive.close()
+            self._archive = None
+    
+    def _exists(self, path):
+        return path is not None and path in self._names
     
+    def _read(self, path):
+        return self._archive.read(path)
+    
+    @timed(EPUB_STAGE_SECONDS, stage='metadata')
     def get_metadata(self):
         """获取电子书元数据"""
-        if not self.opf_path:
+        if not self._exists(self.opf_path):
             raise Exception("OPF file not found")
         
-        tree = ET.parse(self.opf_path)
-        root = tree.getroot()
+        root = ET.fromstring(self._read(self.opf_path))
         
         # 定义命名空间
         ns = {
@@ -80,12 +297,12 @@ class EpubService:
             cover_id = meta_cover.get('content')
             cover_item = root.find(f'.//opf:item[@id="{cover_id}"]', ns)
             if cover_item is not None:
-                return os.path.join(self.content_path, cover_item.get('href'))
+                return _join_member(self.content_path, cover_item.get('href'))
         
         # 方法2: 查找带有"cover"属性的item
         cover_item = root.find('.//opf:item[@properties="cover-image"]', ns)
         if cover_item is not None:
-            return os.path.join(self.content_path, cover_item.get('href'))
+            return _join_member(self.content_path, cover_item.get('href'))
         
         # 方法3: 查找id或href包含"cover"的图片
         for item in root.findall('.//opf:item', ns):
@@ -95,17 +312,17 @@ class EpubService:
             
             if (('cover' in item_id or 'cover' in item_href) and 
                 item_media.startswith('image/')):
-                return os.path.join(self.content_path, item.get('href'))
+                return _join_member(self.content_path, item.get('href'))
         
         return None
     
+    @timed(EPUB_STAGE_SECONDS, stage='chapters')
     def get_chapters(self):
         """获取章节列表"""
-        if not self.opf_path:
+        if not self._exists(self.opf_path):
             raise Exception("OPF file not found")
         
-        tree = ET.parse(self.opf_path)
-        root = tree.getroot()
+        root = ET.fromstring(self._read(self.opf_path))
         
         # 定义命名空间
         ns = {
@@ -133,8 +350,8 @@ class EpubService:
         if toc_id:
             toc_item = root.find(f'.//opf:manifest/opf:item[@id="{toc_id}"]', ns)
             if toc_item is not None:
-                toc_path = os.path.join(self.content_path, toc_item.get('href'))
-                if os.path.exists(toc_path):
+                toc_path = _join_member(self.content_path, toc_item.get('href'))
+                if self._exists(toc_path):
                     # 尝试从NCX文件中提取章节
                     ncx_chapters = self._extract_chapters_from_ncx(toc_path)
                     if ncx_chapters:
@@ -148,7 +365,7 @@ class EpubService:
             idref = itemref.get('idref')
             if idref in manifest_items:
                 href = manifest_items[idref]
-                file_path = os.path.join(self.content_path, href)
+                file_path = _join_member(self.content_path, href)
                 
                 # 尝试从文件中提取标题
                 title = self._extract_title_from_file(file_path)
@@ -167,12 +384,11 @@ class EpubService:
     
     def _extract_title_from_file(self, file_path):
         """从HTML文件中提取标题"""
-        if not os.path.exists(file_path):
+        if not self._exists(file_path):
             return None
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = self._read(file_path).decode('utf-8')
             
             soup = BeautifulSoup(content, 'html.parser')
             
@@ -198,12 +414,11 @@ class EpubService:
     
     def _extract_chapters_from_ncx(self, ncx_path):
         """从NCX文件中提取章节信息"""
-        if not os.path.exists(ncx_path):
+        if not self._exists(ncx_path):
             return []
         
         try:
-            tree = ET.parse(ncx_path)
-            root = tree.getroot()
+            root = ET.fromstring(self._read(ncx_path))
             
             # 定义命名空间
             ns = {'ncx': 'http://www.daisy.org/z3986/2005/ncx/'}
@@ -246,175 +461,214 @@ class EpubService:
             return []
     
     def get_chapter_content(self, href):
-        """获取指定章节的内容"""
+        """获取指定章节的纯文本，章节文件缺失、无法读取或没有文本时返回空字符串"""
         try:
-            file_path = os.path.join(self.content_path, href)
+            file_path = _join_member(self.content_path, href)
             
-            if not os.path.exists(file_path):
+            if not self._exists(file_path):
                 print(f"Chapter file not found: {file_path}")
-                return "章节内容不可用"
+                return ''
             
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                # 尝试其他编码
-                try:
-                    with open(file_path, 'r', encoding='gbk') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    try:
-                        with open(file_path, 'r', encoding='latin-1') as f:
-                            content = f.read()
-                    except Exception as e:
-                        print(f"Failed to read file with multiple encodings: {str(e)}")
-                        return f"无法读取章节内容: {str(e)}"
-            
-            # 使用BeautifulSoup提取文本
-            soup = BeautifulSoup(content, 'html.parser')
+                content = decode_chapter_bytes(self._read(file_path))
+            except Exception as e:
+                print(f"Failed to read file with multiple encodings: {str(e)}")
+                return ''
             
-            # 提取正文内容
-            body = soup.find('body')
-            if body:
-                # 移除脚本和样式
-                for script in body.find_all(['script', 'style']):
-                    script.decompose()
-                
-                # 获取所有文本，保留段落结构
-                paragraphs = []
-                for p in body.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                    text = p.get_text().strip()
-                    if text:
-                        paragraphs.append(text)
-                
-                # 如果没有找到段落，尝试获取所有文本
-                if not paragraphs:
-                    text = body.get_text(separator='\n').strip()
-                    paragraphs = [line.strip() for line in text.split('\n') if line.strip()]
-                
-                return '\n\n'.join(paragraphs)
-            else:
-                # 尝试直接从HTML中提取文本
-                text = soup.get_text(separator='\n').strip()
-                paragraphs = [line.strip() for line in text.split('\n') if line.strip()]
-                
-                if paragraphs:
-                    return '\n\n'.join(paragraphs)
-                else:
-                    return "无法提取章节内容"
+            return extract_text_from_html(content)
         except Exception as e:
             print(f"Error getting chapter content: {str(e)}")
-            return f"获取章节内容时出错: {str(e)}"
+            return ''
     
+    @timed(EPUB_STAGE_SECONDS, stage='chapter_text')
+    def get_chapter_text(self, href):
+        """获取章节的纯文本及统计信息（入库时预先计算，供AI接口直接使用）"""
+        return build_text_record(self.get_chapter_content(href))
+    
+    @timed(EPUB_STAGE_SECONDS, stage='cover')
     def save_cover_image(self, cover_folder):
-        """保存封面图片到指定文件夹"""
+        """保存封面图片到指定文件夹，并生成书架缩略图和中等尺寸版本
+        
+        文件扩展名按图片内容确定，返回原图的文件名；成功生成的尺寸版本名称记录在 cover_renditions 中。
+        """
+        self.cover_renditions = []
         # 确保已经调用了 get_metadata 方法
         if not hasattr(self, 'cover_path') or not self.cover_path:
             # 尝试获取元数据
             self.get_metadata()
         
-        if not self.cover_path or not os.path.exists(self.cover_path):
+        if not self._exists(self.cover_path):
             return None
         
         try:
             # 确保目标文件夹存在
             os.makedirs(cover_folder, exist_ok=True)
             
+            data = self._read(self.cover_path)
+            ext = detect_image_ext(data, posixpath.splitext(self.cover_path)[1].lower() or '.jpg')
+            
             # 生成唯一文件名
-            cover_filename = f"{uuid.uuid4()}.jpg"
-            cover_file_path = os.path.join(cover_folder, cover_filename)
+            cover_filename = f"{uuid.uuid4()}{ext}"
+            with open(os.path.join(cover_folder, cover_filename), 'wb') as f:
+                f.write(data)
             
-            # 复制封面图片
-            shutil.copy2(self.cover_path, cover_file_path)
+            for name, rendition in get_image_pool().make_cover_renditions(data).items():
+                with open(os.path.join(cover_folder, cover_rendition_filename(cover_filename, name)), 'wb') as f:
+                    f.write(rendition)
+                self.cover_renditions.append(name)
             
             return cover_filename
         except Exception as e:
             print(f"Error saving cover image: {str(e)}")
             return None
     
+    @timed(EPUB_STAGE_SECONDS, stage='images')
+    def prepare_images(self):
+        """在进程池中并行处理书内所有图片并保存到资源存储
+        
+        超过阅读器所需分辨率的图片会被缩小；之后渲染章节时直接使用已保存的资源URL。
+        图片按需从压缩包读取，同时只有进程池窗口内的几张在内存中。
+        """
+        paths = sorted(
+            path for path in self._names
+            if path.lower().endswith(IMAGE_EXTENSIONS) and not path.lower().endswith('.svg')
+            and path not in self._asset_urls
+        )
+        
+        asset_store = get_asset_store()
+        max_size = current_app.config.get('READER_IMAGE_MAX_SIZE', DEFAULT_READER_IMAGE_MAX_SIZE)
+        images = ((self._read(path), posixpath.splitext(path)[1]) for path in paths)
+        for path, (data, ext) in zip(paths, get_image_pool().iter_optimized_reader_images(images, max_size)):
+            self._asset_urls[path] = ASSET_URL_PREFIX + asset_store.put_asset(data, ext)
+    
+    @timed(EPUB_STAGE_SECONDS, stage='assets')
+    def prepare_assets(self):
+        """入库前保存书中所有图片、CSS和字体，返回 {压缩包内路径: 资源URL}
+        
+        章节在进程池中渲染时只查表改写引用，不再在工作进程中写资源存储。
+        """
+        self.prepare_images()
+        for path in sorted(self._names):
+            if not path.lower().endswith(ASSET_EXTENSIONS) or path in self._asset_urls:
+                continue
+            try:
+                self.asset_url(path)
+            except Exception as e:
+                current_app.logger.error(f"Error storing asset {path}: {str(e)}")
+        return {path: url for path, url in self._asset_urls.items() if url}
+    
+    def iter_rendered_chapters(self, hrefs, asset_urls, batch_size=None):
+        """在进程池中渲染章节HTML（写入内容存储）、提取纯文本并统计检索词频，逐个产出 (href, 结果)
+        
+        同一个文件（以锚点划分章节的书）只渲染一次，按 hrefs 中第一次出现的顺序产出，
+        结果为 (HTML内容哈希, 纯文本记录, 词频, 错误信息)，出错的章节前三项为 None。
+        章节分批交给工作进程，同时只有进程池窗口内的几批在执行或等待取走，
+        调用方不取结果时渲染随之暂停，内存占用与书的大小无关。
+        """
+        unique_hrefs = list(dict.fromkeys(hrefs))
+        pool = get_process_pool(current_app.config.get('RENDER_WORKERS', default_workers()))
+        if batch_size is None:
+            # 每个工作进程分到几批，批次之间负载更均衡，同时减少进程间传递资源表的次数
+            batch_size = min(RENDER_BATCH_SIZE, max(1, -(-len(unique_hrefs) // max(pool.workers * 4, 1))))
+        blob_root = get_blob_store().root
+        batches = (
+            (self.file_path, self.content_path, unique_hrefs[i:i + batch_size], asset_urls, blob_root)
+            for i in range(0, len(unique_hrefs), batch_size)
+        )
+        
+        results = pool.imap(_render_chapter_batch, batches)
+        try:
+            for i, batch_results in enumerate(results):
+                yield from zip(unique_hrefs[i * batch_size:(i + 1) * batch_size], batch_results)
+        finally:
+            results.close()
+    
+    @timed(EPUB_STAGE_SECONDS, stage='render')
+    def render_chapters(self, hrefs, asset_urls):
+        """渲染全部章节，返回与 hrefs 顺序相同的结果列表（见 iter_rendered_chapters）"""
+        rendered = dict(self.iter_rendered_chapters(hrefs, asset_urls))
+        return [rendered[href] for href in hrefs]
+    
+    def _resolve_resource(self, base_dir, ref):
+        """把文件中的相对引用解析为压缩包内的路径，文件不存在或越出EPUB时返回 None"""
+        ref = unquote(ref.split('#')[0].split('?')[0])
+        if not ref:
+            return None
+        path = _join_member(base_dir, ref)
+        return path if self._exists(path) else None
+    
+    def asset_url(self, path):
+        """把EPUB中的资源文件保存到资源存储，返回按内容哈希命名的不可变URL
+        
+        CSS中 url() 和 @import 引用的字体、图片等先一并保存并改写为资源URL，
+        因此CSS文件的哈希也随其引用的文件变化。
+        """
+        if path in self._asset_urls:
+            return self._asset_urls[path]
+        
+        ext = posixpath.splitext(path)[1].lower()
+        data = self._read(path)
+        
+        if ext in IMAGE_EXTENSIONS:
+            max_size = current_app.config.get('READER_IMAGE_MAX_SIZE', DEFAULT_READER_IMAGE_MAX_SIZE)
+            data, ext = optimize_reader_image(data, ext, max_size)
+        elif ext == '.css':
+            # 先占位，避免CSS之间循环 @import
+            self._asset_urls[path] = None
+            css = data.decode('utf-8', errors='replace')
+            data = self._rewrite_css(css, posixpath.dirname(path)).encode('utf-8')
+        
+        url = ASSET_URL_PREFIX + get_asset_store().put_asset(data, ext)
+        self._asset_urls[path] = url
+        return url
+    
+    def _rewrite_css(self, css, base_dir):
+        def replace(match):
+            ref = match.group(2)
+            if ref.startswith(EXTERNAL_REF_PREFIXES):
+                return match.group(0)
+            path = self._resolve_resource(base_dir, ref)
+            url = self.asset_url(path) if path else None
+            if not url:
+                return match.group(0)
+            return match.group(0).replace(ref, url)
+        
+        css = _CSS_URL_RE.sub(replace, css)
+        return _CSS_IMPORT_RE.sub(replace, css)
+    
+    def _rewrite_resource_ref(self, chapter_href, ref):
+        """改写章节中的资源引用；资源无法保存时退回旧的按路径查找的资源接口"""
+        if ref.startswith(EXTERNAL_REF_PREFIXES):
+            return ref
+        chapter_dir = posixpath.dirname(posixpath.join(self.content_path, chapter_href))
+        path = self._resolve_resource(chapter_dir, ref)
+        if path:
+            try:
+                return self.asset_url(path)
+            except Exception as e:
+                current_app.logger.error(f"Error storing asset {path}: {str(e)}")
+        resource_path = os.path.normpath(os.path.join(os.path.dirname(chapter_href), ref)).replace(os.sep, '/')
+        return f"/api/books/resource/{resource_path}"
+    
+    @timed(EPUB_STAGE_SECONDS, stage='chapter_html')
     def get_chapter_html(self, href):
         """获取指定章节的HTML内容"""
         try:
-            file_path = os.path.join(self.content_path, href)
+            file_path = _join_member(self.content_path, href)
             
-            if not os.path.exists(file_path):
+            if not self._exists(file_path):
                 print(f"Chapter file not found: {file_path}")
                 return "<h1>章节内容不可用</h1><p>找不到章节文件</p>"
             
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                # 尝试其他编码
-                try:
-                    with open(file_path, 'r', encoding='gbk') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    try:
-                        with open(file_path, 'r', encoding='latin-1') as f:
-                            content = f.read()
-                    except Exception as e:
-                        print(f"Failed to read file with multiple encodings: {str(e)}")
-                        return f"<h1>无法读取章节内容</h1><p>编码错误: {str(e)}</p>"
+                content = decode_chapter_bytes(self._read(file_path))
+            except Exception as e:
+                print(f"Failed to read file with multiple encodings: {str(e)}")
+                return f"<h1>无法读取章节内容</h1><p>编码错误: {str(e)}</p>"
             
             # 修复相对路径
             try:
-                soup = BeautifulSoup(content, 'html.parser')
-                
-                # 修复图片路径
-                for img in soup.find_all('img'):
-                    if img.get('src') and not img['src'].startswith(('http://', 'https://', 'data:')):
-                        img_path = os.path.join(os.path.dirname(href), img['src'])
-                        img['src'] = f"/api/books/resource/{img_path}"
-                
-                # 修复CSS路径
-                for link in soup.find_all('link', rel='stylesheet'):
-                    if link.get('href') and not link['href'].startswith(('http://', 'https://', 'data:')):
-                        css_path = os.path.join(os.path.dirname(href), link['href'])
-                        link['href'] = f"/api/books/resource/{css_path}"
-                
-                # 添加基本样式
-                style = soup.new_tag('style')
-                style.string = """
-                body {
-                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    max-width: 100%;
-                    margin: 0 auto;
-                    padding: 20px;
-                }
-                img {
-                    max-width: 100%;
-                    height: auto;
-                }
-                h1, h2, h3, h4, h5, h6 {
-                    margin-top: 1em;
-                    margin-bottom: 0.5em;
-                }
-                p {
-                    margin-bottom: 1em;
-                }
-                """
-                if soup.head:
-                    soup.head.append(style)
-                else:
-                    # 如果没有head标签，创建一个
-                    head = soup.new_tag('head')
-                    head.append(style)
-                    if soup.html:
-                        soup.head.insert(0, head)
-                    else:
-                        # 如果没有html标签，创建完整的文档结构
-                        html = soup.new_tag('html')
-                        html.append(head)
-                        body = soup.new_tag('body')
-                        for tag in list(soup.contents):
-                            body.append(tag.extract())
-                        html.append(body)
-                        soup = BeautifulSoup(str(html), 'html.parser')
-                
-                return str(soup)
+                return render_chapter_html(content, lambda ref: self._rewrite_resource_ref(href, ref))
             except Exception as e:
                 print(f"Error processing HTML: {str(e)}")
                 return f"<h1>处理HTML内容时出错</h1><p>{str(e)}</p>"
@@ -0,0 +1,148 @@
+"""图片处理
+
+上传时对封面和书内图片做一次性处理：
+
+- 按文件内容识别真实格式，使用正确的扩展名和MIME类型保存。
+- 封面生成书架缩略图（thumb）和详情页中等尺寸（medium）两种 WebP 版本。
+- 书内图片超过阅读器需要的分辨率时等比缩小，保持原格式重新编码。
+
+解码和编码在共享进程池（app.utils.process_pool）中并行执行，处理函数只接收和返回字节，不依赖应用上下文。
+Pillow 是可选依赖，未安装时图片按原样保存，只修正扩展名。
+"""
+import io
+import os
+from app.utils.process_pool import default_workers, get_process_pool
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 文件头特征 -> 扩展名
+_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+    (b'BM', '.bmp')
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.svg')
+
+# 封面的各尺寸版本：名称 -> 最大宽高
+COVER_RENDITIONS = {
+    'thumb': (240, 360),
+    'medium': (600, 900)
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+def cover_rendition_filename(cover_filename, name):
+    """封面某个尺寸版本的文件名，如 <uuid>-thumb.webp"""
+    return f"{os.path.splitext(cover_filename)[0]}-{name}.webp"
+
+def detect_image_ext(data, default=None):
+    """按文件内容判断图片格式，返回扩展名；无法识别时返回 default"""
+    for signature, ext in _SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    head = data[:512].lstrip()
+    if head.startswith(b'<?xml') and b'<svg' in data[:2048] or head.startswith(b'<svg'):
+        return '.svg'
+    return default
+
+def _open_image(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+def _encode(image, ext):
+    output = io.BytesIO()
+    if ext == '.webp':
+        image.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif ext == '.jpg':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif ext == '.png':
+        image.save(output, 'PNG', optimize=True)
+    else:
+        raise ValueError(f"Unsupported output format: {ext}")
+    return output.getvalue()
+
+def _to_web_mode(image):
+    # WebP 只支持 RGB / RGBA，调色板等模式先转换
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    has_alpha = image.mode in ('LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+def make_cover_renditions(data):
+    """生成封面的各尺寸 WebP 版本，返回 {名称: 字节}；无法解码时返回空字典"""
+    if Image is None:
+        return {}
+    try:
+        image = _to_web_mode(_open_image(data))
+    except Exception:
+        return {}
+    renditions = {}
+    for name, size in COVER_RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail(size, Image.LANCZOS)
+        renditions[name] = _encode(rendition, '.webp')
+    return renditions
+
+def optimize_reader_image(data, ext, max_size):
+    """把超过 max_size（宽, 高）的书内图片等比缩小，返回 (字节, 扩展名)
+
+    扩展名按内容修正；未超出尺寸、动画GIF、SVG 或无法解码的图片原样返回。
+    """
+    ext = detect_image_ext(data, ext.lower())
+    if ext == '.jpeg':
+        ext = '.jpg'
+    if Image is None or ext not in ('.jpg', '.png', '.webp', '.bmp', '.gif'):
+        return data, ext
+    try:
+        image = _open_image(data)
+    except Exception:
+        return data, ext
+    if getattr(image, 'is_animated', False) or (image.width <= max_size[0] and image.height <= max_size[1]):
+        return data, ext
+
+    image.thumbnail(max_size, Image.LANCZOS)
+    # BMP、GIF 缩小后改存为 PNG；其余格式保持不变
+    out_ext = ext if ext in ('.jpg', '.png', '.webp') else '.png'
+    if out_ext == '.webp':
+        image = _to_web_mode(image)
+    optimized = _encode(image, out_ext)
+    if len(optimized) >= len(data) and out_ext == ext:
+        return data, ext
+    return optimized, out_ext
+
+def _optimize_reader_image_args(args):
+    return optimize_reader_image(*args)
+
+class ImagePool:
+    """在共享进程池中执行图片处理"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def optimize_reader_images(self, images, max_size):
+        """并行处理多张书内图片，images 为 [(字节, 扩展名)]，返回同样顺序的 [(字节, 扩展名)]"""
+        return self.pool.map(_optimize_reader_image_args, [(data, ext, max_size) for data, ext in images])
+
+    def iter_optimized_reader_images(self, images, max_size):
+        """与 optimize_reader_images 相同，但按需读取 images 并逐个产出结果，同时只有少量图片在内存中"""
+        return self.pool.imap(_optimize_reader_image_args, ((data, ext, max_size) for data, ext in images))
+
+    def make_cover_renditions(self, data):
+        return self.pool.map(make_cover_renditions, [data])[0]
+
+def get_image_pool():
+    """获取当前应用配置的图片处理进程池"""
+    from flask import current_app
+    return ImagePool(get_process_pool(current_app.config.get('IMAGE_WORKERS', default_workers())))
@@ -0,0 +1,227 @@
+"""流式入库
+
+上传的EPUB按章节流经以下阶段，相邻阶段之间只保留有限的几批章节：
+
+    读取压缩包成员 → 解码 → 渲染HTML → 提取纯文本/统计词频   （渲染进程池，见 EpubService.iter_rendered_chapters）
+    → 按批写入数据库 → 加入检索索引构建器                     （请求进程）
+
+进程池最多同时持有几批章节，数据库写入跟不上时渲染随之暂停（背压）；
+每批章节提交后，其HTML已在内容存储中、纯文本已在数据库中，内存中只保留检索词频。
+因此单次上传的内存占用不随书的大小增长。
+
+书籍记录在写入章节之前创建，入库过程中书架上已经可以看到这本书，章节逐批出现；
+任何一批失败时删除书籍，已写入的章节随之级联删除。
+
+上传接口和批量导入脚本（import_library.py）都通过 ingest_epub 入库。
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import ExitStack
+
+from flask import current_app
+
+from app.models.book import Book, BookResource, Chapter
+from app.services.ai_job_service import has_chapter_text
+from app.services.blob_store import ASSET_URL_PREFIX
+from app.services.epub_service import EpubService
+from app.services.search_service import count_terms, get_search_index
+from app.services.upload_service import validate_epub_archive
+from app.utils.process_pool import default_workers, get_process_pool
+
+# 每次提交到数据库的章节数
+DEFAULT_INGEST_BATCH_SIZE = 32
+
+def iter_chapter_records(epub, chapters, asset_urls):
+    """按章节顺序产出 (章节记录, 词频)，章节记录可以直接传给 Chapter.create_many
+
+    多个章节指向同一个文件时，该文件的渲染结果保留到最后一个使用它的章节为止。
+    """
+    hrefs = [chapter['href'] for chapter in chapters]
+    last_use = {href: i for i, href in enumerate(hrefs)}
+    rendered = {}
+    results = epub.iter_rendered_chapters(hrefs, asset_urls)
+    try:
+        for i, chapter in enumerate(chapters):
+            href = chapter['href']
+            # 渲染结果按各文件第一次出现的顺序产出，所需的结果一定已经产出或即将产出
+            while href not in rendered:
+                done_href, result = next(results)
+                rendered[done_href] = result
+            html_hash, text_record, term_counts, error = rendered[href]
+            if last_use[href] == i:
+                del rendered[href]
+
+            record = {'title': chapter['title'], 'href': href}
+            if error:
+                current_app.logger.error(f"Error rendering content for chapter {i+1}: {error}")
+            else:
+                record['html_hash'] = html_hash
+                record.update(text_record)
+            yield record, term_counts
+    finally:
+        results.close()
+
+def ingest_chapters(book_id, epub, chapters, asset_urls):
+    """渲染并分批保存一本书的章节，全部保存后建立检索索引，返回保存的章节数
+
+    保存章节失败时抛出异常，由调用方删除书籍；建立索引失败只记录日志。
+    """
+    batch_size = current_app.config.get('INGEST_BATCH_SIZE', DEFAULT_INGEST_BATCH_SIZE)
+    indexer = get_search_index().book_indexer(book_id)
+    saved = 0
+    batch = []
+
+    def flush():
+        nonlocal saved
+        chapter_ids = Chapter.create_many(book_id, [record for record, _ in batch], start=saved)
+        for chapter_id, (_, term_counts) in zip(chapter_ids, batch):
+            indexer.add(chapter_id, term_counts or {})
+        saved += len(batch)
+        batch.clear()
+
+    records = iter_chapter_records(epub, chapters, asset_urls)
+    try:
+        for item in records:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except Exception:
+        indexer.discard()
+        raise
+    finally:
+        records.close()
+
+    # 建立全文检索索引，失败时不影响上传
+    try:
+        indexer.commit()
+    except Exception as e:
+        current_app.logger.error(f"Error indexing book {book_id} for search: {str(e)}")
+
+    return saved
+
+def reindex_book(book_id):
+    """用数据库中已保存的章节纯文本重新建立一本书的检索索引，返回加入索引的章节数
+
+    全文检索上线之前入库的书由 reindex_search.py 通过这里加入索引。
+    旧数据缺少纯文本的章节从EPUB中提取一次并回填；没有可用文本的章节以空文档加入。
+    """
+    batch_size = current_app.config.get('INGEST_BATCH_SIZE', DEFAULT_INGEST_BATCH_SIZE)
+    pool = get_process_pool(current_app.config.get('RENDER_WORKERS', default_workers()))
+    chapter_ids = [chapter['id'] for chapter in Chapter.get_toc(book_id)]
+    indexer = get_search_index().book_indexer(book_id)
+
+    with ExitStack() as stack:
+        epub = None
+        try:
+            for i in range(0, len(chapter_ids), batch_size):
+                rows = Chapter.get_bundle(book_id, 'plain_text', chapter_ids=chapter_ids[i:i + batch_size])
+                # 书籍已被删除
+                if rows is None:
+                    indexer.discard()
+                    return 0
+                texts = []
+                for row in rows:
+                    if row['plain_text'] is None:
+                        if epub is None:
+                            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], row['file_path'])
+                            epub = stack.enter_context(EpubService(file_path))
+                        text_record = epub.get_chapter_text(row['href'])
+                        Chapter.update_plain_text(row['id'], text_record)
+                        row['plain_text'] = text_record['plain_text']
+                    texts.append(row['plain_text'] if has_chapter_text(row['plain_text']) else '')
+                for row, counts in zip(rows, pool.map(count_terms, texts)):
+                    indexer.add(row['id'], counts)
+        except Exception:
+            indexer.discard()
+            raise
+    indexer.commit()
+    return len(chapter_ids)
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件内容的 SHA-256，用于识别重复导入的EPUB"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ingest_epub(file_path, file_hash=None):
+    """解析已保存在上传目录中的EPUB并入库，返回书籍信息
+
+    书籍记录中保存文件名（相对上传目录）和文件内容哈希。
+    """
+    with EpubService(file_path) as epub:
+        metadata = epub.get_metadata()  # 先获取元数据，这会设置 cover_path
+        chapters = epub.get_chapters()
+        
+        # 打印完整的EPUB解析结果
+        current_app.logger.info("=== EPUB文件解析结果 ===")
+        current_app.logger.info(f"标题: {metadata.get('title', 'Unknown Title')}")
+        current_app.logger.info(f"作者: {metadata.get('author', 'Unknown Author')}")
+        current_app.logger.info(f"封面图片: {'已找到' if metadata.get('cover_path') else '未找到'}")
+        current_app.logger.info(f"\n总章节数: {len(chapters)}")
+        current_app.logger.info("章节列表:")
+        for i, chapter in enumerate(chapters):
+            current_app.logger.info(f"第{i+1}章: {chapter['title']}")
+            current_app.logger.info(f"  链接: {chapter['href']}")
+        current_app.logger.info("=== 解析结果结束 ===")
+        
+        # 先保存书内图片（进程池中并行缩放）、CSS和字体，渲染章节时直接引用
+        try:
+            asset_urls = epub.prepare_assets()
+        except Exception as e:
+            current_app.logger.error(f"Error preparing assets: {str(e)}")
+            asset_urls = {}
+        
+        # 保存封面图片
+        cover_filename = epub.save_cover_image(current_app.config['COVER_FOLDER'])
+        cover_path = cover_filename if cover_filename else None
+        
+        # 保存书籍信息到数据库
+        book_id = Book.create(
+            title=metadata.get('title', 'Unknown Title'),
+            author=metadata.get('author', 'Unknown Author'),
+            cover_path=cover_path,
+            file_path=os.path.basename(file_path),
+            file_hash=file_hash,
+            cover_renditions=','.join(epub.cover_renditions) if cover_path else ''
+        )
+        
+        # 章节在进程池中渲染，按批写入数据库并建立检索索引，失败时删除书籍（章节级联删除）
+        try:
+            BookResource.create_many(book_id, {path: url[len(ASSET_URL_PREFIX):] for path, url in asset_urls.items()})
+            ingest_chapters(book_id, epub, chapters, asset_urls)
+        except Exception:
+            Book.delete(book_id)
+            raise
+    
+    return {
+        'id': book_id,
+        'title': metadata.get('title'),
+        'author': metadata.get('author'),
+        'cover': cover_path,
+        'chapters': len(chapters)
+    }
+
+def import_epub(source_path, file_hash=None):
+    """把上传目录之外的EPUB复制到上传目录并入库，失败时删除复制的文件
+
+    与上传接口相同，先只读中央目录检查文件结构，不合格的文件不复制。
+    """
+    validate_epub_archive(source_path)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    os.makedirs(current_app.config['COVER_FOLDER'], exist_ok=True)
+    
+    file_path = os.path.join(upload_folder, f"{uuid.uuid4()}.epub")
+    shutil.copyfile(source_path, file_path)
+    try:
+        return ingest_epub(file_path, file_hash or file_sha256(file_path))
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
@@ -0,0 +1,578 @@
+"""全文检索
+
+章节纯文本在上传时写入倒排索引，检索时按 BM25 打分返回章节命中和摘要片段。
+
+分词：连续的CJK字符切分为相邻二字组（bigram，单字时保留单字），拉丁字母和数字
+按单词切分并转为小写。查询使用同样的分词方式。
+
+索引由若干不可变的段文件（segment）和一个 manifest.json 组成：
+
+- 每次上传为该书写入一个新段；相近大小的段按对数规律合并，段的数量保持在很少的几个。
+- 删除书籍时，若某个段只包含这本书则直接移除该段，否则记入 manifest 的
+  deleted_books 中，检索时跳过，合并时真正清除。
+- reindex_search.py 为全文检索上线之前入库的书补建索引，并定期把所有段合并为一个、清除删除记录。
+- 段文件通过 mmap 打开，不需要在启动时加载；词典按字节序排序，检索时二分查找。
+
+段文件格式（小端）：
+
+    header   magic(4s) version(H) doc_width(B) reserved(B) n_docs(I) n_terms(I) total_len(Q)
+    docs     n_docs * (book_id(I) chapter_id(I) doc_len(I))
+    terms    n_terms * (term_offset(I) df(I) postings_offset(I) term_len(H))
+    strings  按字节序排列的词项 UTF-8 字节
+    postings 每个词项：df 个文档序号（H 或 I，见 doc_width）+ df 个词频（B，上限255）
+
+定长的倒排数组可以直接用 memoryview.cast 从 mmap 中读取，无需逐个解码。
+"""
+import array
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import current_app
+
+from app.models.backends import _lock_file, _unlock_file
+
+_CJK = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+_TOKEN_RE = re.compile(f'[{_CJK}]+|[0-9A-Za-zÀ-ɏ]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+MAX_TOKEN_LENGTH = 64
+
+def tokenize(text):
+    """把文本切分为检索词项：CJK 二字组 + 小写的拉丁单词"""
+    for match in _TOKEN_RE.finditer(text):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                yield run
+            else:
+                for i in range(len(run) - 1):
+                    yield run[i:i + 2]
+        elif len(run) <= MAX_TOKEN_LENGTH:
+            yield run.lower()
+
+def count_terms(text):
+    """统计文本的词项频率 {词项: 次数}"""
+    return dict(Counter(tokenize(text)))
+
+_MAGIC = b'EPSG'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHBBIIQ')
+_DOC = struct.Struct('<III')
+_TERM = struct.Struct('<IIIH')
+# 小端机器上文档序号数组可以直接从 mmap 按本机字节序读取
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+def write_segment(path, docs, postings):
+    """写入段文件
+
+    docs: [(book_id, chapter_id, doc_len)]，文档序号即列表下标
+    postings: {term: [(doc_index, tf)]}，按文档序号递增
+    """
+    terms = sorted((term.encode('utf-8'), plist) for term, plist in postings.items())
+    write_segment_terms(path, docs, (
+        (term, [doc for doc, _ in plist], bytes(min(tf, 255) for _, tf in plist))
+        for term, plist in terms
+    ))
+
+def write_segment_terms(path, docs, terms):
+    """流式写入段文件
+
+    terms 按词项字节序递增产出 (词项UTF-8字节, 文档序号序列, 词频字节串)。
+    词项表、词项字符串和倒排数据先分别写入临时文件，全部词项写完后再拼接，
+    内存中只有当前一个词项的倒排。
+    """
+    doc_format = 'H' if len(docs) <= 0xFFFF else 'I'
+    directory = os.path.dirname(path)
+    n_terms = strings_size = blocks_size = 0
+    with tempfile.TemporaryFile(dir=directory) as term_table, \
+            tempfile.TemporaryFile(dir=directory) as strings, \
+            tempfile.TemporaryFile(dir=directory) as blocks:
+        # 词项表中暂存相对偏移，拼接时加上各部分的起始位置
+        for term, doc_indices, tfs in terms:
+            block = struct.pack(f'<{len(doc_indices)}{doc_format}', *doc_indices) + tfs
+            term_table.write(_TERM.pack(strings_size, len(doc_indices), blocks_size, len(term)))
+            strings.write(term)
+            blocks.write(block)
+            n_terms += 1
+            strings_size += len(term)
+            blocks_size += len(block)
+
+        header_size = _HEADER.size + _DOC.size * len(docs) + _TERM.size * n_terms
+        postings_start = header_size + strings_size
+        total_len = sum(doc_len for _, _, doc_len in docs)
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, struct.calcsize(doc_format), 0, len(docs), n_terms, total_len))
+            for doc in docs:
+                f.write(_DOC.pack(*doc))
+            term_table.seek(0)
+            while True:
+                chunk = term_table.read(_TERM.size * 4096)
+                if not chunk:
+                    break
+                f.write(b''.join(
+                    _TERM.pack(header_size + term_offset, df, postings_start + offset, term_len)
+                    for term_offset, df, offset, term_len in _TERM.iter_unpack(chunk)
+                ))
+            strings.seek(0)
+            shutil.copyfileobj(strings, f)
+            blocks.seek(0)
+            shutil.copyfileobj(blocks, f)
+
+def merge_segments(path, segments, deleted=()):
+    """把多个段按顺序合并写入 path，跳过 deleted 中书籍的文档，返回合并后的文档列表
+
+    各段的词项表已按字节序排列，逐个词项多路归并，内存中只有当前一个词项的倒排。
+    没有剩余文档时不写文件。
+    """
+    docs = []
+    remaps = []
+    for segment in segments:
+        remap = {}
+        for index, doc in enumerate(segment.docs()):
+            if doc[0] not in deleted:
+                remap[index] = len(docs)
+                docs.append(doc)
+        remaps.append(remap)
+    if not docs:
+        return docs
+
+    def tagged(index, segment):
+        for term, doc_indices, tfs in segment.iter_terms():
+            yield term, index, doc_indices, tfs
+
+    def merged_terms():
+        current, out_docs, out_tfs = None, [], bytearray()
+        streams = [tagged(index, segment) for index, segment in enumerate(segments)]
+        # 同一词项按段的顺序出现，合并后的文档序号仍然递增
+        for term, index, doc_indices, tfs in heapq.merge(*streams, key=lambda item: (item[0], item[1])):
+            if term != current:
+                if out_docs:
+                    yield current, out_docs, bytes(out_tfs)
+                current, out_docs, out_tfs = term, [], bytearray()
+            remap = remaps[index]
+            for doc_index, tf in zip(doc_indices, tfs):
+                new_index = remap.get(doc_index)
+                if new_index is not None:
+                    out_docs.append(new_index)
+                    out_tfs.append(tf)
+        if out_docs:
+            yield current, out_docs, bytes(out_tfs)
+
+    write_segment_terms(path, docs, merged_terms())
+    return docs
+
+class Segment:
+    """通过 mmap 打开的只读段"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.doc_width, _, self.n_docs, self.n_terms, self.total_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Invalid search segment: {path}")
+        self._doc_format = 'H' if self.doc_width == 2 else 'I'
+        self._docs_offset = _HEADER.size
+        self._terms_offset = self._docs_offset + _DOC.size * self.n_docs
+
+    def close(self):
+        self._mm.close()
+
+    def doc(self, index):
+        """返回 (book_id, chapter_id, doc_len)"""
+        return _DOC.unpack_from(self._mm, self._docs_offset + _DOC.size * index)
+
+    def docs(self):
+        for index in range(self.n_docs):
+            yield self.doc(index)
+
+    def _term_entry(self, index):
+        return _TERM.unpack_from(self._mm, self._terms_offset + _TERM.size * index)
+
+    def _term_at(self, index):
+        term_offset, _, _, term_len = self._term_entry(index)
+        return self._mm[term_offset:term_offset + term_len]
+
+    def postings(self, term):
+        """返回 (文档序号数组, 词频数组)，词项不存在时返回 None"""
+        key = term.encode('utf-8')
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.n_terms or self._term_at(lo) != key:
+            return None
+        _, df, offset, _ = self._term_entry(lo)
+        view = memoryview(self._mm)
+        doc_end = offset + df * self.doc_width
+        if _NATIVE_LITTLE_ENDIAN:
+            docs = view[offset:doc_end].cast(self._doc_format)
+        else:
+            # 段文件固定为小端序，大端机器上不能直接按本机字节序解释
+            docs = array.array(self._doc_format, view[offset:doc_end])
+            docs.byteswap()
+        return docs, view[doc_end:doc_end + df]
+
+    def iter_terms(self):
+        """按字节序产出 (词项UTF-8字节, 文档序号元组, 词频字节串)
+
+        合并时顺序读完整个段，已读过的页定期从进程内存中释放，RSS 不随段的大小增长。
+        """
+        for index in range(self.n_terms):
+            if index and index % 4096 == 0 and hasattr(mmap, 'MADV_DONTNEED'):
+                self._mm.madvise(mmap.MADV_DONTNEED)
+            term_offset, df, offset, term_len = self._term_entry(index)
+            doc_end = offset + df * self.doc_width
+            docs = struct.unpack_from(f'<{df}{self._doc_format}', self._mm, offset)
+            yield self._mm[term_offset:term_offset + term_len], docs, self._mm[doc_end:doc_end + df]
+
+class SearchIndex:
+    """由 manifest 管理的多段倒排索引，同一目录可被多个进程同时读取和更新"""
+
+    # BM25 参数
+    K1 = 1.2
+    B = 0.75
+
+    # df 超过文档总数该比例的词项（如 the、of）区分度很低，查询中有其他词项时忽略
+    COMMON_TERM_RATIO = 0.5
+
+    # 自动合并只产生不超过该文档数的段，避免单次上传触发整个索引重写；
+    # 更大的合并交给 optimize()（由 reindex_search.py 定期执行）
+    MAX_MERGE_DOCS = 8192
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._segments = {}
+
+    # ---- manifest 与段文件 ----
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.root, 'manifest.json')
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(os.path.join(self.root, 'index.lock'), 'a+') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield
+            finally:
+                _unlock_file(lock_file)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'segments': [], 'deleted_books': []}
+
+    def _write_manifest(self, manifest):
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix='.manifest-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self._manifest_path)
+
+    def _current(self, attempts=5):
+        """返回最新的 manifest 和对应的已打开段，manifest 变化时才重新加载
+
+        不再出现在 manifest 中的段只从字典中移除而不关闭：其他线程的查询可能仍在读取它
+        （持有 postings 返回的 memoryview），由最后一个引用释放时回收 mmap。
+        读取 manifest 后段文件可能已被其他进程合并删除，此时重新读取 manifest。
+        """
+        for attempt in range(attempts):
+            try:
+                mtime = os.stat(self._manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            with self._lock:
+                if mtime != self._manifest_mtime or self._manifest is None:
+                    manifest = self._read_manifest()
+                    names = {entry['name'] for entry in manifest['segments']}
+                    try:
+                        opened = {name: self._segments.get(name) or Segment(os.path.join(self.root, name))
+                                  for name in names}
+                    except FileNotFoundError:
+                        if attempt == attempts - 1:
+                            raise
+                        continue
+                    self._segments = opened
+                    self._manifest = manifest
+                    self._manifest_mtime = mtime
+                segments = [(entry, self._segments[entry['name']]) for entry in self._manifest['segments']]
+                return self._manifest, segments
+
+    def _write_new_segment(self, write):
+        """write(临时路径) 写入段文件并返回其中的文档列表；没有文档时不产生新段，返回 None"""
+        os.makedirs(self.root, exist_ok=True)
+        name = f'seg-{uuid.uuid4().hex}.idx'
+        path = os.path.join(self.root, name)
+        temp_path = path + '.tmp'
+        try:
+            docs = write(temp_path)
+            if not docs:
+                return None
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return {
+            'name': name,
+            'n_docs': len(docs),
+            'total_len': sum(doc[2] for doc in docs),
+            'books': sorted({doc[0] for doc in docs})
+        }
+
+    def _remove_segment_files(self, entries):
+        for entry in entries:
+            try:
+                os.remove(os.path.join(self.root, entry['name']))
+            except FileNotFoundError:
+                pass
+
+    # ---- 更新 ----
+
+    def book_indexer(self, book_id):
+        """逐章添加一本书的索引，不需要同时持有全书的文本，全部添加后调用 commit()"""
+        return BookIndexer(self, book_id)
+
+    def _commit_book(self, book_id, write):
+        """把 write(路径) 写出的一本书的段加入索引"""
+        # 段文件名唯一，在锁外写入，不阻塞其他进程更新索引
+        entry = self._write_new_segment(write)
+        if entry is None:
+            return
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            manifest['segments'].append(entry)
+            # 同一个 book_id 重新建立索引时，新段中的文档有效
+            manifest['deleted_books'] = [b for b in manifest['deleted_books'] if b != book_id]
+            removed = self._merge_tail(manifest)
+            self._write_manifest(manifest)
+        self._remove_segment_files(removed)
+
+    def remove_book(self, book_id):
+        """从索引中删除一本书"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            removed = [e for e in manifest['segments'] if e['books'] == [book_id]]
+            manifest['segments'] = [e for e in manifest['segments'] if e['books'] != [book_id]]
+            if any(book_id in e['books'] for e in manifest['segments']):
+                manifest['deleted_books'] = sorted(set(manifest['deleted_books']) | {book_id})
+            self._write_manifest(manifest)
+        self._remove_segment_files(removed)
+
+    def _merge_tail(self, manifest):
+        """对数式合并：最新的段不小于前一个段的一半时两者合并，返回被替换的段"""
+        removed = []
+        segments = manifest['segments']
+        deleted = set(manifest['deleted_books'])
+        while len(segments) >= 2 and segments[-1]['n_docs'] * 2 >= segments[-2]['n_docs']:
+            older, newer = segments[-2], segments[-1]
+            if older['n_docs'] + newer['n_docs'] > self.MAX_MERGE_DOCS:
+                break
+            merged = self._merge_segments([older, newer], deleted)
+            segments[-2:] = [merged] if merged else []
+            removed.extend([older, newer])
+        # 已经没有任何段包含的删除记录可以清除
+        remaining = {b for e in segments for b in e['books']}
+        manifest['deleted_books'] = sorted(deleted & remaining)
+        return removed
+
+    def _merge_segments(self, entries, deleted):
+        segments = [Segment(os.path.join(self.root, entry['name'])) for entry in entries]
+        try:
+            return self._write_new_segment(lambda path: merge_segments(path, segments, deleted))
+        finally:
+            for segment in segments:
+                segment.close()
+
+    def optimize(self):
+        """把所有段合并为一个并清除已删除的书籍"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            removed = manifest['segments']
+            merged = self._merge_segments(removed, set(manifest['deleted_books'])) if removed else None
+            manifest['segments'] = [merged] if merged else []
+            manifest['deleted_books'] = []
+            self._write_manifest(manifest)
+        self._remove_segment_files(removed)
+
+    def indexed_books(self):
+        """已建立索引且未被删除的书籍 id"""
+        manifest = self._read_manifest()
+        return {b for entry in manifest['segments'] for b in entry['books']} - set(manifest['deleted_books'])
+
+    def clear(self):
+        """删除所有段，重建索引时使用"""
+        with self._write_lock():
+            removed = self._read_manifest()['segments']
+            self._write_manifest({'segments': [], 'deleted_books': []})
+        self._remove_segment_files(removed)
+
+    # ---- 检索 ----
+
+    def search(self, query, limit=20, book_id=None):
+        """返回按 BM25 得分排序的 [(score, book_id, chapter_id)]"""
+        query_terms = Counter(tokenize(query))
+        if not query_terms:
+            return []
+
+        manifest, segments = self._current()
+        deleted = set(manifest['deleted_books'])
+        # 文档总数和平均长度按整个索引统计，包含尚未合并清除的已删除文档
+        n_docs = sum(entry['n_docs'] for entry, _ in segments)
+        if not n_docs:
+            return []
+        avg_len = sum(entry['total_len'] for entry, _ in segments) / n_docs or 1
+        if book_id is not None:
+            segments = [(entry, segment) for entry, segment in segments if book_id in entry['books']]
+
+        # 先取出各段的倒排表并统计 df
+        term_postings = {}
+        for term in query_terms:
+            found = []
+            df = 0
+            for index, (_, segment) in enumerate(segments):
+                postings = segment.postings(term)
+                if postings is not None:
+                    found.append((index, postings))
+                    df += len(postings[0])
+            if found:
+                term_postings[term] = (df, found)
+        if not term_postings:
+            return []
+
+        if len(term_postings) > 1:
+            selective = {t: v for t, v in term_postings.items() if v[0] <= n_docs * self.COMMON_TERM_RATIO}
+            if selective:
+                term_postings = selective
+
+        scores = defaultdict(float)
+        for term, (df, found) in term_postings.items():
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            weight = idf * query_terms[term]
+            for index, (docs, tfs) in found:
+                segment = segments[index][1]
+                for doc_index, tf in zip(docs, tfs):
+                    doc_book_id, chapter_id, doc_len = segment.doc(doc_index)
+                    if doc_book_id in deleted or (book_id is not None and doc_book_id != book_id):
+                        continue
+                    norm = tf + self.K1 * (1 - self.B + self.B * doc_len / avg_len)
+                    scores[(doc_book_id, chapter_id)] += weight * tf * (self.K1 + 1) / norm
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, doc_book_id, chapter_id) for (doc_book_id, chapter_id), score in top]
+
+class BookIndexer:
+    """一本书的索引构建器：按章节顺序 add(chapter_id, 词频)，commit() 时写入一个新段
+
+    内存中的倒排超过 SPILL_POSTINGS 条时先写成临时段，commit() 时与之流式合并，
+    因此构建索引的内存占用不随书的大小增长。
+    """
+
+    SPILL_POSTINGS = 1 << 17
+
+    def __init__(self, index, book_id):
+        self.index = index
+        self.book_id = book_id
+        self._docs = []
+        self._postings = defaultdict(list)
+        self._n_postings = 0
+        self._runs = []
+
+    def add(self, chapter_id, counts):
+        doc_index = len(self._docs)
+        self._docs.append((self.book_id, chapter_id, sum(counts.values())))
+        for term, tf in counts.items():
+            self._postings[term].append((doc_index, tf))
+        self._n_postings += len(counts)
+        if self._n_postings >= self.SPILL_POSTINGS:
+            self._spill()
+
+    def _spill(self):
+        os.makedirs(self.index.root, exist_ok=True)
+        path = os.path.join(self.index.root, f'run-{uuid.uuid4().hex}.tmp')
+        self._runs.append(path)
+        write_segment(path, self._docs, self._postings)
+        self._docs = []
+        self._postings = defaultdict(list)
+        self._n_postings = 0
+
+    def _write_runs(self, path):
+        if self._docs:
+            self._spill()
+        segments = [Segment(run) for run in self._runs]
+        try:
+            return merge_segments(path, segments)
+        finally:
+            for segment in segments:
+                segment.close()
+
+    def _write(self, path):
+        if self._runs:
+            return self._write_runs(path)
+        if self._docs:
+            write_segment(path, self._docs, self._postings)
+        return self._docs
+
+    def commit(self):
+        try:
+            self.index._commit_book(self.book_id, self._write)
+        finally:
+            self.discard()
+
+    def discard(self):
+        """丢弃尚未提交的内容，删除已写出的临时段"""
+        for run in self._runs:
+            if os.path.exists(run):
+                os.remove(run)
+        self._docs = []
+        self._postings = defaultdict(list)
+        self._n_postings = 0
+        self._runs = []
+
+def make_snippet(text, query, width=120):
+    """截取包含查询词的一段文本作为摘要"""
+    if not text:
+        return ''
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in set(tokenize(query))]
+    positions = [p for p in positions if p >= 0]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    snippet = ' '.join(text[start:start + width].split())
+    if start > 0:
+        snippet = '…' + snippet
+    if start + width < len(text):
+        snippet += '…'
+    return snippet
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_search_index():
+    """获取当前应用的检索索引（每个进程每个目录一个实例）"""
+    root = current_app.config.get('SEARCH_INDEX_FOLDER') or os.path.join(current_app.config['UPLOAD_FOLDER'], 'search')
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = SearchIndex(root)
+        return _indexes[root]
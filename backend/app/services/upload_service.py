@@ -0,0 +1,170 @@
+"""EPUB 上传的流式接收与校验
+
+上传请求的 multipart 正文边解析边写入上传目录中的目标文件，同时计算内容哈希：
+
+- 文件名不是 .epub 时在写入任何数据之前拒绝。
+- 开头几个字节到达时检查 ZIP 文件头；第一个条目是 mimetype 时同时检查其内容，
+  不合格的文件不再读取请求的剩余部分。
+- 正文接收完后只读取 ZIP 中央目录做结构检查：条目数、解压后的总大小、单个条目的压缩率
+  （防止压缩炸弹）、META-INF/container.xml 和 mimetype 条目，全部通过后才交给 EpubService。
+
+批量导入对本地文件使用同样的 validate_epub_archive 检查。
+"""
+import hashlib
+import os
+import struct
+import zipfile
+
+from flask import current_app, request
+from werkzeug.formparser import FormDataParser
+
+EPUB_MIMETYPE = b'application/epub+zip'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# ZIP 本地文件头：签名、版本、标志、压缩方法、时间、日期、CRC、压缩后大小、原始大小、文件名长度、扩展字段长度
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+# 在文件开头检查的字节数，足够覆盖 mimetype 条目
+_HEAD_SIZE = 256
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_UNCOMPRESSED_SIZE = 512 * 1024 * 1024
+DEFAULT_MAX_COMPRESSION_RATIO = 100
+# 小于该大小的条目不检查压缩率（很小的重复内容压缩率本来就高）
+_RATIO_CHECK_MIN_SIZE = 1024 * 1024
+
+INVALID_FORMAT_MESSAGE = 'Invalid file format. Only EPUB files are allowed.'
+
+class InvalidUpload(Exception):
+    """上传的文件不是可以接受的 EPUB"""
+    pass
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'epub'
+
+def check_epub_head(head):
+    """检查文件开头的字节：ZIP 文件头，以及第一个条目为 mimetype 时的内容"""
+    if len(head) >= len(ZIP_MAGIC) and not head.startswith(ZIP_MAGIC):
+        raise InvalidUpload('Invalid EPUB: not a ZIP archive')
+    if len(head) < _LOCAL_HEADER.size:
+        return
+    _, _, _, method, _, _, _, _, size, name_len, extra_len = _LOCAL_HEADER.unpack_from(head)
+    start = _LOCAL_HEADER.size + name_len + extra_len
+    if head[_LOCAL_HEADER.size:_LOCAL_HEADER.size + name_len] != b'mimetype' or method != 0:
+        return
+    if start + size <= len(head) and head[start:start + size].strip() != EPUB_MIMETYPE:
+        raise InvalidUpload('Invalid EPUB: wrong mimetype')
+
+def validate_epub_archive(path):
+    """只读取中央目录检查 EPUB 的结构，不解压任何内容（mimetype 条目除外），不合格时抛出 InvalidUpload"""
+    config = current_app.config
+    max_entries = config.get('UPLOAD_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    max_size = config.get('UPLOAD_MAX_UNCOMPRESSED_SIZE', DEFAULT_MAX_UNCOMPRESSED_SIZE)
+    max_ratio = config.get('UPLOAD_MAX_COMPRESSION_RATIO', DEFAULT_MAX_COMPRESSION_RATIO)
+
+    with open(path, 'rb') as f:
+        check_epub_head(f.read(_HEAD_SIZE))
+
+    try:
+        archive = zipfile.ZipFile(path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise InvalidUpload(f'Invalid EPUB: corrupt ZIP archive ({e})')
+
+    with archive:
+        infos = archive.infolist()
+        if len(infos) > max_entries:
+            raise InvalidUpload(f'Invalid EPUB: too many entries ({len(infos)} > {max_entries})')
+
+        total = 0
+        for info in infos:
+            total += info.file_size
+            if total > max_size:
+                raise InvalidUpload(f'Invalid EPUB: uncompressed size exceeds {max_size} bytes')
+            if info.file_size >= _RATIO_CHECK_MIN_SIZE and info.file_size > max(info.compress_size, 1) * max_ratio:
+                raise InvalidUpload(f'Invalid EPUB: suspicious compression ratio for {info.filename}')
+
+        names = {info.filename for info in infos}
+        if 'META-INF/container.xml' not in names:
+            raise InvalidUpload('Invalid EPUB: container.xml not found')
+
+        # 规范要求的 mimetype 条目；缺少时仍可按 container.xml 解析，只在内容不对时拒绝
+        if 'mimetype' in names:
+            info = archive.getinfo('mimetype')
+            if info.file_size > _HEAD_SIZE or archive.read(info).strip() != EPUB_MIMETYPE:
+                raise InvalidUpload('Invalid EPUB: wrong mimetype')
+
+class StreamingUpload:
+    """multipart 解析时使用的文件流：直接写入目标文件，边写边计算 SHA-256 并检查文件开头"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self._file = open(path, 'w+b')
+        self._hash = hashlib.sha256()
+        self._head = b''
+
+    def write(self, data):
+        if len(self._head) < _HEAD_SIZE:
+            self._head += data[:_HEAD_SIZE - len(self._head)]
+            check_epub_head(self._head)
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        # read、seek、close 等由目标文件提供
+        return getattr(self._file, name)
+
+def receive_epub_upload(file_path, field='file'):
+    """解析当前上传请求，把 field 字段中的 EPUB 流式写入 file_path 并检查结构
+
+    返回已关闭的 StreamingUpload（含 sha256 和 size）；文件不合格时删除已写入的部分并抛出 InvalidUpload。
+    请求正文超过 MAX_CONTENT_LENGTH 时照常抛出 RequestEntityTooLarge。
+    """
+    streams = []
+
+    def stream_factory(total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            # 没有选择文件：丢弃空内容，由下面按字段返回错误
+            return open(os.devnull, 'w+b')
+        if not allowed_file(filename):
+            raise InvalidUpload(INVALID_FORMAT_MESSAGE)
+        if streams:
+            raise InvalidUpload('Only one file can be uploaded at a time')
+        stream = StreamingUpload(file_path)
+        streams.append(stream)
+        return stream
+
+    parser = FormDataParser(
+        stream_factory,
+        max_form_memory_size=request.max_form_memory_size,
+        max_content_length=request.max_content_length,
+        silent=False
+    )
+    try:
+        try:
+            _, _, files = parser.parse(request.stream, request.mimetype, request.content_length,
+                                       request.mimetype_params)
+        except ValueError as e:
+            raise InvalidUpload(f'Malformed upload: {e}')
+        finally:
+            for stream in streams:
+                stream.close()
+
+        if field not in files:
+            raise InvalidUpload('No file part')
+        if files[field].filename == '' or not streams:
+            raise InvalidUpload('No selected file')
+        upload = streams[0]
+        check_epub_head(upload._head)
+        if upload.size < len(ZIP_MAGIC):
+            raise InvalidUpload('Invalid EPUB: not a ZIP archive')
+        validate_epub_archive(file_path)
+        return upload
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
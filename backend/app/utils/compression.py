@@ -0,0 +1,34 @@
+"""大文本字段的透明压缩
+
+数据库中的大字段以压缩后的二进制形式存储，读取时自动解压：
+
+- plain_text、translation 等只在服务端使用的文本使用 zlib 压缩，压缩数据以 MAGIC 开头。
+- html_content 中仍然保存的旧数据为标准 gzip 格式；新渲染的章节HTML保存在内容存储中。
+
+没有压缩标记的旧数据按 UTF-8 文本原样返回。
+"""
+import gzip
+import zlib
+
+MAGIC = b'\x00EZ'
+GZIP_MAGIC = b'\x1f\x8b'
+
+def compress_text(text, level=6):
+    """压缩文本，None 原样返回"""
+    if text is None:
+        return None
+    return MAGIC + zlib.compress(text.encode('utf-8'), level)
+
+def is_gzip(value):
+    return isinstance(value, (bytes, bytearray)) and bytes(value[:2]) == GZIP_MAGIC
+
+def decompress_text(value):
+    """解压数据库中读取的字段，兼容未压缩的旧数据"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value.startswith(MAGIC):
+        return zlib.decompress(value[len(MAGIC):]).decode('utf-8')
+    if value.startswith(GZIP_MAGIC):
+        return gzip.decompress(value).decode('utf-8')
+    return value.decode('utf-8')
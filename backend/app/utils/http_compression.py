@@ -0,0 +1,96 @@
+"""HTTP 响应压缩
+
+- 静态内容（渲染后的章节HTML、EPUB中的CSS等文本资源、阅读器样式）在写入时压缩一次，
+  保存 gzip 和 brotli 两种变体，请求时按 Accept-Encoding 直接返回对应的字节。
+- 动态 JSON 等响应超过 COMPRESS_MIN_SIZE 时在 after_request 中即时压缩，
+  使用较低的压缩级别以控制CPU开销。
+
+brotli 是可选依赖，未安装时只提供 gzip。
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 值得压缩的文本类型；图片、EPUB等本身已压缩的格式不再处理
+COMPRESSIBLE_MIMETYPES = frozenset((
+    'application/json',
+    'application/javascript',
+    'application/xhtml+xml',
+    'application/xml',
+    'image/svg+xml',
+    'text/css',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+    'text/xml'
+))
+
+# 静态内容只压缩一次，使用最高压缩级别
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+def available_encodings():
+    """按优先顺序返回服务端支持的编码"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate(accept_encodings, available=None):
+    """按客户端的 Accept-Encoding 选择编码，都不接受时返回 None"""
+    for encoding in available or available_encodings():
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY if level is None else level)
+    if encoding == 'gzip':
+        # 固定 mtime，相同内容总是得到相同的字节
+        return gzip.compress(data, compresslevel=STATIC_GZIP_LEVEL if level is None else level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+def precompress(data):
+    """返回静态内容的所有压缩变体 {encoding: bytes}"""
+    return {encoding: compress(data, encoding) for encoding in available_encodings()}
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE_MIMETYPES
+
+def init_compression(app):
+    """注册动态响应压缩"""
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    levels = {
+        'br': app.config.get('COMPRESS_BROTLI_QUALITY', 4),
+        'gzip': app.config.get('COMPRESS_GZIP_LEVEL', 6)
+    }
+
+    @app.after_request
+    def compress_response(response):
+        from flask import request
+
+        # 文件和流式响应、已经编码的预压缩内容以及 304 等空响应都不处理
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or not is_compressible(response.mimetype)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(compress(data, encoding, levels[encoding]))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+    return app
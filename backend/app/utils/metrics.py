@@ -0,0 +1,305 @@
+"""请求级性能指标
+
+记录每个接口的延迟分布、数据库查询次数和耗时、EPUB解析各阶段以及AI接口调用的耗时，
+在 /metrics 以 Prometheus 文本格式输出。
+
+指标保存在进程内存中。gunicorn 多进程部署时每个工作进程各自计数，
+配置 METRICS_DIR 后各进程定期把快照写入该目录，/metrics 合并所有进程的快照后输出，
+否则每次抓取只能看到处理该请求的那个工作进程的数据。
+"""
+import functools
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# 延迟分布的桶边界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """只增不减的计数器"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values):
+        lines = []
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, json.loads(key))} {_format_number(value)}')
+        return lines
+
+class Histogram:
+    """按桶统计的分布，输出累计的桶计数、总和与次数"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数..., 超出最大桶的计数, 总和, 次数]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): list(state) for key, state in self._values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def render(self, values):
+        lines = []
+        for key, state in sorted(values.items()):
+            labels = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = 'le="' + _format_number(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}')
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.histogram.time(**self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """当前进程所有指标的快照 {指标名: {标签(JSON): 值}}"""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshots):
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in values.items():
+                    merged[name][key] = metric.merge(merged[name].get(key), value)
+        return merged
+
+    def render(self, snapshot):
+        """按 Prometheus 文本格式输出快照"""
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.render(snapshot.get(name, {})))
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, directory):
+        """把当前进程的快照写入 <directory>/<pid>.json（先写临时文件再替换，读取方不会读到半个文件）"""
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def read_snapshots(self, directory):
+        snapshots = []
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by endpoint', ('method', 'endpoint', 'status')
+)
+REQUEST_DB_QUERIES = REGISTRY.counter(
+    'http_request_db_queries_total', 'Database queries issued while handling requests', ('endpoint',)
+)
+REQUEST_DB_SECONDS = REGISTRY.counter(
+    'http_request_db_seconds_total', 'Time spent in database queries while handling requests', ('endpoint',)
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'db_query_duration_seconds', 'Database query latency by statement type', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+EPUB_STAGE_SECONDS = REGISTRY.histogram(
+    'epub_stage_duration_seconds', 'Time spent in EPUB parsing and extraction stages', ('stage',)
+)
+AI_REQUEST_SECONDS = REGISTRY.histogram(
+    'ai_request_duration_seconds', 'AI API call latency', ('operation', 'status'),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0, 300.0)
+)
+AI_JOB_QUEUE_SECONDS = REGISTRY.histogram(
+    'ai_job_queue_seconds', 'Time AI jobs wait in the queue before a worker starts them', ('operation', 'priority'),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+
+def timed(histogram, **labels):
+    """装饰器：把函数耗时记入 histogram"""
+    return histogram.time(**labels)
+
+def record_db_query(sql, elapsed):
+    """由数据库游标在每次执行后调用，同时累加到当前请求的统计中"""
+    from flask import g, has_app_context
+
+    words = sql.lstrip().split(None, 1)
+    DB_QUERY_SECONDS.observe(elapsed, operation=words[0].lower() if words else 'unknown')
+    if has_app_context():
+        stats = g.get('_request_db_stats')
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+def init_metrics(app):
+    """注册请求计时和 /metrics 接口（配置了 METRICS_TOKEN 时才可访问）
+
+    在 init_compression 之前调用：after_request 按注册的逆序执行，这样计时包含响应压缩。
+    """
+    from flask import Response, g, request
+
+    metrics_dir = app.config.get('METRICS_DIR')
+    flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+    flush_state = {'last': 0.0, 'lock': threading.Lock()}
+
+    def flush_snapshot(force=False):
+        now = time.monotonic()
+        with flush_state['lock']:
+            if not force and now - flush_state['last'] < flush_interval:
+                return
+            flush_state['last'] = now
+        try:
+            REGISTRY.write_snapshot(metrics_dir)
+        except OSError as e:
+            app.logger.error(f"Error writing metrics snapshot: {str(e)}")
+
+    @app.before_request
+    def start_request_timer():
+        g._request_start = time.perf_counter()
+        g._request_db_stats = [0, 0.0]
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('_request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        queries, db_time = g.pop('_request_db_stats', (0, 0.0))
+
+        endpoint = request.url_rule.rule if request.url_rule else '<unmatched>'
+        REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+        if queries:
+            REQUEST_DB_QUERIES.inc(queries, endpoint=endpoint)
+            REQUEST_DB_SECONDS.inc(db_time, endpoint=endpoint)
+
+        # 浏览器开发者工具中可以直接看到服务端耗时
+        response.headers.add(
+            'Server-Timing', f'db;dur={db_time * 1000:.1f};desc="{queries} queries", app;dur={elapsed * 1000:.1f}'
+        )
+        if metrics_dir:
+            flush_snapshot()
+        return response
+
+    # /metrics 暴露所有接口路径和耗时，只有配置了 METRICS_TOKEN 时才提供，请求需带 Authorization: Bearer <METRICS_TOKEN>
+    token = app.config.get('METRICS_TOKEN')
+
+    @app.route('/metrics')
+    def metrics():
+        if not token:
+            return Response('Not Found\n', status=404)
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+            return Response('Unauthorized\n', status=401, headers={'WWW-Authenticate': 'Bearer'})
+        if metrics_dir:
+            flush_snapshot(force=True)
+            snapshot = REGISTRY.merge(REGISTRY.read_snapshots(metrics_dir))
+        else:
+            snapshot = REGISTRY.snapshot()
+        return Response(REGISTRY.render(snapshot), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    return app
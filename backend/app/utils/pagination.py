@@ -0,0 +1,62 @@
+"""列表接口的游标分页和字段选择
+
+列表按 (排序列, id) 做 keyset 分页：下一页从上一页最后一行之后开始，
+查询走 (排序列, id) 索引，每页的开销与数据总量无关，也不需要 COUNT(*)。
+游标是对最后一行 [排序值, id] 的 URL 安全 base64 编码，客户端只需原样传回。
+
+只有带 limit 或 cursor 参数的请求返回 {items, next_cursor}；不带这两个参数的旧客户端
+仍得到包含全部行的数组。
+"""
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.strftime('%Y-%m-%d %H:%M:%S')
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def decode_cursor(token):
+    """解析游标，返回 (排序值, id)；格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(row_id, int) or isinstance(row_id, bool):
+        raise ValueError("Invalid cursor")
+    # 排序值会作为SQL参数使用，只接受时间字符串和数字（以及空值）
+    if sort_value is not None and (isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float))):
+        raise ValueError("Invalid cursor")
+    return sort_value, row_id
+
+def is_paginated(args):
+    """请求是否使用分页（带 limit 或 cursor 参数）"""
+    return 'limit' in args or 'cursor' in args
+
+def fetch_all_pages(get_page):
+    """不分页的请求按最大页大小逐页读完所有行，get_page(after) 返回 (行列表, 下一页的 after)"""
+    rows, after = get_page(None)
+    while after is not None:
+        more, after = get_page(after)
+        rows.extend(more)
+    return rows
+
+def parse_page_size(value):
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    return min(max(value, 1), MAX_PAGE_SIZE)
+
+def parse_fields(value, allowed):
+    """解析逗号分隔的 fields 参数，未指定时返回 None（全部字段）；包含未知字段时抛出 ValueError"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
@@ -0,0 +1,114 @@
+"""入库时 CPU 密集任务（章节渲染、图片处理）共用的进程池
+
+BeautifulSoup 解析、HTML序列化、图片编解码都受 GIL 限制，放到独立进程中才能用满多核。
+任务函数必须是模块级函数，参数和返回值可以被 pickle，且不依赖应用上下文。
+"""
+import atexit
+import collections
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+class ProcessPool:
+    """第一次使用时创建的进程池；workers 为 0 时在当前进程中执行"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._atexit_registered = False
+
+    def _get_executor(self):
+        with self._lock:
+            # fork 出的子进程不能使用父进程的进程池
+            if self._executor is None or self._pid != os.getpid():
+                # spawn 启动的工作进程不继承父进程的线程和连接
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+                if not self._atexit_registered:
+                    atexit.register(self._shutdown_at_exit)
+                    self._atexit_registered = True
+            return self._executor
+
+    def _discard(self, executor):
+        """工作进程异常退出（如内存不足、解码恶意图片时崩溃）后进程池不能再使用，下次使用时重新创建"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _shutdown_at_exit(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False)
+
+    def map(self, func, items):
+        """并行执行 func，按 items 的顺序返回结果"""
+        items = list(items)
+        if self.workers <= 0 or len(items) <= 1:
+            return [func(item) for item in items]
+        executor = self._get_executor()
+        try:
+            return list(executor.map(func, items))
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+    
+    def imap(self, func, items, window=None):
+        """并行执行 func，按 items 的顺序逐个产出结果
+        
+        items 按需读取，同时提交且未被取走的任务最多 window 个（默认为工作进程数的两倍）：
+        调用方处理得慢时不再提交新任务，待处理的输入和已完成的结果都不会无限堆积。
+        """
+        if self.workers <= 0:
+            for item in items:
+                yield func(item)
+            return
+        
+        executor = self._get_executor()
+        window = max(1, window or self.workers * 2)
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+        finally:
+            # 调用方提前停止（出错或关闭生成器）时取消尚未开始的任务
+            for future in pending:
+                future.cancel()
+    
+    def shutdown(self):
+        """等待并关闭工作进程，之后再次使用时重新创建"""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_process_pool(workers):
+    """按工作进程数获取共享的进程池，配置相同的调用方共用同一组进程"""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPool(workers)
+        return _pools[workers]
+
+def shutdown_process_pools():
+    """关闭所有共享进程池的工作进程（基准测试统计子进程内存时使用）"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.shutdown()
+
+def default_workers():
+    return min(4, os.cpu_count() or 1)
@@ -0,0 +1,147 @@
+"""按需的采样分析器
+
+对单个请求采样调用栈，结果保存为 folded 格式（每行 "栈帧;栈帧;... 次数"），
+可以直接用 flamegraph.pl 或 speedscope 生成火焰图。两种触发方式：
+
+- 请求带 X-Profile 头且值等于配置的 PROFILE_TOKEN：必定分析并保存，
+  响应的 X-Profile-File 头给出文件名。
+- 配置 PROFILE_SAMPLE_RATE > 0：按该比例随机分析请求，只保存耗时超过
+  PROFILE_SLOW_THRESHOLD 秒的慢请求。
+
+一个后台线程按 PROFILE_INTERVAL 的间隔读取被分析线程的当前栈帧，请求线程本身不做额外工作。
+采样基于操作系统线程，gevent 模式下看到的是协程调度器而不是具体请求。
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_HEADER = 'X-Profile'
+
+def _frame_name(code):
+    # 只保留路径的最后两级，火焰图中足以区分模块
+    path = code.co_filename.replace(os.sep, '/').rsplit('/', 2)[-2:]
+    return f"{code.co_name} ({'/'.join(path)}:{code.co_firstlineno})"
+
+def fold_stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """后台线程定期采样已登记线程的调用栈"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            # fork 出的子进程中没有父进程的采样线程，需要重新启动
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def stop(self, thread_id):
+        """结束采样，返回 {folded栈: 次数}"""
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._targets:
+                    self._wakeup.wait()
+                thread_ids = list(self._targets)
+            frames = sys._current_frames()
+            stacks = {
+                thread_id: fold_stack(frames[thread_id])
+                for thread_id in thread_ids if thread_id in frames and thread_id != own_id
+            }
+            del frames
+            with self._lock:
+                # 只计入仍在分析中的线程，已经 stop 的结果不再变化
+                for thread_id, stack in stacks.items():
+                    samples = self._targets.get(thread_id)
+                    if samples is not None:
+                        samples[stack] += 1
+            time.sleep(self.interval)
+
+def write_profile(folder, name, samples, max_files):
+    """保存 folded 格式的分析结果，只保留最新的 max_files 个文件"""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    profiles = sorted(
+        (entry for entry in os.scandir(folder) if entry.name.endswith('.folded')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in profiles[:-max_files] if max_files > 0 else []:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    return path
+
+def init_profiling(app):
+    """注册请求分析钩子；既没有配置 PROFILE_TOKEN 也没有开启采样时不做任何事"""
+    from flask import g, request
+
+    token = app.config.get('PROFILE_TOKEN')
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+    if not token and sample_rate <= 0:
+        return app
+
+    slow_threshold = app.config.get('PROFILE_SLOW_THRESHOLD', 1.0)
+    folder = app.config.get('PROFILE_FOLDER') or os.path.join(app.config['UPLOAD_FOLDER'], 'profiles')
+    max_files = app.config.get('PROFILE_MAX_FILES', 200)
+    sampler = StackSampler(app.config.get('PROFILE_INTERVAL', 0.005))
+
+    @app.before_request
+    def start_profile():
+        forced = bool(token) and request.headers.get(PROFILE_HEADER) == token
+        if not forced and not (sample_rate > 0 and random.random() < sample_rate):
+            return
+        g._profile = (threading.get_ident(), time.perf_counter(), forced)
+        sampler.start(threading.get_ident())
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        thread_id, start, forced = profile
+        samples = sampler.stop(thread_id)
+        elapsed = time.perf_counter() - start
+        if not forced and elapsed < slow_threshold:
+            return response
+
+        endpoint = re.sub(r'[^A-Za-z0-9_.-]+', '_', request.endpoint or 'unmatched')
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}-{elapsed * 1000:.0f}ms.folded"
+        try:
+            write_profile(folder, name, samples, max_files)
+        except OSError as e:
+            app.logger.error(f"Error writing profile {name}: {str(e)}")
+            return response
+        app.logger.warning(f"Profiled {request.method} {request.path} ({elapsed * 1000:.0f} ms): {name}")
+        if forced:
+            response.headers['X-Profile-File'] = name
+        return response
+
+    return app
@@ -0,0 +1,44 @@
+"""补记早期入库的书已有的封面尺寸版本
+
+books.cover_renditions 列添加之前入库的书没有记录生成了哪些封面尺寸版本，书架列表中
+这些书的缩略图和中等尺寸封面URL为 None。升级后执行一次，按封面目录中实际存在的文件补记:
+
+    cd backend
+    python backfill_cover_renditions.py
+    python backfill_cover_renditions.py --config production
+
+已记录的书直接跳过，中断后重新执行即可继续。
+"""
+import argparse
+import logging
+import os
+
+from app import create_app
+from app.models.book import Book
+from app.services.image_service import COVER_RENDITIONS, cover_rendition_filename
+
+def main():
+    parser = argparse.ArgumentParser(description='Record existing cover renditions for books imported before they were tracked')
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG') or 'default')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    app.logger.setLevel(logging.WARNING)
+    cover_folder = app.config['COVER_FOLDER']
+
+    with app.app_context():
+        books = Book.get_unrecorded_covers()
+        print(f"{len(books)} books without recorded cover renditions")
+        for book in books:
+            renditions = [
+                name for name in COVER_RENDITIONS
+                if os.path.exists(os.path.join(cover_folder, cover_rendition_filename(book['cover_path'], name)))
+            ]
+            Book.update_cover_renditions(book['id'], ','.join(renditions))
+            print(f"book {book['id']}: {', '.join(renditions) or 'no renditions'}")
+
+    app.extensions['progress_buffer'].stop()
+    app.extensions['db_pool'].close()
+
+if __name__ == '__main__':
+    main()
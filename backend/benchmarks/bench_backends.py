@@ -0,0 +1,102 @@
+"""存储后端热点查询基准测试
+
+在同一份数据上对比 SQLite 和 MySQL 后端的热点查询：
+书架列表、章节目录、章节元数据读取以及AI结果写回。
+
+SQLite 使用临时数据库文件；加上 --mysql 时同时测试 config.py 中配置的
+MySQL 数据库（会在其中写入并删除测试书籍）。
+
+用法:
+    cd backend
+    python benchmarks/bench_backends.py --books 50 --chapters 200 --iterations 2000
+    python benchmarks/bench_backends.py --mysql
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from config import config
+from app.models import init_db
+from app.models.book import Book, Chapter
+
+def make_app(config_name, overrides):
+    app = Flask('bench')
+    app.config.from_object(config[config_name])
+    app.config.update(overrides)
+    init_db(app)
+    return app
+
+def seed(books, chapters):
+    book_ids = []
+    chapter_ids = []
+    text = '这是用于基准测试的章节正文。The quick brown fox jumps over the lazy dog. ' * 40
+    for b in range(books):
+        book_id = Book.create(f'Bench Book {b}', 'Bench', None, f'bench-{b}.epub')
+        records = [
+            {
+                'title': f'Chapter {c}',
+                'href': f'Text/chapter{c}.xhtml',
+                'html_hash': f'{b:032x}{c:032x}',
+                'plain_text': text,
+                'char_count': len(text),
+                'token_count': len(text) // 2,
+                'content_hash': f'{c:064x}'
+            }
+            for c in range(chapters)
+        ]
+        book_ids.append(book_id)
+        chapter_ids.extend(Chapter.create_many(book_id, records))
+    return book_ids, chapter_ids
+
+def timed(label, iterations, func):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<22} {elapsed / iterations * 1e6:10.1f} us/op  {iterations / elapsed:10.0f} ops/s")
+
+def run(name, app, args):
+    print(f"[{name}]")
+    with app.app_context():
+        start = time.perf_counter()
+        book_ids, chapter_ids = seed(args.books, args.chapters)
+        print(f"  {'seed':<22} {time.perf_counter() - start:10.3f} s  ({len(chapter_ids)} chapters)")
+
+        rng = random.Random(42)
+        timed('book list', args.iterations, Book.get_page)
+        timed('toc', args.iterations, lambda: Chapter.get_toc(rng.choice(book_ids)))
+        timed('chapter meta', args.iterations, lambda: Chapter.get_by_id(rng.choice(chapter_ids)))
+        timed('chapter plain text', args.iterations, lambda: Chapter.get_artifact(rng.choice(chapter_ids), 'summary'))
+        timed('artifact update', args.iterations, lambda: Chapter.update_summary(rng.choice(chapter_ids), 'summary text ' * 20))
+
+        for book_id in book_ids:
+            Book.delete(book_id)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hot model queries across storage backends')
+    parser.add_argument('--books', type=int, default=50)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--mysql', action='store_true', help='also benchmark the MySQL database from config.py')
+    parser.add_argument('--config', default='default')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_app = make_app(args.config, {
+            'DB_BACKEND': 'sqlite',
+            'SQLITE_PATH': os.path.join(temp_dir, 'bench.db')
+        })
+        run('sqlite', sqlite_app, args)
+        sqlite_app.extensions['db_pool'].close()
+
+    if args.mysql:
+        run('mysql', make_app(args.config, {'DB_BACKEND': 'mysql'}), args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""数据库连接池吞吐量基准测试
+
+对比两种模式下模拟请求的吞吐量：
+- direct: 与旧版 get_db 相同，每个请求新建连接、执行查询后关闭
+- pool:   通过 ConnectionPool 借出连接、执行查询后归还
+
+需要一个可访问的 MySQL 兼容服务器，连接信息读取 config.py（或对应环境变量）。
+
+用法:
+    cd backend
+    python benchmarks/bench_db_pool.py --requests 2000 --threads 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config
+from app.models.backends import MySQLBackend
+from app.models.pool import ConnectionPool
+
+QUERY = 'SELECT id, title FROM books ORDER BY last_read DESC LIMIT 20'
+
+def run_direct(backend, total, threads):
+    def one_request(_):
+        conn = backend.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(QUERY)
+                cursor.fetchall()
+        finally:
+            conn.close()
+    return _timed(one_request, total, threads)
+
+def run_pool(backend, total, threads):
+    pool = ConnectionPool(backend.connect, min_size=threads, max_size=threads)
+
+    def one_request(_):
+        conn = pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(QUERY)
+                cursor.fetchall()
+        finally:
+            pool.release(conn)
+    try:
+        elapsed = _timed(one_request, total, threads)
+        return elapsed, pool.stats()
+    finally:
+        pool.close()
+
+def _timed(func, total, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(func, range(total)))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-request connections vs the connection pool')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--config', default='default')
+    args = parser.parse_args()
+
+    cfg = config[args.config]
+    db_config = {key: getattr(cfg, key) for key in ('DB_HOST', 'DB_USER', 'DB_PASSWORD', 'DB_NAME')}
+
+    backend = MySQLBackend(db_config)
+    direct = run_direct(backend, args.requests, args.threads)
+    pooled, stats = run_pool(backend, args.requests, args.threads)
+
+    print(f"requests={args.requests} threads={args.threads}")
+    print(f"direct: {args.requests / direct:10.1f} req/s  {direct / args.requests * 1000:.3f} ms/req")
+    print(f"pool:   {args.requests / pooled:10.1f} req/s  {pooled / args.requests * 1000:.3f} ms/req")
+    print(f"speedup: {direct / pooled:.2f}x")
+    print(f"pool stats: {stats}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""EPUB 解析与入库基准测试
+
+用 epub_corpus.py 生成合成语料，对每本书分别计时以下阶段：
+
+    open       打开压缩包并定位 OPF（EpubService 的 with 块）
+    metadata   get_metadata
+    toc        get_chapters
+    text       所有章节的 get_chapter_text（纯文本提取）
+    html       所有章节的 get_chapter_html（HTML改写，资源写入资源存储）
+    render     render_chapters：在进程池（RENDER_WORKERS）中渲染HTML、提取纯文本和统计词频
+    ingest     通过 /api/books/upload 完整上传一本书（临时 SQLite 数据库）
+
+每个阶段重复 --repeat 次取最短时间，再在 tracemalloc 下单独执行一次记录Python堆内存峰值
+（不包含 Pillow 等 C 扩展的内存和图片进程池中的内存）。
+
+结果与基线文件比较：任一阶段比基线慢 --tolerance（默认 25%）以上，或内存峰值超出同样比例，
+打印 REGRESSION 并以退出码 1 结束。基线与机器相关，应在同一台机器（或CI环境）上生成:
+
+    cd backend
+    python benchmarks/bench_epub.py --save-baseline        # 生成或更新基线
+    python benchmarks/bench_epub.py                        # 与基线比较
+    python benchmarks/bench_epub.py --profiles large,single-file --stages html,ingest --scale 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from config import config
+from app import create_app
+from app.services.epub_service import EpubService
+from epub_corpus import PROFILES, generate_corpus
+
+STAGES = ('open', 'metadata', 'toc', 'text', 'html', 'render', 'ingest')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'epub_baseline.json')
+# 小于该秒数的差异视为计时噪声
+NOISE_FLOOR = 0.005
+
+def make_app(config_name, temp_dir):
+    upload_folder = os.path.join(temp_dir, 'uploads')
+    overrides = {
+        'DB_BACKEND': 'sqlite',
+        'SQLITE_PATH': os.path.join(temp_dir, 'bench.db'),
+        'UPLOAD_FOLDER': upload_folder,
+        'COVER_FOLDER': os.path.join(upload_folder, 'covers'),
+        'BLOB_FOLDER': os.path.join(upload_folder, 'blobs'),
+        'ASSET_FOLDER': os.path.join(upload_folder, 'assets'),
+        'SEARCH_INDEX_FOLDER': os.path.join(upload_folder, 'search'),
+        'METRICS_ENABLED': False
+    }
+    config['bench'] = type('BenchConfig', (config[config_name],), overrides)
+    app = create_app('bench')
+    app.logger.setLevel(logging.WARNING)
+    os.makedirs(app.config['COVER_FOLDER'], exist_ok=True)
+    return app
+
+def stage_runner(stage, app, client, path):
+    """返回执行一次该阶段的函数；open 以外的阶段在计时之外打开EPUB"""
+    if stage == 'open':
+        def run():
+            with EpubService(path):
+                pass
+        return run, None
+
+    if stage == 'ingest':
+        def run():
+            with open(path, 'rb') as f:
+                response = client.post('/api/books/upload', data={'file': (f, os.path.basename(path))},
+                                       content_type='multipart/form-data')
+            if response.status_code != 201:
+                raise RuntimeError(f"Upload failed: {response.status_code} {response.get_data(as_text=True)[:200]}")
+            run.book_ids.append(response.json['id'])
+        run.book_ids = []
+
+        def cleanup():
+            for book_id in run.book_ids:
+                client.delete(f'/api/books/{book_id}')
+            run.book_ids.clear()
+        return run, cleanup
+
+    epub = EpubService(path).__enter__()
+    epub.get_metadata()
+    chapters = epub.get_chapters()
+    if stage == 'render':
+        with app.app_context():
+            asset_urls = epub.prepare_assets()
+
+    def run():
+        with app.app_context():
+            if stage == 'metadata':
+                epub.get_metadata()
+            elif stage == 'toc':
+                epub.get_chapters()
+            elif stage == 'text':
+                for chapter in chapters:
+                    epub.get_chapter_text(chapter['href'])
+            elif stage == 'html':
+                # 每次都重新保存资源，避免只测到第一次之后的缓存
+                epub._asset_urls.clear()
+                for chapter in chapters:
+                    epub.get_chapter_html(chapter['href'])
+            elif stage == 'render':
+                epub.render_chapters([chapter['href'] for chapter in chapters], asset_urls)
+
+    return run, lambda: epub.__exit__(None, None, None)
+
+def measure(stage, app, client, path, repeat):
+    run, cleanup = stage_runner(stage, app, client, path)
+    try:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        if cleanup:
+            cleanup()
+    return {'seconds': min(timings), 'peak_mb': peak / (1024 * 1024)}
+
+def compare(results, baseline, tolerance):
+    """返回 [(书名, 阶段, 指标, 基线值, 当前值)] 形式的回归列表"""
+    regressions = []
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if not base:
+                continue
+            if result['seconds'] > base['seconds'] * (1 + tolerance) and result['seconds'] - base['seconds'] > NOISE_FLOOR:
+                regressions.append((name, stage, 'seconds', base['seconds'], result['seconds']))
+            if result['peak_mb'] > base['peak_mb'] * (1 + tolerance) and result['peak_mb'] - base['peak_mb'] > 1:
+                regressions.append((name, stage, 'peak_mb', base['peak_mb'], result['peak_mb']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EPUB parsing stages and full ingest')
+    parser.add_argument('--profiles', help=f"comma-separated subset of: {','.join(PROFILES)}")
+    parser.add_argument('--stages', help=f"comma-separated subset of: {','.join(STAGES)}")
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply chapter and image counts of each profile')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--config', default='default')
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(',') if args.profiles else list(PROFILES)
+    stages = args.stages.split(',') if args.stages else list(STAGES)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus = generate_corpus(os.path.join(temp_dir, 'corpus'), profiles, args.scale)
+        app = make_app(args.config, temp_dir)
+        client = app.test_client()
+
+        print(f"{'book':<14} {'stage':<9} {'seconds':>9} {'chapters/s':>11} {'MB/s':>8} {'peak MB':>8}")
+        for name, path, chapters in corpus:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            results[name] = {}
+            for stage in stages:
+                result = measure(stage, app, client, path, args.repeat)
+                results[name][stage] = result
+                seconds = max(result['seconds'], 1e-9)
+                print(f"{name:<14} {stage:<9} {result['seconds']:>9.4f} {chapters / seconds:>11.0f} "
+                      f"{size_mb / seconds:>8.2f} {result['peak_mb']:>8.1f}")
+
+        app.extensions['progress_buffer'].stop()
+        app.extensions['db_pool'].close()
+
+    key = f"scale={args.scale}"
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.setdefault(key, {}).update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f).get(key, {})
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, stage, metric, base, current in regressions:
+        print(f"REGRESSION {name}/{stage} {metric}: {base:.4f} -> {current:.4f} ({current / base - 1:+.0%})")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""上传入库的内存基准测试
+
+用 epub_corpus.py 按不同的 --scales 生成同一类书（章节数和插图数随 scale 成倍增长），
+每本书在独立的子进程中通过 /api/books/upload 上传一次（临时 SQLite 数据库），记录：
+
+    base MB     创建应用并先上传一本小书预热（启动进程池、加载模块）之后的进程峰值 RSS
+    peak MB     上传这本书之后的进程峰值 RSS
+    growth MB   peak - base，即这次上传额外占用的内存
+    worker MB   渲染和图片进程池中单个工作进程的峰值 RSS
+
+流式入库时 growth 和 worker 应基本不随书的大小变化。最大一本书的 growth 比最小一本多出
+--tolerance MB（默认 32）以上时打印 REGRESSION 并以退出码 1 结束:
+
+    cd backend
+    python benchmarks/bench_ingest_memory.py
+    python benchmarks/bench_ingest_memory.py --profile images --scales 0.5,1,2,4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from epub_corpus import PROFILES, generate_epub, scaled
+
+DEFAULT_SCALES = '0.25,0.5,1,2'
+
+def max_rss_mb(who):
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def run_child(path, warmup_path, config_name):
+    """子进程：预热后上传一本书，以 JSON 打印内存和耗时"""
+    from bench_epub import make_app
+    from app.utils.process_pool import shutdown_process_pools
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        app = make_app(config_name, temp_dir)
+        client = app.test_client()
+
+        def upload(epub_path):
+            with open(epub_path, 'rb') as f:
+                response = client.post('/api/books/upload', data={'file': (f, os.path.basename(epub_path))},
+                                       content_type='multipart/form-data')
+            if response.status_code != 201:
+                raise RuntimeError(f"Upload failed: {response.status_code} {response.get_data(as_text=True)[:200]}")
+
+        upload(warmup_path)
+        base = max_rss_mb(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        upload(path)
+        seconds = time.perf_counter() - start
+        peak = max_rss_mb(resource.RUSAGE_SELF)
+
+        # 工作进程退出后才计入 RUSAGE_CHILDREN
+        shutdown_process_pools()
+        app.extensions['progress_buffer'].stop()
+        app.extensions['db_pool'].close()
+
+    print(json.dumps({'base_mb': base, 'peak_mb': peak, 'worker_mb': max_rss_mb(resource.RUSAGE_CHILDREN),
+                      'seconds': seconds}))
+
+def measure(path, warmup_path, config_name):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', path, '--warmup', warmup_path, '--config', config_name],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure peak memory of EPUB ingest as book size grows')
+    parser.add_argument('--profile', default='large', help=f"one of: {','.join(PROFILES)}")
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help='comma-separated book size multipliers')
+    parser.add_argument('--tolerance', type=float, default=32, help='allowed growth difference in MB')
+    parser.add_argument('--config', default='default')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--warmup', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.warmup, args.config)
+        return
+
+    scales = sorted(float(scale) for scale in args.scales.split(','))
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        warmup_path = os.path.join(temp_dir, 'warmup.epub')
+        generate_epub(warmup_path, **scaled(PROFILES[args.profile], 0.05))
+
+        print(f"{'scale':>6} {'chapters':>8} {'size MB':>8} {'seconds':>8} {'base MB':>8} {'peak MB':>8} "
+              f"{'growth MB':>9} {'worker MB':>9}")
+        for scale in scales:
+            path = os.path.join(temp_dir, f'{args.profile}-{scale}.epub')
+            chapters = generate_epub(path, **scaled(PROFILES[args.profile], scale))
+            result = measure(path, warmup_path, args.config)
+            result['growth_mb'] = result['peak_mb'] - result['base_mb']
+            results.append(result)
+            print(f"{scale:>6g} {chapters:>8} {os.path.getsize(path) / (1024 * 1024):>8.1f} {result['seconds']:>8.2f} "
+                  f"{result['base_mb']:>8.1f} {result['peak_mb']:>8.1f} {result['growth_mb']:>9.1f} {result['worker_mb']:>9.1f}")
+
+    difference = results[-1]['growth_mb'] - results[0]['growth_mb']
+    if difference > args.tolerance:
+        print(f"REGRESSION ingest memory grows with book size: +{difference:.1f} MB "
+              f"from scale {scales[0]:g} to {scales[-1]:g} (tolerance {args.tolerance:g} MB)")
+        sys.exit(1)
+    print(f"Ingest memory growth from scale {scales[0]:g} to {scales[-1]:g}: {difference:+.1f} MB "
+          f"(tolerance {args.tolerance:g} MB)")
+
+if __name__ == '__main__':
+    main()
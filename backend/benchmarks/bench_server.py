@@ -0,0 +1,143 @@
+"""多进程服务器吞吐量测试
+
+用 gunicorn.conf.py 以不同的工作进程数启动服务，对书架列表、章节目录和章节元数据
+接口施加并发负载，输出每种配置下的吞吐量、延迟和相对单进程的加速比。
+服务使用临时的 SQLite 数据库（按 bench_backends.py 的方式写入测试数据）。
+
+负载由多个客户端进程产生，每个客户端保持一个 keep-alive 连接，
+客户端进程数应不少于 工作进程数 × 线程数，且最好运行在不同的CPU核上。
+
+用法:
+    cd backend
+    python benchmarks/bench_server.py --workers 1,2,4 --threads 4 --clients 32 --duration 10
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_backends import make_app, seed
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/books/?limit=1')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start within {timeout}s")
+
+def client(port, paths, duration, seed_value, results):
+    rng = random.Random(seed_value)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', rng.choice(paths), headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    results.put((latencies, errors))
+
+def run_load(port, paths, clients, duration):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=client, args=(port, paths, duration, i, results))
+        for i in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    latencies = []
+    errors = 0
+    for _ in processes:
+        client_latencies, client_errors = results.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return latencies, errors
+
+def start_server(port, workers, threads, worker_class, env):
+    env = dict(env, WEB_BIND=f'127.0.0.1:{port}', WEB_WORKERS=str(workers), WEB_THREADS=str(threads),
+               WEB_WORKER_CLASS=worker_class, WEB_ACCESS_LOG='')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure request throughput of the production server by worker count')
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})))
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--books', type=int, default=20)
+    parser.add_argument('--chapters', type=int, default=50)
+    parser.add_argument('--port', type=int, default=5090)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'bench.db')
+        app = make_app('production', {'DB_BACKEND': 'sqlite', 'SQLITE_PATH': db_path})
+        with app.app_context():
+            book_ids, chapter_ids = seed(args.books, args.chapters)
+        app.extensions['progress_buffer'].stop()
+        app.extensions['db_pool'].close()
+
+        chapters_per_book = len(chapter_ids) // max(len(book_ids), 1)
+        paths = ['/api/books/?limit=20']
+        paths += [f'/api/books/{book_id}' for book_id in book_ids]
+        paths += [
+            f'/api/books/{book_ids[i // chapters_per_book]}/chapters/{chapter_id}'
+            for i, chapter_id in enumerate(chapter_ids)
+        ]
+
+        env = dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=db_path, FLASK_CONFIG='production')
+        print(f"{len(paths)} paths, {args.clients} clients, {args.duration:.0f}s per run, "
+              f"{args.threads} threads/worker ({args.worker_class}), {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8}")
+
+        baseline = None
+        for workers in [int(n) for n in args.workers.split(',')]:
+            server = start_server(args.port, workers, args.threads, args.worker_class, env)
+            try:
+                wait_for_server(args.port)
+                latencies, errors = run_load(args.port, paths, args.clients, args.duration)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+            throughput = len(latencies) / args.duration
+            baseline = baseline or throughput
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+            print(f"{workers:>8} {throughput:>10.0f} {p50:>8.1f} {p99:>8.1f} {errors:>7} {throughput / baseline:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
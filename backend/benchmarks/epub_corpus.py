@@ -0,0 +1,201 @@
+"""合成 EPUB 测试语料生成器
+
+按参数生成结构可控的 EPUB，用于解析和入库的基准测试：
+章节数、每章字数、中英文比例、文件编码（UTF-8 / GBK）、NCX 目录或只有 spine、
+一个文件中用锚点划分多个章节、插图数量，以及整本书只有一个文件等极端情况。
+相同的参数和随机种子总是生成相同的文件。
+
+用法:
+    cd backend
+    python benchmarks/epub_corpus.py --out /tmp/epub-corpus            # 生成所有预设
+    python benchmarks/epub_corpus.py --out /tmp/epub-corpus --profiles gbk,images --scale 2
+"""
+import argparse
+import os
+import random
+import struct
+import zipfile
+import zlib
+
+# 常用汉字，按字频粗略挑选
+CJK_CHARS = (
+    '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经'
+    '十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严'
+)
+LATIN_WORDS = (
+    'the quick brown fox jumps over lazy dog reader chapter story river mountain light shadow window garden '
+    'morning evening silence voice letter journey memory winter summer harbor village distant ancient quiet'
+).split()
+
+# 预设语料：名称 -> generate_epub 的参数
+PROFILES = {
+    'baseline': {'chapters': 30, 'chapter_chars': 6000, 'cjk_ratio': 0.7},
+    'latin': {'chapters': 30, 'chapter_chars': 6000, 'cjk_ratio': 0.0},
+    'gbk': {'chapters': 30, 'chapter_chars': 6000, 'cjk_ratio': 1.0, 'encoding': 'gbk'},
+    'spine-only': {'chapters': 30, 'chapter_chars': 6000, 'cjk_ratio': 0.7, 'toc': 'spine'},
+    'anchor-split': {'chapters': 60, 'chapter_chars': 3000, 'cjk_ratio': 0.7, 'chapters_per_file': 6},
+    'images': {'chapters': 20, 'chapter_chars': 4000, 'cjk_ratio': 0.7, 'images': 20},
+    'single-file': {'chapters': 200, 'chapter_chars': 2000, 'cjk_ratio': 0.7, 'chapters_per_file': 200},
+    'large': {'chapters': 300, 'chapter_chars': 12000, 'cjk_ratio': 0.7}
+}
+
+OPF_NS = 'http://www.idpf.org/2007/opf'
+
+def make_png(width, height, rng):
+    """生成带噪点的 RGB PNG（不依赖 Pillow）；噪点让文件大小接近真实照片"""
+    rows = []
+    for y in range(height):
+        if y % 8 == 0:
+            rows.append(b'\x00' + rng.randbytes(width * 3))
+        else:
+            rows.append(b'\x00' + bytes((y * 255 // max(height - 1, 1),)) * (width * 3))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(b''.join(rows), 6)) + chunk(b'IEND', b'')
+
+def make_paragraphs(rng, chars, cjk_ratio):
+    """生成约 chars 个字符的段落列表，cjk_ratio 为中文句子所占比例"""
+    paragraphs = []
+    total = 0
+    while total < chars:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            if rng.random() < cjk_ratio:
+                sentences.append(''.join(rng.choice(CJK_CHARS) for _ in range(rng.randint(8, 30))) + '。')
+            else:
+                words = [rng.choice(LATIN_WORDS) for _ in range(rng.randint(6, 18))]
+                sentences.append(' '.join(words).capitalize() + '. ')
+        paragraph = ''.join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph)
+    return paragraphs
+
+def _xhtml(title, body, encoding):
+    return (
+        f'<?xml version="1.0" encoding="{encoding}"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+        f'<head><title>{title}</title><link rel="stylesheet" type="text/css" href="../Styles/style.css"/></head>\n'
+        f'<body>\n{body}</body>\n</html>\n'
+    ).encode(encoding)
+
+def generate_epub(path, chapters=30, chapter_chars=6000, cjk_ratio=0.7, encoding='utf-8', toc='ncx',
+                  chapters_per_file=1, images=0, image_size=(1000, 1400), seed=0):
+    """生成一个 EPUB 文件，返回其中的章节数
+
+    - toc: 'ncx' 生成 NCX 目录；'spine' 只有 spine，章节标题需要从文件中提取
+    - chapters_per_file: 大于 1 时多个章节写在同一个文件里，目录用 #锚点 指向各章；
+      等于 chapters 时整本书只有一个文件
+    - images: 插图数量，均匀分布在各章中，第一张同时作为封面
+    """
+    rng = random.Random(seed)
+    chapters_per_file = max(1, min(chapters_per_file, chapters))
+    files = [list(range(start, min(start + chapters_per_file, chapters)))
+             for start in range(0, chapters, chapters_per_file)]
+
+    image_names = [f'img{i}.png' for i in range(images)]
+    images_by_chapter = {}
+    for i, name in enumerate(image_names):
+        images_by_chapter.setdefault(i * chapters // max(images, 1), []).append(name)
+
+    manifest = ['<item id="css" href="Styles/style.css" media-type="text/css"/>']
+    if toc == 'ncx':
+        manifest.append('<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>')
+    spine = []
+    nav_points = []
+
+    with zipfile.ZipFile(path, 'w') as epub:
+        # mimetype 必须是第一个且不压缩
+        epub.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        epub.writestr('META-INF/container.xml', (
+            '<?xml version="1.0"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>'
+            '</container>'
+        ), compress_type=zipfile.ZIP_DEFLATED)
+        epub.writestr('OEBPS/Styles/style.css', 'body { line-height: 1.6; }\nh2 { margin-top: 2em; }\n',
+                      compress_type=zipfile.ZIP_DEFLATED)
+
+        for i, name in enumerate(image_names):
+            # 图片本身已压缩，和真实 EPUB 一样以 STORED 方式保存
+            epub.writestr(f'OEBPS/Images/{name}', make_png(image_size[0], image_size[1], rng), compress_type=zipfile.ZIP_STORED)
+            manifest.append(f'<item id="img{i}" href="Images/{name}" media-type="image/png"/>')
+
+        for f, chapter_numbers in enumerate(files):
+            href = f'Text/part{f:04d}.xhtml'
+            body = []
+            for n in chapter_numbers:
+                title = f'第{n + 1}章 Chapter {n + 1}'
+                anchor = f'c{n + 1}'
+                tag = 'h1' if chapters_per_file == 1 else 'h2'
+                body.append(f'<{tag} id="{anchor}">{title}</{tag}>\n')
+                for name in images_by_chapter.get(n, []):
+                    body.append(f'<p><img src="../Images/{name}" alt="{name}"/></p>\n')
+                body.extend(f'<p>{paragraph}</p>\n' for paragraph in make_paragraphs(rng, chapter_chars, cjk_ratio))
+                src = href if chapters_per_file == 1 else f'{href}#{anchor}'
+                nav_points.append(
+                    f'<navPoint id="nav{n + 1}" playOrder="{n + 1}"><navLabel><text>{title}</text></navLabel>'
+                    f'<content src="{src}"/></navPoint>'
+                )
+            epub.writestr(f'OEBPS/{href}', _xhtml(f'Part {f + 1}', ''.join(body), encoding), compress_type=zipfile.ZIP_DEFLATED)
+            manifest.append(f'<item id="part{f}" href="{href}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="part{f}"/>')
+
+        cover_meta = '<meta name="cover" content="img0"/>' if images else ''
+        toc_attr = ' toc="ncx"' if toc == 'ncx' else ''
+        epub.writestr('OEBPS/content.opf', (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<package xmlns="{OPF_NS}" version="2.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:title>合成测试书 {os.path.basename(path)}</dc:title><dc:creator>Bench</dc:creator>'
+            f'<dc:identifier id="id">bench-{seed}</dc:identifier>{cover_meta}</metadata>'
+            f'<manifest>{"".join(manifest)}</manifest>'
+            f'<spine{toc_attr}>{"".join(spine)}</spine>'
+            '</package>'
+        ), compress_type=zipfile.ZIP_DEFLATED)
+        if toc == 'ncx':
+            epub.writestr('OEBPS/toc.ncx', (
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+                f'<navMap>{"".join(nav_points)}</navMap></ncx>'
+            ), compress_type=zipfile.ZIP_DEFLATED)
+
+    return chapters
+
+def scaled(params, scale):
+    """按 scale 缩放章节数和插图数（单文件书籍保持单文件）"""
+    params = dict(params)
+    single_file = params.get('chapters_per_file', 1) >= params['chapters']
+    params['chapters'] = max(1, int(params['chapters'] * scale))
+    if 'images' in params:
+        params['images'] = max(1, int(params['images'] * scale))
+    if single_file:
+        params['chapters_per_file'] = params['chapters']
+    return params
+
+def generate_corpus(out_dir, profiles=None, scale=1.0, seed=0):
+    """生成预设语料，返回 [(名称, 路径, 章节数)]"""
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = []
+    for name in profiles or PROFILES:
+        path = os.path.join(out_dir, f'{name}.epub')
+        chapters = generate_epub(path, seed=seed, **scaled(PROFILES[name], scale))
+        corpus.append((name, path, chapters))
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic EPUB corpus')
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--profiles', help=f"comma-separated subset of: {','.join(PROFILES)}")
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply chapter and image counts')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(',') if args.profiles else None
+    for name, path, chapters in generate_corpus(args.out, profiles, args.scale, args.seed):
+        print(f"{name:<14} {chapters:>5} chapters  {os.path.getsize(path) / 1024:>9.1f} KB  {path}")
+
+if __name__ == '__main__':
+    main()
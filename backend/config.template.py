@@ -5,23 +5,95 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key'
     
     # 数据库配置
+    DB_BACKEND = os.environ.get('DB_BACKEND') or 'mysql'  # mysql 或 sqlite
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'epub_summarizer.db')
     DB_HOST = os.environ.get('DB_HOST') or 'localhost'
     DB_USER = os.environ.get('DB_USER') or 'your_username'
     DB_PASSWORD = os.environ.get('DB_PASSWORD') or 'your_password'
     DB_NAME = os.environ.get('DB_NAME') or 'your_database'
     
+    # 数据库连接池配置
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # 借用连接的最长等待秒数
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))  # 连接最长存活秒数
+    DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300))  # 空闲连接回收秒数
+    DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', 5))  # 空闲超过该秒数的连接借出前先ping
+    
+    # 书籍和章节元数据的进程内缓存（MODEL_CACHE_SIZE 为 0 时关闭）
+    MODEL_CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE', 4096))
+    MODEL_CACHE_TTL = float(os.environ.get('MODEL_CACHE_TTL', 300))
+    
+    # 阅读进度写后缓冲：按间隔或积累数量批量写入（间隔为 0 时每次立即写入）
+    PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', 5))
+    PROGRESS_FLUSH_MAX_PENDING = int(os.environ.get('PROGRESS_FLUSH_MAX_PENDING', 500))
+    # 单本书的进度连续写入失败该次数后丢弃，不再重试
+    PROGRESS_FLUSH_MAX_RETRIES = int(os.environ.get('PROGRESS_FLUSH_MAX_RETRIES', 3))
+    
     # 文件上传配置
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     COVER_FOLDER = os.path.join(UPLOAD_FOLDER, 'covers')
+    BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')  # 按内容哈希存放渲染后的章节HTML
+    ASSET_FOLDER = os.path.join(UPLOAD_FOLDER, 'assets')  # 按内容哈希存放书籍的图片、CSS和字体
+    SEARCH_INDEX_FOLDER = os.path.join(UPLOAD_FOLDER, 'search')  # 全文检索索引的段文件
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
+    # 上传的EPUB在解析前只读中央目录检查：条目数、解压后总大小、单个条目（1MB以上）的最大压缩率
+    UPLOAD_MAX_ENTRIES = 10000
+    UPLOAD_MAX_UNCOMPRESSED_SIZE = 512 * 1024 * 1024
+    UPLOAD_MAX_COMPRESSION_RATIO = 100
+    
+    # 图片处理：上传时生成封面缩略图、缩小超过阅读器分辨率的书内图片（需要 Pillow）
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', min(4, os.cpu_count() or 1)))  # 进程池大小，0 为在请求进程中处理
+    READER_IMAGE_MAX_SIZE = (1600, 2400)  # 书内图片的最大宽高
+    # 上传时并行渲染章节HTML、提取纯文本的进程数，0 为在请求进程中处理；与 IMAGE_WORKERS 相同时共用一个进程池
+    RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+    INGEST_BATCH_SIZE = 32  # 上传时每次提交到数据库的章节数，渲染好的章节提交后即从内存中释放
+    
+    # 动态响应压缩：超过该字节数的JSON等文本响应即时压缩（静态内容在入库时预压缩）
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
     
     # AI API配置
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY') or 'your-api-key'
     DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL') or 'https://api.example.com/v1/chat/completions'
     DEEPSEEK_MODEL = os.environ.get('DEEPSEEK_MODEL') or 'model-name'
+    AI_CONNECT_TIMEOUT = float(os.environ.get('AI_CONNECT_TIMEOUT', 10))
+    AI_READ_TIMEOUT = float(os.environ.get('AI_READ_TIMEOUT', 180))
+    AI_HTTP_POOL_SIZE = int(os.environ.get('AI_HTTP_POOL_SIZE', 10))  # 每个工作进程到AI接口的keep-alive连接数
+    
+    # AI任务队列：章节的摘要、翻译和图表由 ai_worker.py 的工作进程按优先级生成，Web请求只负责排队
+    AI_WORKER_PROCESSES = int(os.environ.get('AI_WORKER_PROCESSES', 2))
+    AI_WORKER_THREADS = int(os.environ.get('AI_WORKER_THREADS', 8))  # 每个工作进程同时执行的任务数（受 DB_POOL_MAX_SIZE 限制）
+    AI_WORKER_IDLE_INTERVAL = 2  # 队列为空时工作线程两次领取之间的间隔（秒）
+    AI_EMBEDDED_WORKER = False  # 为 True 时开发服务器（run.py）在进程内执行任务，不需要另外启动 ai_worker.py
+    AI_JOB_WAIT = 0  # 接口默认等待任务完成的秒数，0 为立即返回 202 由客户端轮询
+    AI_JOB_MAX_WAIT = 30  # ?wait= 允许的最长等待（秒），等待期间占用一个Web线程
+    AI_JOB_POLL_INTERVAL = 0.5  # 等待任务完成时查询任务状态的间隔（秒）
+    AI_JOB_RETRY_AFTER = 2  # 202 响应建议的轮询间隔（秒）
+    AI_JOB_LEASE = 600  # 任务领取后的租约（秒），需大于AI接口读取超时；工作进程异常退出后过期的任务重新排队
+    AI_JOB_MAX_ATTEMPTS = 3
+    AI_JOB_SWEEP_INTERVAL = 30  # 检查租约过期任务的间隔（秒）
+    
+    # 性能指标：/metrics 输出 Prometheus 格式的接口延迟、数据库查询、EPUB解析和AI调用耗时
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    # 未设置时不提供 /metrics；设置后抓取请求需带 Authorization: Bearer <METRICS_TOKEN>
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_DIR = os.environ.get('METRICS_DIR')  # 多进程部署时各工作进程写入快照的目录，/metrics 合并输出
+    METRICS_FLUSH_INTERVAL = 5  # 工作进程写快照的最短间隔（秒）
+    
+    # 采样分析：请求头 X-Profile 等于 PROFILE_TOKEN 时分析该请求；
+    # PROFILE_SAMPLE_RATE > 0 时按比例随机分析，保存耗时超过 PROFILE_SLOW_THRESHOLD 秒的请求
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_SLOW_THRESHOLD = float(os.environ.get('PROFILE_SLOW_THRESHOLD', 1.0))
+    PROFILE_INTERVAL = 0.005  # 采样间隔（秒）
+    PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER')  # 默认为 UPLOAD_FOLDER/profiles
+    PROFILE_MAX_FILES = 200
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    AI_EMBEDDED_WORKER = True
 
 class ProductionConfig(Config):
     DEBUG = False
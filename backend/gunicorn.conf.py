@@ -0,0 +1,65 @@
+"""gunicorn 生产服务器配置
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+- 预加载应用（preload_app）：应用代码和数据库结构检查只在主进程执行一次，
+  工作进程通过 fork 共享已加载的代码。
+- 数据库连接池、阅读进度写后缓冲和AI接口的HTTP连接池不能跨进程共享，
+  主进程在 fork 前关闭它们，每个工作进程在 post_fork 中重新创建。
+- 默认使用 gthread 工作模式（多进程 × 多线程）；设置 WEB_WORKER_CLASS=gevent 可改用协程模式（需要安装 gevent）。
+  章节的AI生成由 ai_worker.py 在独立进程中执行，Web工作线程只负责排队和查询任务，需要一起启动。
+- 平滑重载：向主进程发送 SIGHUP，新工作进程启动后旧进程处理完当前请求再退出；
+  修改了代码时发送 SIGUSR2 + SIGQUIT 滚动升级主进程。
+
+环境变量：
+    WEB_BIND              监听地址，默认 0.0.0.0:5002
+    WEB_WORKERS           工作进程数，默认 CPU核数 * 2 + 1
+    WEB_THREADS           每个工作进程的线程数（gthread），默认 8
+    WEB_WORKER_CLASS      gthread / sync / gevent，默认 gthread
+    WEB_WORKER_CONNECTIONS gevent 模式下每个进程的最大并发连接数，默认 1000
+    WEB_TIMEOUT           工作进程无响应多少秒后被重启，默认 200（需大于AI接口读取超时）
+    WEB_MAX_REQUESTS      每个工作进程处理多少请求后自动重启，0 为不限制，默认 0
+    WEB_ACCESS_LOG        访问日志文件，默认 -（标准输出），设为空字符串关闭
+    METRICS_DIR           各工作进程的指标快照目录（见 config.py），主进程启动时清空
+"""
+import multiprocessing
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # 必须在加载应用（以及 pymysql、requests）之前打补丁：preload_app 在主进程中导入应用，
+    # 而 post_fork（重建连接池、写后缓冲线程）在 gevent 工作进程自己打补丁之前执行
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5002')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+timeout = int(os.environ.get('WEB_TIMEOUT', 200))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+preload_app = True
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None
+
+def on_starting(server):
+    # 上一次运行留下的快照会被重复累加
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for filename in os.listdir(metrics_dir):
+            if filename.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(metrics_dir, filename))
+
+def pre_fork(server, worker):
+    # 每次 fork 之前都调用；父进程的连接在第一次调用后就已经关闭，重复调用没有副作用
+    from app import prepare_fork
+    prepare_fork(server.app.wsgi())
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker(server.app.wsgi())
@@ -0,0 +1,285 @@
+"""批量导入书库
+
+扫描目录树中的所有 EPUB 文件，在多个进程中并行入库（与上传接口使用同一套入库代码）:
+
+    cd backend
+    python import_library.py /path/to/library
+    python import_library.py /path/to/library --workers 8 --config production
+    python import_library.py /path/to/library --retry-failed     # 重新尝试之前失败的文件
+
+- 每个文件先计算内容哈希，已导入过的书（books.file_hash 相同）和本次扫描中的重复文件直接跳过。
+- 书与书之间并行：每个工作进程一次导入一本书，章节渲染和图片处理在工作进程内完成。
+- 每个文件的结果追加写入检查点文件（JSON Lines，默认在上传目录下），中断后重新执行同一命令
+  即从中断处继续：检查点中大小和修改时间未变的文件不再处理。
+- 单个文件失败只记录错误，不影响其他文件；结束时列出失败的文件，有失败时以退出码 1 结束。
+  某本书导致工作进程异常退出（内存不足、解析时崩溃）时，重建进程池，当时可能在执行的书逐本在
+  单独的进程中重试以找出导致崩溃的文件，其余未完成的书照常继续。
+- 结束时报告导入吞吐量（本/分钟，以及按工作进程数折算的本/分钟/核）。
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from app import create_app
+from app.models.book import Book
+from app.services.ingest_service import file_sha256, import_epub
+from app.services.search_service import get_search_index
+from app.utils.process_pool import default_workers
+
+CHECKPOINT_NAME = 'import-checkpoint.jsonl'
+
+# 工作进程中的应用实例
+_app = None
+
+def _init_worker(config_name):
+    global _app
+    _app = create_app(config_name)
+    # 书与书之间已经并行，每本书的章节和图片在工作进程内处理，不再各自启动进程池
+    _app.config['RENDER_WORKERS'] = 0
+    _app.config['IMAGE_WORKERS'] = 0
+    # 入库时逐章打印的解析结果对批量导入没有意义
+    _app.logger.setLevel(logging.WARNING)
+
+def _hash_file(path):
+    try:
+        return path, file_sha256(path), None
+    except OSError as e:
+        return path, None, str(e)
+
+def _import_file(task):
+    path, file_hash = task
+    start = time.perf_counter()
+    try:
+        with _app.app_context():
+            book = import_epub(path, file_hash)
+        return {'status': 'imported', 'book_id': book['id'], 'chapters': book['chapters'],
+                'seconds': round(time.perf_counter() - start, 3)}
+    except Exception as e:
+        return {'status': 'failed', 'error': f"{type(e).__name__}: {e}",
+                'seconds': round(time.perf_counter() - start, 3)}
+
+def _new_executor(workers, config_name):
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(config_name,))
+
+def _import_isolated(app, task, config_name):
+    """在单独的工作进程中导入一本书，进程异常退出时清理未完成的入库并记为失败"""
+    start = time.perf_counter()
+    with _new_executor(1, config_name) as executor:
+        try:
+            return executor.submit(_import_file, task).result()
+        except BrokenProcessPool:
+            _discard_partial_imports(app, [task])
+            return {'status': 'failed', 'error': 'Import process died (out of memory or crashed)',
+                    'seconds': round(time.perf_counter() - start, 3)}
+
+def _discard_partial_imports(app, tasks):
+    """删除被终止的工作进程留下的未入库完成的书
+
+    这些文件的哈希在本次导入开始时都不在书库中，现有的同哈希书籍只可能是被中断的导入。
+    """
+    with app.app_context():
+        partial = Book.get_ids_by_file_hash(file_hash for _, file_hash in tasks)
+        for book_id in partial.values():
+            book = Book.get_by_id(book_id)
+            if not book:
+                continue
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], book['file_path'])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            Book.delete(book_id)
+            try:
+                get_search_index().remove_book(book_id)
+            except Exception as e:
+                app.logger.error(f"Error removing book {book_id} from search index: {str(e)}")
+
+class Checkpoint:
+    """追加写入的导入记录，每个文件一行 JSON，同一文件以最后一行为准"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下写了一半的最后一行
+                        continue
+                    self.records[record['path']] = record
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def finished(self, path, stat, retry_failed=False):
+        """文件已处理过且之后没有变化时返回之前的记录"""
+        record = self.records.get(path)
+        if not record or record.get('size') != stat.st_size or record.get('mtime') != stat.st_mtime_ns:
+            return None
+        if record['status'] == 'failed' and retry_failed:
+            return None
+        return record
+
+    def write(self, record):
+        self.records[record['path']] = record
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def scan(root):
+    """按路径顺序列出目录树中的所有 .epub 文件"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith('.epub') and not filename.startswith('.'):
+                yield os.path.abspath(os.path.join(dirpath, filename))
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a directory tree of EPUB files into the library')
+    parser.add_argument('library', help='directory to scan for .epub files')
+    parser.add_argument('--workers', type=int, default=default_workers(), help='number of import processes')
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG') or 'default')
+    parser.add_argument('--checkpoint', help=f'checkpoint file (default: UPLOAD_FOLDER/{CHECKPOINT_NAME})')
+    parser.add_argument('--retry-failed', action='store_true', help='retry files that failed in an earlier run')
+    parser.add_argument('--dry-run', action='store_true', help='scan and detect duplicates without importing')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.library):
+        parser.error(f"Not a directory: {args.library}")
+    workers = max(1, args.workers)
+
+    app = create_app(args.config)
+    app.logger.setLevel(logging.WARNING)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(app.config['UPLOAD_FOLDER'], CHECKPOINT_NAME))
+
+    files = list(scan(args.library))
+    pending = []
+    resumed = 0
+    previously_failed = 0
+    for path in files:
+        stat = os.stat(path)
+        previous = checkpoint.finished(path, stat, args.retry_failed)
+        if previous:
+            resumed += 1
+            previously_failed += previous['status'] == 'failed'
+        else:
+            pending.append((path, stat))
+    print(f"Found {len(files)} EPUB files, {resumed} already processed (checkpoint {checkpoint.path}), "
+          f"{len(pending)} to check")
+
+    counts = {'imported': 0, 'duplicate': 0, 'failed': 0}
+    failures = []
+
+    def record(path, stat, status, **fields):
+        counts[status] += 1
+        if status == 'failed':
+            failures.append((path, fields.get('error')))
+        if not args.dry_run:
+            checkpoint.write(dict(path=path, size=stat.st_size, mtime=stat.st_mtime_ns, status=status, **fields))
+
+    executor = _new_executor(workers, args.config)
+    try:
+        # 1. 并行计算内容哈希
+        stats = dict(pending)
+        hashes = {}
+        for path, file_hash, error in executor.map(_hash_file, list(stats), chunksize=8):
+            if error:
+                record(path, stats[path], 'failed', error=error)
+            else:
+                hashes[path] = file_hash
+
+        # 2. 批量查询已导入的哈希，跳过已导入的书和本次扫描中的重复文件
+        with app.app_context():
+            existing = Book.get_ids_by_file_hash(hashes.values())
+        tasks = []
+        first_path = {}
+        for path, file_hash in hashes.items():
+            if file_hash in existing:
+                record(path, stats[path], 'duplicate', sha256=file_hash, book_id=existing[file_hash])
+            elif file_hash in first_path:
+                record(path, stats[path], 'duplicate', sha256=file_hash, duplicate_of=first_path[file_hash])
+            else:
+                first_path[file_hash] = path
+                tasks.append((path, file_hash))
+        print(f"{len(tasks)} new books, {counts['duplicate']} duplicates skipped")
+
+        if args.dry_run:
+            for path, _ in tasks:
+                print(f"would import {path}")
+            return
+
+        # 3. 并行导入
+        start = time.perf_counter()
+        done = 0
+
+        def report(task, result):
+            nonlocal done
+            done += 1
+            path, file_hash = task
+            status = result.pop('status')
+            record(path, stats[path], status, sha256=file_hash, **result)
+            relpath = os.path.relpath(path, args.library)
+            if status == 'imported':
+                print(f"[{done}/{len(tasks)}] imported {relpath} -> book {result['book_id']} "
+                      f"({result['chapters']} chapters, {result['seconds']:.1f}s)")
+            else:
+                print(f"[{done}/{len(tasks)}] FAILED {relpath}: {result['error']}")
+
+        remaining = tasks
+        while remaining:
+            futures = {executor.submit(_import_file, task): task for task in remaining}
+            crashed = set()
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # 某个工作进程异常退出，进程池中所有未完成的任务都以该异常结束
+                    crashed.add(task)
+                    continue
+                except Exception as e:
+                    result = {'status': 'failed', 'error': f"{type(e).__name__}: {e}", 'seconds': 0}
+                report(task, result)
+            if not crashed:
+                break
+
+            # 任务按提交顺序执行，崩溃时正在执行或已派发的只可能是最前面的几个
+            executor.shutdown(cancel_futures=True)
+            remaining = [task for task in remaining if task in crashed]
+            _discard_partial_imports(app, remaining)
+            suspects, remaining = remaining[:workers * 2 + 1], remaining[workers * 2 + 1:]
+            print(f"An import process died; retrying {len(suspects)} books one at a time, "
+                  f"{len(remaining)} books left")
+            for task in suspects:
+                report(task, _import_isolated(app, task, args.config))
+            executor = _new_executor(workers, args.config)
+        elapsed = time.perf_counter() - start
+    finally:
+        executor.shutdown(cancel_futures=True)
+        checkpoint.close()
+
+    print(f"\nImported {counts['imported']}, skipped {counts['duplicate']} duplicates and {resumed} already processed, "
+          f"{counts['failed']} failed")
+    if previously_failed:
+        print(f"{previously_failed} files failed in an earlier run; use --retry-failed to try them again")
+    if counts['imported'] and elapsed > 0:
+        per_minute = counts['imported'] / (elapsed / 60)
+        cores = min(workers, os.cpu_count() or 1)
+        print(f"Throughput: {per_minute:.1f} books/min with {workers} workers, "
+              f"{per_minute / cores:.1f} books/min per core ({elapsed:.1f}s)")
+    if failures:
+        print("\nFailed files:")
+        for path, error in failures:
+            print(f"  {path}: {error}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
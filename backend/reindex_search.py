@@ -0,0 +1,81 @@
+"""维护全文检索索引
+
+为书库中尚未建立索引的书建立索引，然后把所有段合并为一个:
+
+    cd backend
+    python reindex_search.py
+    python reindex_search.py --config production
+    python reindex_search.py --optimize-only     # 只合并段、清除已删除书籍的记录
+    python reindex_search.py --rebuild           # 清空索引后为所有书重新建立
+
+- 全文检索上线之前入库的书不在索引中，部署后执行一次即可检索到；索引中已有的书直接跳过，
+  中断后重新执行同一命令即可继续。
+- 上传时的自动合并只产生较小的段，删除书籍在与其他书共用的段中只留下删除记录；定期执行
+  （如每天一次的 cron）把所有段合并为一个并清除这些记录。服务运行时也可以执行，
+  正在进行的检索继续读取旧的段。
+- --rebuild 清空索引后逐本重建，期间检索结果不完整。
+- 单本书失败只记录错误，不影响其他书；结束时列出失败的书，有失败时以退出码 1 结束。
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from app import create_app
+from app.models.book import Book
+from app.services.ingest_service import reindex_book
+from app.services.search_service import get_search_index
+
+def main():
+    parser = argparse.ArgumentParser(description='Index books missing from the search index and optimize it')
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG') or 'default')
+    parser.add_argument('--rebuild', action='store_true', help='clear the index and reindex every book')
+    parser.add_argument('--optimize-only', action='store_true', help='only merge segments and purge deleted books')
+    args = parser.parse_args()
+    if args.rebuild and args.optimize_only:
+        parser.error('--rebuild and --optimize-only cannot be used together')
+
+    app = create_app(args.config)
+    app.logger.setLevel(logging.WARNING)
+    failures = []
+
+    with app.app_context():
+        index = get_search_index()
+        if not args.optimize_only:
+            if args.rebuild:
+                index.clear()
+            indexed = index.indexed_books()
+            book_ids = [book_id for book_id in Book.get_ids() if book_id not in indexed]
+            print(f"{len(indexed)} books already indexed, {len(book_ids)} to index")
+
+            start = time.perf_counter()
+            chapters = 0
+            for i, book_id in enumerate(book_ids):
+                try:
+                    count = reindex_book(book_id)
+                except Exception as e:
+                    failures.append((book_id, f"{type(e).__name__}: {e}"))
+                    print(f"[{i + 1}/{len(book_ids)}] FAILED book {book_id}: {failures[-1][1]}")
+                    continue
+                chapters += count
+                print(f"[{i + 1}/{len(book_ids)}] indexed book {book_id} ({count} chapters)")
+            if book_ids:
+                print(f"Indexed {len(book_ids) - len(failures)} books, {chapters} chapters "
+                      f"in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        index.optimize()
+        print(f"Optimized the index in {time.perf_counter() - start:.1f}s")
+
+    app.extensions['progress_buffer'].stop()
+    app.extensions['db_pool'].close()
+
+    if failures:
+        print("\nFailed books:")
+        for book_id, error in failures:
+            print(f"  {book_id}: {error}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
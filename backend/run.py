@@ -11,5 +11,9 @@ with app.app_context():
     os.makedirs(temp_dir, exist_ok=True)
 
 if __name__ == '__main__':
+    # 开发时在进程内执行AI任务（自动重载时只在处理请求的子进程中）；生产环境由 ai_worker.py 在独立进程中执行
+    if app.config.get('AI_EMBEDDED_WORKER') and (not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        from app.services.ai_job_service import AIWorker
+        AIWorker(app).start()
     print(f"Starting Flask app on http://localhost:5002")
     app.run(host='0.0.0.0', port=5002)
\ No newline at end of file
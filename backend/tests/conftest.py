@@ -0,0 +1,48 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# 没有复制 config.py 的检出直接使用模板中的默认配置
+try:
+    import config
+except ImportError:
+    spec = importlib.util.spec_from_file_location('config', os.path.join(BACKEND_DIR, 'config.template.py'))
+    config = importlib.util.module_from_spec(spec)
+    sys.modules['config'] = config
+    spec.loader.exec_module(config)
+
+def make_config(tmp_path, **overrides):
+    """使用临时 SQLite 数据库和上传目录的测试配置"""
+    upload_folder = str(tmp_path / 'uploads')
+    settings = dict(
+        TESTING=True,
+        DB_BACKEND='sqlite',
+        SQLITE_PATH=str(tmp_path / 'test.db'),
+        UPLOAD_FOLDER=upload_folder,
+        COVER_FOLDER=os.path.join(upload_folder, 'covers'),
+        BLOB_FOLDER=os.path.join(upload_folder, 'blobs'),
+        ASSET_FOLDER=os.path.join(upload_folder, 'assets'),
+        SEARCH_INDEX_FOLDER=os.path.join(upload_folder, 'search'),
+        RENDER_WORKERS=0,
+        IMAGE_WORKERS=0,
+        AI_EMBEDDED_WORKER=False,
+        METRICS_DIR=None,
+    )
+    settings.update(overrides)
+    name = f'testing-{tmp_path.name}'
+    config.config[name] = type('TestingConfig', (config.config['default'],), settings)
+    return name
+
+@pytest.fixture
+def app(tmp_path):
+    from app import create_app
+
+    app = create_app(make_config(tmp_path))
+    yield app
+    app.extensions['progress_buffer'].stop()
+    app.extensions['db_pool'].close()
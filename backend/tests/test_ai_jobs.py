@@ -0,0 +1,69 @@
+import pytest
+import requests
+
+from app.models.ai_job import AIJob
+from app.models.book import Book, Chapter
+from app.services.ai_job_service import AIWorker
+
+TEXT = '这是一段用于测试的章节正文。' * 20
+
+class FailingSession:
+    """模拟AI接口不可用"""
+
+    def __init__(self, error=None, status_code=None):
+        self.error = error
+        self.status_code = status_code
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        response = requests.Response()
+        response.status_code = self.status_code
+        return response
+
+def create_chapter():
+    book_id = Book.create('Test Book', 'Tester', None, 'test.epub')
+    return Chapter.create_many(book_id, [{
+        'title': 'Chapter 1',
+        'href': 'Text/chapter1.xhtml',
+        'html_hash': '0' * 64,
+        'plain_text': TEXT,
+        'char_count': len(TEXT),
+        'token_count': len(TEXT) // 2,
+        'content_hash': '1' * 64
+    }])[0]
+
+@pytest.mark.parametrize('failure', [
+    {'error': requests.ConnectionError('connection refused')},
+    {'status_code': 503}
+], ids=['connection-error', 'http-503'])
+@pytest.mark.parametrize('operation, field', [
+    ('summary', 'summary'),
+    ('translation', 'translation'),
+    ('diagram', 'mermaid_diagram')
+])
+def test_failed_ai_call_is_retried_then_marked_failed(app, failure, operation, field):
+    session = FailingSession(**failure)
+    app.extensions['http_session'] = session
+    worker = AIWorker(app, 1)
+
+    with app.app_context():
+        chapter_id = create_chapter()
+        job = AIJob.enqueue(chapter_id, operation, 100)
+
+        # 第一次失败后重新排队
+        worker._execute(AIJob.claim('test-worker', 60), 'test-worker', 2)
+        job = AIJob.get_by_id(job['id'])
+        assert job['status'] == 'pending'
+        assert job['error']
+
+        # 尝试次数用完后标记为失败
+        worker._execute(AIJob.claim('test-worker', 60), 'test-worker', 2)
+        job = AIJob.get_by_id(job['id'])
+        assert job['status'] == 'failed'
+        assert session.calls == 2
+
+        # 错误信息不能被当作生成结果保存
+        assert Chapter.get_artifact(chapter_id, field, with_text=False)[field] is None
@@ -0,0 +1,107 @@
+import sqlite3
+
+from app.models import get_db
+from app.models.book import Book, Chapter
+from app.models.migrations import LATEST_VERSION
+from conftest import make_config
+
+# 引入版本化迁移之前启动时创建的表结构（SQLite 写法）
+BASELINE_SCHEMA = '''
+CREATE TABLE books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(255) NOT NULL,
+    author VARCHAR(255),
+    cover_path VARCHAR(255),
+    file_path VARCHAR(255) NOT NULL,
+    last_read DATETIME DEFAULT CURRENT_TIMESTAMP,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE chapters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    title VARCHAR(255) NOT NULL,
+    href VARCHAR(255) NOT NULL,
+    order_num INTEGER NOT NULL,
+    summary TEXT,
+    translation TEXT,
+    mermaid_diagram TEXT,
+    html_content TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE bookmarks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    cfi VARCHAR(255) NOT NULL,
+    text VARCHAR(255),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO books (title, author, file_path) VALUES ('Old Book', 'Author', 'old.epub');
+INSERT INTO chapters (book_id, title, href, order_num, summary) VALUES (1, 'Old Chapter', 'ch1.xhtml', 0, 'old summary');
+INSERT INTO bookmarks (book_id, chapter_id, cfi, text) VALUES (1, 1, 'epubcfi(/6/2)', 'mark');
+'''
+
+def columns(db, table):
+    cursor = db.cursor()
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {row['name'] for row in cursor.fetchall()}
+
+def create_app_for(tmp_path):
+    from app import create_app
+    return create_app(make_config(tmp_path))
+
+def close_app(app):
+    app.extensions['progress_buffer'].stop()
+    app.extensions['db_pool'].close()
+
+def test_upgrade_baseline_database(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+    app = create_app_for(tmp_path)
+    try:
+        with app.app_context():
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+            assert cursor.fetchone()['version'] == LATEST_VERSION
+            assert {'plain_text', 'char_count', 'token_count', 'content_hash', 'html_hash'} <= columns(db, 'chapters')
+
+            # 升级保留已有数据
+            book = Book.get_by_id(1)
+            assert book['title'] == 'Old Book'
+            assert Chapter.get_artifact(1, 'summary', with_text=False)['summary'] == 'old summary'
+
+            book_id = Book.create('New Book', 'Author', None, 'new.epub')
+            Chapter.create_many(book_id, [{
+                'title': 'Chapter 1',
+                'href': 'ch1.xhtml',
+                'html_hash': '0' * 64,
+                'plain_text': 'text',
+                'char_count': 4,
+                'token_count': 2,
+                'content_hash': '1' * 64
+            }])
+    finally:
+        close_app(app)
+
+def test_upgraded_schema_matches_new_install(tmp_path):
+    upgraded_dir = tmp_path / 'upgraded'
+    fresh_dir = tmp_path / 'fresh'
+    upgraded_dir.mkdir()
+    fresh_dir.mkdir()
+    conn = sqlite3.connect(upgraded_dir / 'test.db')
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+    schemas = []
+    for path in (upgraded_dir, fresh_dir):
+        app = create_app_for(path)
+        try:
+            with app.app_context():
+                db = get_db()
+                schemas.append({table: columns(db, table) for table in ('books', 'chapters', 'bookmarks')})
+        finally:
+            close_app(app)
+    assert schemas[0] == schemas[1]
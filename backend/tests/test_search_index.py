@@ -0,0 +1,46 @@
+from app.models.book import Book, Chapter
+from app.services.ingest_service import reindex_book
+from app.services.search_service import get_search_index
+
+def create_book(title, texts):
+    book_id = Book.create(title, 'Tester', None, f'{title}.epub')
+    Chapter.create_many(book_id, [{
+        'title': f'Chapter {i + 1}',
+        'href': f'Text/chapter{i + 1}.xhtml',
+        'html_hash': '0' * 64,
+        'plain_text': text,
+        'char_count': len(text),
+        'token_count': len(text) // 2,
+        'content_hash': None
+    } for i, text in enumerate(texts)])
+    return book_id
+
+def test_reindex_books_missing_from_index(app):
+    with app.app_context():
+        # 直接写入数据库、没有经过入库流程的书不在索引中
+        first = create_book('first', ['the quick brown fox', '全文检索的测试章节'])
+        second = create_book('second', ['a lazy dog sleeps'])
+        index = get_search_index()
+        assert index.indexed_books() == set()
+        assert index.search('fox') == []
+
+        assert reindex_book(first) == 2
+        assert reindex_book(second) == 1
+        assert index.indexed_books() == {first, second}
+        assert [hit[1] for hit in index.search('fox')] == [first]
+        assert [hit[1] for hit in index.search('检索')] == [first]
+
+def test_optimize_purges_deleted_books(app):
+    with app.app_context():
+        index = get_search_index()
+        book_ids = [create_book(f'book{i}', [f'shared words unique{i}']) for i in range(3)]
+        for book_id in book_ids:
+            reindex_book(book_id)
+
+        index.remove_book(book_ids[0])
+        index.optimize()
+        manifest = index._read_manifest()
+        assert len(manifest['segments']) == 1
+        assert manifest['deleted_books'] == []
+        assert index.indexed_books() == set(book_ids[1:])
+        assert index.search('unique0') == []
@@ -0,0 +1,20 @@
+"""生产环境的 WSGI 入口
+
+开发时仍然使用 run.py（Flask 自带的单进程开发服务器）；生产环境通过 gunicorn 启动多进程服务:
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+配置见 gunicorn.conf.py，可以通过环境变量调整进程数、线程数和工作模式。
+"""
+from app import create_app
+import os
+
+app = create_app(os.environ.get('FLASK_CONFIG') or 'production')
+
+# 确保上传文件夹存在
+with app.app_context():
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['COVER_FOLDER'], exist_ok=True)
+    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
@@ -2,10 +2,20 @@ import axios from 'axios'
 
 const API_URL = 'http://localhost:5002/api'
 
+// AI生成在后台任务队列中执行：接口返回 202 时按 Retry-After 轮询任务状态，直到生成完成（200）或失败（错误响应）
+function waitForAiJob(response) {
+  if (response.status !== 202) return response
+  const delay = (parseFloat(response.headers['retry-after']) || 2) * 1000
+  return new Promise(resolve => setTimeout(resolve, delay))
+    .then(() => axios.get(`${API_URL}/ai/jobs/${response.data.job.id}`))
+    .then(waitForAiJob)
+}
+
 const apiService = {
   // 书籍相关API
-  getBooks() {
-    return axios.get(`${API_URL}/books/`)
+  // 分页读取书架，params: { limit, cursor, sort, fields }；不传 limit 和 cursor 时返回全部书籍的数组
+  getBooks(params = {}) {
+    return axios.get(`${API_URL}/books/`, { params })
   },
   
   getBook(bookId) {
@@ -36,8 +46,9 @@ const apiService = {
   },
   
   // 书签相关API
-  getBookmarks(bookId) {
-    return axios.get(`${API_URL}/books/${bookId}/bookmarks`)
+  // 分页读取书签，params: { limit, cursor, fields }；不传 limit 和 cursor 时返回全部书签的数组
+  getBookmarks(bookId, params = {}) {
+    return axios.get(`${API_URL}/books/${bookId}/bookmarks`, { params })
   },
   
   createBookmark(bookId, chapterId, cfi, text) {
@@ -54,7 +65,7 @@ const apiService = {
   
   // AI总结相关API
   summarizeChapter(chapterId) {
-    return axios.get(`${API_URL}/ai/summarize/chapter/${chapterId}`)
+    return axios.get(`${API_URL}/ai/summarize/chapter/${chapterId}`).then(waitForAiJob)
   },
   
   summarizeText(text) {
@@ -63,9 +74,9 @@ const apiService = {
     })
   },
   
-  // 添加更新最后阅读时间的方法
-  updateLastRead(bookId) {
-    return axios.put(`${API_URL}/books/${bookId}/last-read`)
+  // 添加更新最后阅读时间的方法，可同时记录当前阅读的章节
+  updateLastRead(bookId, chapterId) {
+    return axios.put(`${API_URL}/books/${bookId}/last-read`, chapterId ? { chapter_id: chapterId } : {})
       .catch(error => {
         console.error('Error updating last read:', error);
         throw error;
@@ -86,9 +97,10 @@ const apiService = {
     });
   },
   
-  // 获取章节内容
-  getChapterContent(bookId, chapterId) {
+  // 获取章节内容，version 为章节的 html_hash，带上后响应可以被浏览器永久缓存
+  getChapterContent(bookId, chapterId, version) {
     return axios.get(`${API_URL}/books/${bookId}/chapters/${chapterId}/content`, {
+      params: version ? { v: version } : {},
       responseType: 'text'
     }).catch(error => {
       console.error('Error fetching chapter content:', error);
@@ -96,14 +108,19 @@ const apiService = {
     });
   },
   
+  // 一次获取多个章节的内容，params: { ids: '1,2,3' } 或 { start, count }，以及 format、max_bytes
+  getChapterBundle(bookId, params) {
+    return axios.get(`${API_URL}/books/${bookId}/chapters/bundle`, { params })
+  },
+  
   // 获取章节翻译
   translateChapter(chapterId) {
-    return axios.get(`${API_URL}/ai/translate/chapter/${chapterId}`)
+    return axios.get(`${API_URL}/ai/translate/chapter/${chapterId}`).then(waitForAiJob)
   },
   
   // 获取章节图表
   getChapterDiagram(chapterId) {
-    return axios.get(`${API_URL}/ai/diagram/chapter/${chapterId}`)
+    return axios.get(`${API_URL}/ai/diagram/chapter/${chapterId}`).then(waitForAiJob)
   }
 }
 